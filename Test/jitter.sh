@@ -1,2 +1,3 @@
-
-cat out.tr | grep " 2 3 cbr " | grep ^r | column 1 10 | awk '{dif = $2 - old2; if(dif==0) dif = 1; if(dif > 0) {printf("%d\t%f\n", $2, ($1 - old1) / dif); old1 = $1; old2 = $2}}' > jitter.txt
+# 每条流和每条链路的RFC 3550抖动, 一次读取trace (见 ../jitter.py)
+# --type all: 与原来的awk管道一样统计cbr包; 原来只看链路 2-3, 现在结果中的 "link 2-3" 行对应它
+python3 "$(dirname "$0")/../jitter.py" out.tr --type all -o jitter.csv
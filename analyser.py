@@ -1,172 +1,289 @@
+from concurrent.futures import ProcessPoolExecutor
+
 import matplotlib.pyplot as plt
-from math import ceil
-import os
+import numpy as np
+
+import plotting
+import sim_runner
+import trace_io
+import trace_layout
+import trace_mmap
+from bucket_series import BucketSeries
+
+# 时间桶宽度 (秒), 设为0.1或0.01可以得到亚秒级的时间分辨率
+BUCKET_WIDTH = 1.0
 
-cwndDict04 = {"reno": [0] * 1001, "cubic": [0] * 1001, "yeah": [0] * 1001, "vegas": [0] * 1001}
-cwndDict15 = {"reno": [0] * 1001, "cubic": [0] * 1001, "yeah": [0] * 1001, "vegas": [0] * 1001}
-goodputDict04 = {"reno": [0] * 1001, "cubic": [0] * 1001, "yeah": [0] * 1001, "vegas": [0] * 1001}
-goodputDict15 = {"reno": [0] * 1001, "cubic": [0] * 1001, "yeah": [0] * 1001, "vegas": [0] * 1001}
-rttDict04 = {"reno": [0] * 1001, "cubic": [0] * 1001, "yeah": [0] * 1001, "vegas": [0] * 1001}
-rttDict15 = {"reno": [0] * 1001, "cubic": [0] * 1001, "yeah": [0] * 1001, "vegas": [0] * 1001}
-lossDict04 = {"reno": [0] * 1001, "cubic": [0] * 1001, "yeah": [0] * 1001, "vegas": [0] * 1001}
-lossDict15 = {"reno": [0] * 1001, "cubic": [0] * 1001, "yeah": [0] * 1001, "vegas": [0] * 1001}
+# 绘制goodput速率时的滑动窗口长度 (秒), 不小于一个桶
+GOODPUT_WINDOW = 1.0
+
+# 每个变体的时间序列, 长度随trace的时长增长
+cwndDict04 = {"reno": [], "cubic": [], "yeah": [], "vegas": []}
+cwndDict15 = {"reno": [], "cubic": [], "yeah": [], "vegas": []}
+goodputDict04 = {"reno": [], "cubic": [], "yeah": [], "vegas": []}
+goodputDict15 = {"reno": [], "cubic": [], "yeah": [], "vegas": []}
+rttDict04 = {"reno": [], "cubic": [], "yeah": [], "vegas": []}
+rttDict15 = {"reno": [], "cubic": [], "yeah": [], "vegas": []}
+lossDict04 = {"reno": [], "cubic": [], "yeah": [], "vegas": []}
+lossDict15 = {"reno": [], "cubic": [], "yeah": [], "vegas": []}
 
 
 def splitFile(filename):
 	lines = []
-	file = open(filename, 'r')
+	file = trace_io.open_trace(filename, 'r')
 	line = file.readline()
 	while line:
 		lines.append(line.split())
 		line = file.readline()
 	return lines
 
+def mapFile(filename):
+	"""
+	以内存映射方式打开trace文件, 可以代替 splitFile 的结果传给 split* 函数
+
+	不把整个文件读成行列表, 几GB的trace也只占用与块大小成正比的内存。
+	压缩的trace不能映射, 请使用 splitFile。用完后调用 close() (或使用with)。
+	"""
+	return trace_mmap.MappedTrace(filename)
+
+def leadingDigit(values):
+	"""整数的首位数字 (即地址字符串的首字符), 负数为-1"""
+	digits = np.where(values < 0, -1, values)
+	while (digits >= 10).any():
+		digits = np.where(digits >= 10, digits // 10, digits)
+	return digits
+
 def adjustArray(arr, defaultVal):
 	for i in range(len(arr)):
 		if arr[i] == defaultVal:
 			arr[i] = arr[i-1] if i != 0 else 0
 	return arr
 
-def splitCWND(data):
-	cwnds04 = [-1] * 1001
-	cwnds15 = [-1] * 1001
-	for line in data:
+class TraceMetrics:
+	"""cwnd/ack/rtt/loss 时间序列的累加器, 一次遍历trace即可得到全部指标"""
+
+	def __init__(self, bucketWidth=BUCKET_WIDTH):
+		# 与原来的 ceil(time) 下标一致: 时间t落在第 ceil(t / 桶宽) 个桶
+		self.cwnds04 = BucketSeries(bucketWidth, dtype=float, rounding='ceil')
+		self.cwnds15 = BucketSeries(bucketWidth, dtype=float, rounding='ceil')
+		self.acks04 = BucketSeries(bucketWidth, dtype=int, rounding='ceil')
+		self.acks15 = BucketSeries(bucketWidth, dtype=int, rounding='ceil')
+		self.rtts04 = BucketSeries(bucketWidth, dtype=float, rounding='ceil')
+		self.rtts15 = BucketSeries(bucketWidth, dtype=float, rounding='ceil')
+		self.loss04 = BucketSeries(bucketWidth, dtype=int, rounding='ceil')
+		self.loss15 = BucketSeries(bucketWidth, dtype=int, rounding='ceil')
+		self.lastloss04 = 0
+		self.lastloss15 = 0
+
+	def feedCwnd(self, line):
 		if 'cwnd_' in line:
-			indexes = [0,6]
-			if line[1] == '0':
-				cwnds04[ceil(float(line[0]))] = float(line[6])
-			else:
-				cwnds15[ceil(float(line[0]))] = float(line[6])
-	cwnds04 = adjustArray(cwnds04, -1)
-	cwnds15 = adjustArray(cwnds15, -1)
-
-	return cwnds04, cwnds15
+			series = self.cwnds04 if line[1] == '0' else self.cwnds15
+			series.assign_index(series.bucket_of(float(line[0])), float(line[6]))
 
-def splitAcks(data):
-	acks04 = ['none'] * 1001
-	acks15 = ['none'] * 1001
-	for line in data:
+	def feedAck(self, line):
 		if 'ack_' in line:
-			if line[1] == '0':
-				acks04[ceil(float(line[0]))] = int(line[-1])
-			else:
-				acks15[ceil(float(line[0]))] = int(line[-1])
-	return adjustArray(acks04, 'none'), adjustArray(acks15, 'none')
+			series = self.acks04 if line[1] == '0' else self.acks15
+			series.assign_index(series.bucket_of(float(line[0])), int(line[-1]))
 
-def splitloss(data):
-	loss04 = [-1] * 1001
-	lastloss04 = 0
-	loss15 = [-1] * 1001
-	lastloss15 = 0
-	for line in data:
+	def feedRtt(self, line):
+		if 'rtt_' in line:
+			series = self.rtts04 if line[1] == '0' else self.rtts15
+			series.assign_index(series.bucket_of(float(line[0])), float(line[-1]))
+
+	def feedLoss(self, line):
 		if line[0] == 'd':
 			if line[-4][0] == '0':
-				lastloss04 += 1
-				loss04[ceil(float(line[1]))] = lastloss04
+				self.lastloss04 += 1
+				self.loss04.assign_index(self.loss04.bucket_of(float(line[1])), self.lastloss04)
 			elif line[-4][0] == '1':
-				lastloss15 += 1
-				loss15[ceil(float(line[1]))] = lastloss15
-	return adjustArray(loss04, -1), adjustArray(loss15, -1)
+				self.lastloss15 += 1
+				self.loss15.assign_index(self.loss15.bucket_of(float(line[1])), self.lastloss15)
 
-def splitRtt(data):
-	rtt04 = [-1] * 1001
-	rtt15 = [-1] * 1001
-	for line in data:
-		if 'rtt_' in line:
-			if line[1] == '0':
-				rtt04[ceil(float(line[0]))] = float(line[-1])
+	def feed(self, line):
+		"""把一行分发给对应的累加器"""
+		if line[0] == 'd':
+			self.feedLoss(line)
+		elif 'cwnd_' in line:
+			self.feedCwnd(line)
+		elif 'ack_' in line:
+			self.feedAck(line)
+		elif 'rtt_' in line:
+			self.feedRtt(line)
+
+	def feedColumns(self, packets, tracevars):
+		"""
+		向量化地累加一块 trace_mmap 列, 结果与逐行 feed 这些行一致
+
+		参数:
+			packets: 包事件列字典
+			tracevars: tracevar列字典
+		"""
+		fromZero = tracevars['src'] == 0
+		for var, dtype, series04, series15 in (
+				(b'cwnd_', float, self.cwnds04, self.cwnds15),
+				(b'ack_', int, self.acks04, self.acks15),
+				(b'rtt_', float, self.rtts04, self.rtts15)):
+			rows = tracevars['var'] == var
+			times = tracevars['time'][rows]
+			values = tracevars['value'][rows].astype(dtype)
+			zero = fromZero[rows]
+			series04.assign(times[zero], values[zero])
+			series15.assign(times[~zero], values[~zero])
+
+		drops = packets['event'] == b'd'
+		times = packets['time'][drops]
+		digit = leadingDigit(packets['src'][drops])
+		for flowDigit, series, counter in ((0, self.loss04, 'lastloss04'), (1, self.loss15, 'lastloss15')):
+			hit = digit == flowDigit
+			last = getattr(self, counter)
+			# 每次丢包后的累计丢包数
+			series.assign(times[hit], last + np.arange(1, hit.sum() + 1))
+			setattr(self, counter, last + int(hit.sum()))
+
+	def feedTrace(self, trace):
+		"""累加一个 trace_mmap.MappedTrace 中的全部行"""
+		for packets, tracevars in trace.iter_blocks():
+			self.feedColumns(packets, tracevars)
+
+	def merge(self, other):
+		"""
+		合并文件中紧随其后一段的统计结果, 与按顺序 feed 两段的结果一致:
+		采样值以后一段为准, 累计丢包数加上前一段的总数
+		"""
+		for name in ('cwnds04', 'cwnds15', 'acks04', 'acks15', 'rtts04', 'rtts15'):
+			getattr(self, name).overlay(getattr(other, name))
+		self.loss04.overlay(other.loss04, self.lastloss04)
+		self.loss15.overlay(other.loss15, self.lastloss15)
+		self.lastloss04 += other.lastloss04
+		self.lastloss15 += other.lastloss15
+
+	def length(self):
+		"""所有序列中最长的桶数"""
+		return max(series.length for series in (self.cwnds04, self.cwnds15, self.acks04, self.acks15,
+			self.rtts04, self.rtts15, self.loss04, self.loss15))
+
+	# 以下方法返回补齐后的 (04, 15) 列表, length 指定输出长度 (默认为各自的长度)
+
+	def cwnd(self, length=None):
+		return self.cwnds04.forward_filled(0, length).tolist(), self.cwnds15.forward_filled(0, length).tolist()
+
+	def acks(self, length=None):
+		return self.acks04.forward_filled(0, length).tolist(), self.acks15.forward_filled(0, length).tolist()
+
+	def rtt(self, length=None):
+		return self.rtts04.forward_filled(0, length).tolist(), self.rtts15.forward_filled(0, length).tolist()
+
+	def loss(self, length=None):
+		return self.loss04.forward_filled(0, length).tolist(), self.loss15.forward_filled(0, length).tolist()
+
+def extractChunk(path, start, end):
+	"""统计trace文件 [start, end) 字节范围内的行 (进程池任务)"""
+	metrics = TraceMetrics()
+	with trace_mmap.MappedTrace(path) as trace:
+		for packets, tracevars in trace.iter_blocks(start, end):
+			metrics.feedColumns(packets, tracevars)
+	return metrics
+
+def extractMetrics(filename, workers=None):
+	"""
+	流式读取trace文件, 一次遍历得到全部指标, 不在内存中保存整个文件
+
+	精简模式的trace把tracevar行写在单独的文件中, 两个文件都会读取。
+	未压缩的文件以内存映射方式向量化解析, workers大于1时按行切成workers段
+	在进程池中并行统计后合并; 压缩的文件逐行解析
+	"""
+	metrics = TraceMetrics()
+	for path in trace_layout.metric_files_for(filename):
+		if not trace_io.is_compressed(path):
+			ranges = trace_mmap.split_ranges(path, workers or 1)
+			if len(ranges) > 1:
+				with ProcessPoolExecutor(max_workers=workers) as pool:
+					for part in [pool.submit(extractChunk, path, start, end) for start, end in ranges]:
+						metrics.merge(part.result())
 			else:
-				rtt15[ceil(float(line[0]))] = float(line[-1])
-	return adjustArray(rtt04, -1), adjustArray(rtt15, -1)
+				for start, end in ranges:
+					metrics.merge(extractChunk(path, start, end))
+			continue
+		with trace_io.open_trace(path, 'r') as file:
+			for line in file:
+				parts = line.split()
+				if parts:
+					metrics.feed(parts)
+	return metrics
+
+def splitMetrics(data, feed):
+	"""
+	data 为 splitFile 的行列表时逐行调用feed;
+	为 mapFile 的 MappedTrace 时向量化地累加全部指标
+	"""
+	metrics = TraceMetrics()
+	if isinstance(data, trace_mmap.MappedTrace):
+		metrics.feedTrace(data)
+		return metrics
+	for line in data:
+		feed(metrics, line)
+	return metrics
+
+def splitCWND(data):
+	return splitMetrics(data, TraceMetrics.feedCwnd).cwnd()
+
+def splitAcks(data):
+	return splitMetrics(data, TraceMetrics.feedAck).acks()
+
+def splitloss(data):
+	return splitMetrics(data, TraceMetrics.feedLoss).loss()
+
+def splitRtt(data):
+	return splitMetrics(data, TraceMetrics.feedRtt).rtt()
+
+def addSeries(dict04, dict15, series):
+	"""把每个变体的 (04, 15) 数组累加到全局字典, 全局数组不够长时补0"""
+	for key, (arr04, arr15) in series.items():
+		for target, arr in ((dict04[key], arr04), (dict15[key], arr15)):
+			if len(target) < len(arr):
+				target.extend([0] * (len(arr) - len(target)))
+			for i in range(len(arr)):
+				target[i] += arr[i]
+
+def addMetricDatas(metrics):
+	"""metrics: 变体名 -> TraceMetrics"""
+	# 所有变体补齐到同一长度, 末尾沿用最后一个值
+	length = max(m.length() for m in metrics.values())
+	addSeries(cwndDict04, cwndDict15, {key: m.cwnd(length) for key, m in metrics.items()})
+	addSeries(goodputDict04, goodputDict15, {key: m.acks(length) for key, m in metrics.items()})
+	addSeries(rttDict04, rttDict15, {key: m.rtt(length) for key, m in metrics.items()})
+	addSeries(lossDict04, lossDict15, {key: m.loss(length) for key, m in metrics.items()})
 
 def addCwndDatas(renoData, cubicData, yeahData,vegasData):
-	global cwndDict04, cwndDict15
-	renoCwnds04, renoCwnds15 = splitCWND(renoData)
-	cubicCwnds04, cubicCwnds15 = splitCWND(cubicData)
-	yeahCwnds04, yeahCwnds15 = splitCWND(yeahData)
-	vegasCwnds04, vegasCwnds15 = splitCWND(vegasData)
-
-	for i in range(1001):
-		cwndDict04['reno'][i] += renoCwnds04[i]
-		cwndDict04['cubic'][i] += cubicCwnds04[i]
-		cwndDict04['yeah'][i] += yeahCwnds04[i]
-		cwndDict04['vegas'][i] += vegasCwnds04[i]
-		cwndDict15['reno'][i] += renoCwnds15[i]
-		cwndDict15['cubic'][i] += cubicCwnds15[i]
-		cwndDict15['yeah'][i] += yeahCwnds15[i]
-		cwndDict15['vegas'][i] += vegasCwnds15[i]
+	addSeries(cwndDict04, cwndDict15, {'reno': splitCWND(renoData), 'cubic': splitCWND(cubicData),
+		'yeah': splitCWND(yeahData), 'vegas': splitCWND(vegasData)})
 
 def addGoodputDatas(renoData, cubicData, yeahData,vegasData):
-	global goodputDict04, goodputDict15
-	renoGoodputs04, renoGoodputs15 = splitAcks(renoData)
-	cubicGoodputs04, cubicGoodputs15 = splitAcks(cubicData)
-	yeahGoodputs04, yeahGoodputs15 = splitAcks(yeahData)
-	vegasGoodputs04, vegasGoodputs15 = splitAcks(vegasData)
-
-	for i in range(1001):
-		goodputDict04['reno'][i] += renoGoodputs04[i]
-		goodputDict04['cubic'][i] += cubicGoodputs04[i]
-		goodputDict04['yeah'][i] += yeahGoodputs04[i]
-		goodputDict04['vegas'][i] += vegasGoodputs04[i]
-		goodputDict15['reno'][i] += renoGoodputs15[i]
-		goodputDict15['cubic'][i] += cubicGoodputs15[i]
-		goodputDict15['yeah'][i] += yeahGoodputs15[i]
-		goodputDict15['vegas'][i] += vegasGoodputs15[i]
+	addSeries(goodputDict04, goodputDict15, {'reno': splitAcks(renoData), 'cubic': splitAcks(cubicData),
+		'yeah': splitAcks(yeahData), 'vegas': splitAcks(vegasData)})
 
 def addRttDatas(renoData, cubicData, yeahData,vegasData):
-	global rttDict04, rttDict15
-	renoRtts04, renoRtts15 = splitRtt(renoData)
-	cubicRtts04, cubicRtts15 = splitRtt(cubicData)
-	yeahRtts04, yeahRtts15 = splitRtt(yeahData)
-	vegasRtts04, vegasRtts15 = splitRtt(vegasData)
-
-	for i in range(1001):
-		rttDict04['reno'][i] += renoRtts04[i]
-		rttDict04['cubic'][i] += cubicRtts04[i]
-		rttDict04['yeah'][i] += yeahRtts04[i]
-		rttDict04['vegas'][i] += vegasRtts04[i]
-		rttDict15['reno'][i] += renoRtts15[i]
-		rttDict15['cubic'][i] += cubicRtts15[i]
-		rttDict15['yeah'][i] += yeahRtts15[i]
-		rttDict15['vegas'][i] += vegasRtts15[i]
+	addSeries(rttDict04, rttDict15, {'reno': splitRtt(renoData), 'cubic': splitRtt(cubicData),
+		'yeah': splitRtt(yeahData), 'vegas': splitRtt(vegasData)})
 
 def addlossDatas(renoData, cubicData, yeahData,vegasData):
-	global lossDict04, lossDict15
-	renoloss04, renoloss15 = splitloss(renoData)
-	cubicloss04, cubicloss15 = splitloss(cubicData)
-	yeahloss04, yeahloss15 = splitloss(yeahData)
-	vegasloss04, vegasloss15 = splitloss(vegasData)
-
-	for i in range(1001):
-		lossDict04['reno'][i] += renoloss04[i]
-		lossDict04['cubic'][i] += cubicloss04[i]
-		lossDict04['yeah'][i] += yeahloss04[i]
-		lossDict04['vegas'][i] += vegasloss04[i]
-		lossDict15['reno'][i] += renoloss15[i]
-		lossDict15['cubic'][i] += cubicloss15[i]
-		lossDict15['yeah'][i] += yeahloss15[i]
-		lossDict15['vegas'][i] += vegasloss15[i]
+	addSeries(lossDict04, lossDict15, {'reno': splitloss(renoData), 'cubic': splitloss(cubicData),
+		'yeah': splitloss(yeahData), 'vegas': splitloss(vegasData)})
 
 def runOneEpoch():
-	os.system("ns renoCode.tcl")
-	os.system("ns cubicCode.tcl")
-	os.system("ns yeahCode.tcl")
-	os.system("ns vegasCode.tcl")
-
-	renoData = splitFile('renoTrace.tr')
-	cubicData = splitFile('cubicTrace.tr')
-	yeahData = splitFile('yeahTrace.tr')
-	vegasData = splitFile('vegasTrace.tr')
+	sim_runner.run_jobs(sim_runner.jobs_from_files(
+		['renoCode.tcl', 'cubicCode.tcl', 'yeahCode.tcl', 'vegasCode.tcl']))
 
-	addCwndDatas(renoData, cubicData, yeahData, vegasData)
-	addGoodputDatas(renoData, cubicData, yeahData, vegasData)
-	addRttDatas(renoData, cubicData, yeahData, vegasData)
-	addlossDatas(renoData, cubicData, yeahData, vegasData)
+	addMetricDatas({
+		'reno': extractMetrics('renoTrace.tr'),
+		'cubic': extractMetrics('cubicTrace.tr'),
+		'yeah': extractMetrics('yeahTrace.tr'),
+		'vegas': extractMetrics('vegasTrace.tr'),
+	})
 
 def calcAvgVars():
 	global cwndDict04, cwndDict15, goodputDict04, goodputDict15
 	for key in cwndDict04.keys():
-		for i in range(1001):
+		for i in range(len(cwndDict04[key])):
 			cwndDict04[key][i] /= 10
 			cwndDict15[key][i] /= 10
 			goodputDict04[key][i] /= 10
@@ -180,12 +297,22 @@ def run():
 	runOneEpoch()
 
 
-def derivative(arr):
-	arr2 = [0] * len(arr)
-	for i in range(1,len(arr)):
-		arr2[i] = arr[i] / i 
-	arr2[0] = arr[0]
-	return arr2
+def bucketTimes(arr):
+	"""每个桶对应的时间 (秒)"""
+	return [i * BUCKET_WIDTH for i in range(len(arr))]
+
+def windowRate(arr, window=GOODPUT_WINDOW):
+	"""
+	累计序列 (例如累计ack) 在最近window秒内的平均增长速率
+
+	rate[i] = (arr[i] - arr[i - k]) / window, k为窗口内的桶数;
+	开头不足一个窗口时按0补齐。与累计值除以下标的平均速率不同,
+	它反映的是每个时刻附近的速率。
+	"""
+	arr = np.asarray(arr, dtype=float)
+	k = max(1, int(round(window / BUCKET_WIDTH)))
+	before = np.concatenate([np.zeros(min(k, len(arr))), arr[:-k]]) if len(arr) else arr
+	return (arr - before) / (k * BUCKET_WIDTH)
 
 def difference(arr):
 	arr2 = [0] * len(arr)
@@ -194,14 +321,19 @@ def difference(arr):
 	arr2[0] = arr[0]
 	return arr2
 
+def plotSeries(times, values, **kwargs):
+	"""绘制一条时间序列, 点数很多 (例如亚秒级的桶) 时先用LTTB降采样"""
+	times, values = plotting.downsample(times, values)
+	plt.plot(times, values, **kwargs)
+
 def analyzeGoodPut():
 	global goodputDict04, goodputDict15
 
 	colors = ['k', 'k', 'y', 'g', 'b', 'r', 'c', 'm']
 	for key in goodputDict04.keys():
-		plt.plot(range(1001),derivative(goodputDict04[key]), label=key+'04', c = colors[-1])
+		plotSeries(bucketTimes(goodputDict04[key]), windowRate(goodputDict04[key]), label=key+'04', c = colors[-1])
 		colors.pop()
-		# plt.plot(range(1001), derivative(goodputDict15[key]), label=key+'15', c = colors[-1])
+		# plt.plot(bucketTimes(goodputDict15[key]), windowRate(goodputDict15[key]), label=key+'15', c = colors[-1])
 		# colors.pop()
 
 	plt.xlabel("time") 
@@ -216,9 +348,9 @@ def analyzeloss():
 	global lossDict04, lossDict15
 	colors = ['k', 'k', 'y', 'g', 'b', 'r', 'c', 'm']
 	for key in lossDict04.keys():
-		plt.plot(range(1001),difference(lossDict04[key]), label=key+'04', c = colors[-1])
+		plotSeries(bucketTimes(lossDict04[key]), difference(lossDict04[key]), label=key+'04', c = colors[-1])
 		colors.pop()
-		# plt.plot(range(1001), difference(lossDict15[key]), label=key+'15', c = colors[-1])
+		# plt.plot(bucketTimes(lossDict15[key]), difference(lossDict15[key]), label=key+'15', c = colors[-1])
 		# colors.pop()
 
 	plt.xlabel("time") 
@@ -229,7 +361,9 @@ def analyzeloss():
 
 
 
-run()
-analyzeGoodPut()
+if __name__ == '__main__':
+	run()
+	analyzeGoodPut()
+
+	analyzeloss()
 
-analyzeloss()
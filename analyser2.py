@@ -1,23 +1,28 @@
-import  traceanalyzer as tr
 import matplotlib.pyplot as plt
 
-#end-to-end delay
-eedelay1=tr.Eedelay('renoTrace.tr','3')
-eedelay2=tr.Eedelay('vegasTrace.tr','3')
-eedelay3=tr.Eedelay('cubicTrace.tr','3')
-eedelay4=tr.Eedelay('yeahTrace.tr','3')
+import delay
 
-# eedelay1=tr.Eedelay('renoTrace.tr','0')
-# eedelay1=tr.Eedelay('renoTrace.tr','0')
-# eedelay2.sample()#eedelay2.sample(1.5) for sampling with step=1.5
-eedelay1.plot()
-eedelay2.plot()
-eedelay3.plot()
-eedelay4.plot()
+#end-to-end delay: 一次读取每个trace, 得到所有流的时延
+# node=3: 在瓶颈链路的出口路由器统计接收; node=None 则在每个包的目的节点统计
+traces = {
+    'reno': 'renoTrace.tr',
+    'vegas': 'vegasTrace.tr',
+    'cubic': 'cubicTrace.tr',
+    'yeah': 'yeahTrace.tr',
+}
+delays = delay.delays_of_traces(traces, node=3)
+
+for variant, eedelay in delays.items():
+    eedelay.sample()#eedelay.sample(1.5) for sampling with step=1.5
+    plt.plot(eedelay.time_sample, eedelay.eedelay_sample, label=variant)
+    print(variant, ' '.join(f"p{q}={value * 1000:.3f}ms" for q, value in eedelay.percentiles().items()))
+plt.xlabel('Time (s)')
+plt.ylabel('End-to-end delay (s)')
+plt.legend()
 plt.show()
 #getting data
-time=eedelay2.time_sample
-eedelay=eedelay2.eedelay_sample
+time=delays['vegas'].time_sample
+eedelay=delays['vegas'].eedelay_sample
 idx=0
 for instant in time:
     print(instant,' ',eedelay[idx]) 
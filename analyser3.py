@@ -19,146 +19,311 @@ warnings.filterwarnings('ignore')
 
 import matplotlib.pyplot as plt
 import numpy as np
+import argparse
+import collections
 import csv
+import functools
+import glob
 import os
+import re
+import sys
+from time import sleep
+from concurrent.futures import ProcessPoolExecutor
 from math import ceil
 
+import flow_table
+import instrument
+import jitter
+import pipeline
+import plotting
+import queue_state
+import replication
+import trace_cache
+import trace_index
+import trace_io
+import trace_layout
+import trace_mmap
+import trace_reader
+import window_rate
+from flow_table import FlowTable
+from link_filter import DUMBBELL_FILTER, dumbbell_bottleneck
+
+# Part A/B/C 解析trace时是否使用二进制列式缓存 (见 trace_cache.py)
+USE_TRACE_CACHE = True
+
+# Part A/B/C 使用的链路过滤器 (见 link_filter.py); None 表示在所有链路上计数,
+# 设为 DUMBBELL_FILTER 则只统计端到端路径上的发送、接收和瓶颈丢包
+LINK_FILTER = None
+
+# 默认统计的流: 模板中 source1 / source2 所在的节点0和1
+DEFAULT_FLOWS = (0, 1)
+
+# 模板中仿真的结束时间 (TCL中的 $ns at 100.0 "finish"), 用于计算吞吐量;
+# 检测到稳态后提前结束的仿真使用 .steady 文件中记录的结束时间 (见 steady_state.py)
+SIM_TIME = 100.0
+
+# 没有检测到预热期时, 公平性和CoV从仿真的这一比例处开始计算 (最后1/3)
+START_FRACTION = 2 / 3
+
+# 图表输出格式 ('png' / 'svg' / 'none') 和PNG分辨率 (见 plotting.py)
+FIGURE_FORMAT = 'png'
+FIGURE_DPI = 300
+
+# 瓶颈队列长度上限 (TCL中的 queue-limit, 见 scenario.py), 用于区分队列满时的丢包和RED的提前丢包;
+# None 表示取观察到的最大队列长度
+QUEUE_LIMIT = 10
+
+# Part C: 重复运行的变体、汇总的指标, 置信区间的方法 ('t' / 'bootstrap') 和置信水平,
+# 以及置信区间半宽相对于均值的目标 (未达到时提示用 generate_runs.py --adaptive 增加运行)
+PART_C_VARIANT = 'yeah'
+PART_C_METRICS = ('goodput', 'plr', 'fairness', 'cov')
+PART_C_CI_METHOD = 't'
+PART_C_CI_LEVEL = 0.95
+PART_C_TARGET = 0.05
+
+# 各阶段耗时和计数器的JSON报告 (写在输出目录中)
+REPORT_FILE = 'analysis_report.json'
+
 # Set matplotlib to use only ASCII characters
 plt.rcParams['axes.unicode_minus'] = False
 
 class TCPAnalyzer:
     """TCP trace文件分析器"""
     
-    def __init__(self, trace_file, variant_name):
+    def __init__(self, trace_file, variant_name, bucket_width=1.0, link_filter=None,
+                 flows=DEFAULT_FLOWS, flow_key='src', stats=None):
         """
         初始化分析器
         
         参数:
-            trace_file: trace文件路径
+            trace_file: trace文件路径; 可以是压缩的trace (按魔数识别gzip/zstd/lz4),
+                        文件不存在时也会尝试 .gz/.zst/.lz4 后缀
             variant_name: TCP变体名称
+            bucket_width: 吞吐量时间序列的桶宽 (秒), 例如 1.0、0.1、0.01
+            link_filter: LinkFilter, 只统计指定链路上的事件; 默认所有链路,
+                         精简模式的trace默认使用生成时记录的过滤器 (见 trace_layout.py)
+            flows: 要统计的流标识列表 (默认源节点0和1); None 表示trace中出现的所有流
+            flow_key: 'src' 按源节点号区分流, 'fid' 按流号区分
+            stats: instrument.Stats, 记录解析的耗时和计数器 (默认新建一个)
         """
-        self.trace_file = trace_file
+        self.trace_file = trace_io.resolve_trace(trace_file)
         self.variant_name = variant_name
-        self.flow1_data = {}  # flow id 1的数据 (source1, fid 1)
-        self.flow2_data = {}  # flow id 2的数据 (source2, fid 2)
+        self.bucket_width = bucket_width
+        if link_filter is None:
+            link_filter = trace_layout.link_filter_for(self.trace_file)
+        self.link_filter = link_filter
+        self.flow_ids = None if flows is None else list(flows)
+        self.flow_key = flow_key
+        # 提前结束的仿真记录的预热期边界和结束时间 (见 steady_state.py)
+        steady = trace_layout.read_steady(self.trace_file) or {}
+        self.warmup = steady.get('warmup')
+        self.sim_time = steady.get('end') or SIM_TIME
+        self.flows = []  # 每条流的数据字典, 与 flow_table.order() 顺序一致
+        self._index = None  # summary_index() 加载的摘要索引
+        self.stats = stats if stats is not None else instrument.Stats()
         
         # 初始化数据结构
         self._init_data_structures()
         
     def _init_data_structures(self):
         """初始化数据结构"""
-        self.flow1_data = {
-            'sent_packets': 0,
-            'rcvd_packets': 0,
-            'dropped_packets': 0,
-            'total_bytes': 0,
-            'throughput_samples': [],
-            'timestamps': []
-        }
-        self.flow2_data = {
-            'sent_packets': 0,
-            'rcvd_packets': 0,
-            'dropped_packets': 0,
-            'total_bytes': 0,
-            'throughput_samples': [],
-            'timestamps': []
-        }
+        self.flow_table = FlowTable(self.flow_ids, key=self.flow_key,
+                                    bucket_width=self.bucket_width)
+        self._finish_throughput()
+    
+    @property
+    def flow1_data(self):
+        """第一条流 (source1, fid 1) 的数据"""
+        return self.flows[0] if len(self.flows) > 0 else self._empty_flow_data()
+    
+    @property
+    def flow2_data(self):
+        """第二条流 (source2, fid 2) 的数据"""
+        return self.flows[1] if len(self.flows) > 1 else self._empty_flow_data()
+    
+    @staticmethod
+    def _empty_flow_data():
+        data = dict.fromkeys(flow_table.COUNTERS, 0)
+        data['throughput_samples'] = []
+        data['timestamps'] = []
+        return data
+        
+    def parse_trace(self, engine='python', use_cache=False, workers=None):
+        """
+        解析trace文件
+        
+        参数:
+            engine: 'python' 逐行解析; 'numpy' 按块读入NumPy列后向量化统计;
+                    'mmap' 同 'numpy', 但直接在内存映射的文件上切分字段 (见 trace_mmap.py)
+            use_cache: 从二进制列式缓存加载 (未命中时解析并写入缓存),
+                       此时总是使用numpy统计
+            workers: 大于1时把文件按行切成workers段, 在进程池中用mmap引擎
+                     分别统计后合并 (忽略engine); 压缩的trace不能切分, 仍按engine解析
         
-    def parse_trace(self):
-        """解析trace文件"""
+        耗时记在 self.stats 的 'parse_trace' 阶段, 同时记录计数器:
+            bytes_read     trace文件的大小 (字节)
+            packet_lines   包事件行数
+            events.<事件>  每种事件 (+ - r d ...) 的行数
+            lines_read, lines_skipped
+                           逐行解析时读取的总行数和字段不足12个被跳过的行数
+        """
         if not os.path.exists(self.trace_file):
             print(f"警告: 文件 {self.trace_file} 不存在")
             return
+        
+        with self.stats.stage('parse_trace'):
+            self._parse(engine, use_cache, workers)
+        self.stats.count('bytes_read', os.path.getsize(self.trace_file))
+    
+    def _parse(self, engine, use_cache, workers):
+        """parse_trace 的实现"""
+        if use_cache:
+            self._aggregate_columns(trace_cache.iter_columns_cached(self.trace_file))
+            return
+        if workers is not None and workers > 1 and not trace_io.is_compressed(self.trace_file):
+            self._parse_parallel(workers)
+            return
+        if engine == 'numpy':
+            self._aggregate_columns(trace_reader.iter_trace_blocks(self.trace_file))
+            return
+        if engine == 'mmap':
+            self._aggregate_columns(trace_mmap.iter_trace_blocks(self.trace_file))
+            return
+        if engine != 'python':
+            raise ValueError(f"未知的解析引擎: {engine}")
             
-        flow1_bytes_per_second = {}
-        flow2_bytes_per_second = {}
+        table = self.flow_table
+        buckets = table.buckets
+        event_codes = flow_table.EVENT_CODES
+        by_src = self.flow_key == 'src'
+        link_filter = self.link_filter
         
-        with open(self.trace_file, 'r') as f:
+        lines_read = lines_skipped = 0
+        events = {}
+        with trace_io.open_trace(self.trace_file, 'r') as f:
             for line in f:
+                lines_read += 1
                 parts = line.split()
                 if len(parts) < 12:
+                    lines_skipped += 1
                     continue
                     
                 event = parts[0]
-                time = float(parts[1])
-                packet_type = parts[4]
-                packet_size = int(parts[5])
-                
-                # 获取flow id (在倒数第4个位置)
-                if len(parts) >= 11:
-                    flow_id = parts[-4].split('.')[0]
-                else:
+                events[event] = events.get(event, 0) + 1
+                # 尽早丢弃不计数的事件, 不做后面的数值转换
+                code = event_codes.get(event)
+                if code is None:
+                    continue
+                if link_filter is not None and not link_filter.accepts(event, parts[2], parts[3]):
                     continue
                 
                 # 只处理TCP数据包
-                if packet_type != 'tcp':
+                if parts[4] != 'tcp':
                     continue
                 
-                time_bucket = int(time)
+                # 源地址在倒数第4个位置, 流号在倒数第5个位置
+                row = table.row_of_token(parts[-4].split('.')[0] if by_src else parts[-5])
+                if row is None:
+                    continue
                 
-                # 根据flow id分类
-                if flow_id == '0':  # flow 1
-                    if event == '+':  # 发送
-                        self.flow1_data['sent_packets'] += 1
-                    elif event == 'r':  # 接收
-                        self.flow1_data['rcvd_packets'] += 1
-                        self.flow1_data['total_bytes'] += packet_size
-                        if time_bucket not in flow1_bytes_per_second:
-                            flow1_bytes_per_second[time_bucket] = 0
-                        flow1_bytes_per_second[time_bucket] += packet_size
-                    elif event == 'd':  # 丢包
-                        self.flow1_data['dropped_packets'] += 1
-                        
-                elif flow_id == '1':  # flow 2
-                    if event == '+':
-                        self.flow2_data['sent_packets'] += 1
-                    elif event == 'r':
-                        self.flow2_data['rcvd_packets'] += 1
-                        self.flow2_data['total_bytes'] += packet_size
-                        if time_bucket not in flow2_bytes_per_second:
-                            flow2_bytes_per_second[time_bucket] = 0
-                        flow2_bytes_per_second[time_bucket] += packet_size
-                    elif event == 'd':
-                        self.flow2_data['dropped_packets'] += 1
+                table.add_event(row, code, buckets.bucket_of(float(parts[1])), int(parts[5]))
+        
+        self.stats.count('lines_read', lines_read)
+        self.stats.count('lines_skipped', lines_skipped)
+        self.stats.count('packet_lines', lines_read - lines_skipped)
+        self.stats.count_all(events, 'events.')
         
         # 转换为吞吐量时间序列
-        if flow1_bytes_per_second:
-            max_time = max(flow1_bytes_per_second.keys())
-            for t in range(max_time + 1):
-                bytes_val = flow1_bytes_per_second.get(t, 0)
-                mbps = (bytes_val * 8) / 1e6  # 转换为Mbps
-                self.flow1_data['throughput_samples'].append(mbps)
-                self.flow1_data['timestamps'].append(t)
-                
-        if flow2_bytes_per_second:
-            max_time = max(flow2_bytes_per_second.keys())
-            for t in range(max_time + 1):
-                bytes_val = flow2_bytes_per_second.get(t, 0)
-                mbps = (bytes_val * 8) / 1e6
-                self.flow2_data['throughput_samples'].append(mbps)
-                self.flow2_data['timestamps'].append(t)
-    
-    def get_total_goodput(self):
-        """计算总吞吐量 (Mbps)"""
-        sim_time = 100.0  # 仿真时间100秒
-        flow1_mbps = 0
-        flow2_mbps = 0
-        
-        if sim_time > 0:
-            flow1_mbps = (self.flow1_data['total_bytes'] * 8) / (sim_time * 1e6)
-            flow2_mbps = (self.flow2_data['total_bytes'] * 8) / (sim_time * 1e6)
-        
-        return flow1_mbps + flow2_mbps
+        self._finish_throughput()
+    
+    def _parse_parallel(self, workers):
+        """
+        把文件切成以换行结尾的若干段, 每段在单独的进程中统计为一张流状态表,
+        再按流标识合并: 计数器和每个桶的字节数都是可加的,
+        跨越分段边界的时间桶合并后与顺序解析完全一致
+        """
+        ranges = trace_mmap.split_ranges(self.trace_file, workers)
+        settings = (self.trace_file, self.bucket_width, self.link_filter, self.flow_ids, self.flow_key)
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(ranges)))) as pool:
+            futures = [pool.submit(_parse_chunk, *settings, start, end) for start, end in ranges]
+            for future in futures:
+                table, stats = future.result()
+                self.flow_table.merge(table)
+                self.stats.count_all(stats['counters'])
+        self._finish_throughput()
+    
+    def _aggregate_columns(self, blocks):
+        """
+        numpy统计引擎, 结果与逐行解析完全一致
+        
+        参数:
+            blocks: trace_reader 格式的列字典序列
+        """
+        for cols in blocks:
+            self._accumulate_block(cols)
+        self._finish_throughput()
+    
+    def _accumulate_block(self, cols):
+        """
+        把一块列数据累加到流状态表
+        
+        参数:
+            cols: trace_reader 格式的列字典
+        """
+        self.stats.count('packet_lines', len(cols['event']))
+        self.stats.count_all(_event_counts(cols['event']), 'events.')
+        
+        tcp = cols['type'] == b'tcp'
+        if self.link_filter is not None:
+            tcp &= self.link_filter.mask(cols)
+        if not tcp.any():
+            return
+        # 事件编码与 flow_table.EVENT_CODES 一致, 3=其他
+        events = cols['event'][tcp]
+        codes = np.full(len(events), 3, dtype=np.int64)
+        for event, code in flow_table.EVENT_CODES.items():
+            codes[events == event.encode()] = code
+        
+        self.flow_table.add_events(cols[self.flow_key][tcp], codes,
+                                   cols['time'][tcp], cols['size'][tcp])
+    
+    def _finish_throughput(self):
+        """由流状态表生成每条流的数据字典, 每个桶的字节数转换为吞吐量时间序列 (Mbps)"""
+        table = self.flow_table
+        self.flows = []
+        self._sliding = {}  # (window, step) -> sliding_throughput 的结果
+        for row in table.order():
+            flow_data = self._empty_flow_data()
+            flow_data.update(table.counters(row))
+            flow_data['flow_id'] = table.ids[row]
+            values = table.row_bytes(row)
+            if len(values):
+                mbps = (values * 8) / 1e6
+                if self.bucket_width != 1:
+                    mbps = mbps / self.bucket_width
+                    flow_data['timestamps'] = table.buckets.times_of(len(values)).tolist()
+                else:
+                    flow_data['timestamps'] = list(range(len(values)))
+                flow_data['throughput_samples'] = mbps.tolist()
+            self.flows.append(flow_data)
+    
+    def get_total_goodput(self, sim_time=None):
+        """
+        计算所有流的总吞吐量 (Mbps)
+        
+        参数:
+            sim_time: 仿真时间 (默认 self.sim_time: 100秒, 提前结束的仿真为记录的结束时间)
+        """
+        if sim_time is None:
+            sim_time = self.sim_time
+        if sim_time <= 0:
+            return 0
+        return sum((flow_data['total_bytes'] * 8) / (sim_time * 1e6) for flow_data in self.flows)
     
     def get_plr(self):
         """计算包丢失率 (%)"""
-        flow1_total = self.flow1_data['sent_packets']
-        flow2_total = self.flow2_data['sent_packets']
-        flow1_dropped = self.flow1_data['dropped_packets']
-        flow2_dropped = self.flow2_data['dropped_packets']
-        
-        total_sent = flow1_total + flow2_total
-        total_dropped = flow1_dropped + flow2_dropped
+        total_sent = sum(flow_data['sent_packets'] for flow_data in self.flows)
+        total_dropped = sum(flow_data['dropped_packets'] for flow_data in self.flows)
         
         if total_sent > 0:
             plr = (total_dropped / total_sent) * 100
@@ -167,35 +332,177 @@ class TCPAnalyzer:
             
         return plr
     
-    def get_fairness_index(self, start_fraction=2/3):
+    def sliding_throughput(self, window=0.1, step=0.01, use_cache=False):
         """
-        计算Jain公平性指数
+        每条流的滑动窗口吞吐量 (见 window_rate.py), 需要先调用 parse_trace
         
         参数:
-            start_fraction: 从哪个时间点开始计算 (默认最后1/3)
+            window: 窗口长度 (秒)
+            step: 相邻窗口的间隔 (秒)
+            use_cache: 从二进制列式缓存加载trace
+        返回:
+            (times, rates): 窗口结束时间数组, 以及与 self.flows 顺序一致的
+                            每条流一行的吞吐量二维数组 (Mbps)
         """
-        # 获取最后1/3的吞吐量数据
-        flow1_samples = self.flow1_data['throughput_samples']
-        flow2_samples = self.flow2_data['throughput_samples']
+        key = (window, step)
+        if key in self._sliding:
+            return self._sliding[key]
         
-        if not flow1_samples or not flow2_samples:
-            return 0
+        # 与 _accumulate_block 相同的事件选择: 指定链路上接收的TCP包, 逐块只保留这三列
+        parts = ([], [], [])
+        for cols in self._blocks(use_cache):
+            rcvd = (cols['type'] == b'tcp') & (cols['event'] == b'r')
+            if self.link_filter is not None:
+                rcvd &= self.link_filter.mask(cols)
+            for part, name in zip(parts, (self.flow_key, 'time', 'size')):
+                part.append(np.asarray(cols[name][rcvd], dtype=np.int64 if name != 'time' else np.float64))
+        flows, times, sizes = (np.concatenate(part) if part else np.empty(0) for part in parts)
+        flow_ids = [flow_data['flow_id'] for flow_data in self.flows]
+        result = window_rate.grouped_rates(flows, times, sizes, flow_ids, window, step)
+        self._sliding[key] = result
+        return result
+    
+    def jitter(self, use_cache=False):
+        """
+        每条流和每条链路的RFC 3550抖动 (见 jitter.py), 不需要先调用 parse_trace
         
-        start_idx1 = int(len(flow1_samples) * start_fraction)
-        start_idx2 = int(len(flow2_samples) * start_fraction)
+        返回 jitter.JitterMeter.rows() 的结果行列表; trace不存在时为空列表
+        """
+        if not os.path.exists(self.trace_file):
+            return []
+        return jitter.JitterMeter(self.flow_key).update_all(self._blocks(use_cache)).rows()
+    
+    def queue(self, link=None, limit=None, use_cache=False):
+        """
+        链路队列的状态 (见 queue_state.py), 不需要先调用 parse_trace
         
-        flow1_last_third = flow1_samples[start_idx1:]
-        flow2_last_third = flow2_samples[start_idx2:]
+        参数:
+            link: (from, to), 默认为trace中的瓶颈链路 (见 queue_link)
+            limit: 队列长度上限 (TCL中的 queue-limit, 长度达到 limit - 1 时为满), 默认取观察到的最大长度
+            use_cache: 从二进制列式缓存加载trace
+        返回:
+            queue_state.LinkQueue; trace不存在或链路上没有事件时为空的队列
+        """
+        if not os.path.exists(self.trace_file):
+            link = link or dumbbell_bottleneck(len(self.flow_ids or self.flows))
+            return queue_state.queues_of_columns([], [link], limit)[tuple(link)]
+        if link is None:
+            link = self.queue_link(use_cache)
+        return queue_state.queues_of_columns(self._blocks(use_cache), [link], limit)[tuple(link)]
+    
+    def queue_link(self, use_cache=False):
+        """
+        trace中的瓶颈链路
+        
+        按trace中TCP源节点的数量取哑铃拓扑的瓶颈链路; 这条链路上没有 + / - / d 事件时
+        (不是 scenario.py 生成的拓扑), 取丢包最多的链路, 没有丢包时取入队最多的链路
+        """
+        # 逐块统计: TCP源节点, 以及每条链路上的丢包数和入队数
+        sources = set()
+        counts = {b'd': collections.Counter(), b'+': collections.Counter()}
+        queued_links = set()
+        for cols in self._blocks(use_cache):
+            sources.update(np.unique(cols['src'][cols['type'] == b'tcp']).tolist())
+            from_node = np.asarray(cols['from_node'], dtype=np.int64)
+            to_node = np.asarray(cols['to_node'], dtype=np.int64)
+            queued = np.isin(cols['event'], [b'+', b'-', b'd'])
+            queued_links.update(zip(*np.unique(np.stack([from_node[queued], to_node[queued]]),
+                                               axis=1).tolist()))
+            for event, counter in counts.items():
+                mask = cols['event'] == event
+                links, n = np.unique(np.stack([from_node[mask], to_node[mask]]), axis=1, return_counts=True)
+                counter.update(dict(zip(zip(*links.tolist()), n.tolist())))
+        link = dumbbell_bottleneck(len(sources))
+        if link in queued_links:
+            return link
+        for event in (b'd', b'+'):
+            if counts[event]:
+                busiest = min(counts[event].items(), key=lambda item: (-item[1], item[0]))[0]
+                return int(busiest[0]), int(busiest[1])
+        return link
+    
+    def _blocks(self, use_cache):
+        """按块产出trace的列字典: 使用列式缓存 (未命中时边解析边写入) 或直接mmap解析"""
+        if use_cache:
+            return trace_cache.iter_columns_cached(self.trace_file)
+        return trace_mmap.iter_trace_blocks(self.trace_file)
+    
+    def summary_index(self, resolution=trace_index.DEFAULT_RESOLUTION):
+        """
+        trace的摘要索引 (见 trace_index.py), 第一次使用时构建并保存,
+        之后直接加载, 不需要先调用 parse_trace
+        """
+        if self._index is None or self._index.resolution != resolution:
+            self._index = trace_index.load_or_build(self.trace_file, resolution,
+                                                    self.flow_key, self.link_filter)
+        return self._index
+
+    def window_summary(self, start, end, width=1.0, resolution=trace_index.DEFAULT_RESOLUTION):
+        """
+        用摘要索引回答任意时间窗口 [start, end) 的查询, 不读取原始trace
+
+        参数:
+            start, end: 窗口的开始和结束时间 (秒), 按 resolution 对齐
+            width: 计算CoV时吞吐量样本的宽度 (秒)
+            resolution: 索引的时间粒度 (秒)
+        返回:
+            字典: flow_ids, 每条流的 goodput (Mbps), 以及所有流的 plr (%)、fairness、cov
+        """
+        index = self.summary_index(resolution)
+        flows = self.flow_ids if self.flow_ids is not None else index.flow_ids.tolist()
+        return {
+            'flow_ids': list(flows),
+            'goodput': index.goodput(start, end, flows).tolist(),
+            'plr': float(index.plr(start, end, flows)),
+            'fairness': float(index.fairness(start, end, flows)),
+            'cov': float(index.cov(start, end, width, flows)),
+        }
+
+    def _tail_samples(self, start_fraction, window=None, step=None):
+        """
+        每条流从 start_fraction 处开始的吞吐量样本
+        
+        start_fraction 为None时从预热期边界 (self.warmup) 开始, 没有记录预热期时
+        使用 START_FRACTION; 给出 window 时使用滑动窗口吞吐量 (step 默认等于 window),
+        否则使用时间桶
+        """
+        if window is not None:
+            times, rates = self.sliding_throughput(window, step or window)
+            return [samples[self._tail_start(len(samples), start_fraction, times - window):].tolist()
+                    for samples in rates]
+        tails = []
+        for flow_data in self.flows:
+            samples = flow_data['throughput_samples']
+            starts = np.arange(len(samples)) * self.bucket_width
+            tails.append(samples[self._tail_start(len(samples), start_fraction, starts):])
+        return tails
+    
+    def _tail_start(self, length, start_fraction, starts):
+        """第一个使用的样本: 按比例, 或者开始时间不早于预热期边界的第一个样本"""
+        if start_fraction is None and self.warmup is not None:
+            return int(np.searchsorted(starts, self.warmup - 1e-9))
+        if start_fraction is None:
+            start_fraction = START_FRACTION
+        return int(length * start_fraction)
+    
+    def get_fairness_index(self, start_fraction=None, window=None, step=None):
+        """
+        计算所有流的Jain公平性指数
         
-        if not flow1_last_third or not flow2_last_third:
+        参数:
+            start_fraction: 从哪个时间点开始计算; 默认从预热期边界开始,
+                            没有记录预热期时取最后1/3
+            window, step: 使用滑动窗口吞吐量 (秒), 默认使用 bucket_width 的时间桶
+        """
+        # 获取每条流稳态部分 (默认最后1/3) 的吞吐量数据, 任何一条流没有数据时返回0
+        tails = self._tail_samples(start_fraction, window, step)
+        if not tails or not all(tails):
             return 0
         
-        # 计算平均吞吐量
-        avg_flow1 = np.mean(flow1_last_third)
-        avg_flow2 = np.mean(flow2_last_third)
+        # 计算每条流的平均吞吐量
+        x = [np.mean(samples) for samples in tails]
         
         # Jain's fairness index: (sum xi)^2 / (n * sum xi^2)
-        x = [avg_flow1, avg_flow2]
         n = len(x)
         sum_x = sum(x)
         sum_x2 = sum(xi**2 for xi in x)
@@ -207,28 +514,17 @@ class TCPAnalyzer:
             
         return fairness
     
-    def get_stability_cov(self, start_fraction=2/3):
+    def get_stability_cov(self, start_fraction=None, window=None, step=None):
         """
         计算稳定性 (变异系数 CoV)
         
         参数:
-            start_fraction: 从哪个时间点开始计算
+            start_fraction: 从哪个时间点开始计算 (默认同 get_fairness_index)
+            window, step: 使用滑动窗口吞吐量 (秒), 默认使用 bucket_width 的时间桶
         """
-        # 合并两个flow的吞吐量
-        flow1_samples = self.flow1_data['throughput_samples']
-        flow2_samples = self.flow2_data['throughput_samples']
-        
-        if not flow1_samples and not flow2_samples:
-            return float('inf')
-        
-        # 取最后1/3
-        start_idx1 = int(len(flow1_samples) * start_fraction) if flow1_samples else 0
-        start_idx2 = int(len(flow2_samples) * start_fraction) if flow2_samples else 0
-        
-        samples1 = flow1_samples[start_idx1:] if flow1_samples else []
-        samples2 = flow2_samples[start_idx2:] if flow2_samples else []
-        
-        all_samples = samples1 + samples2
+        # 合并所有流稳态部分的吞吐量
+        all_samples = [sample for samples in self._tail_samples(start_fraction, window, step)
+                       for sample in samples]
         
         if not all_samples:
             return float('inf')
@@ -244,86 +540,323 @@ class TCPAnalyzer:
         return cov
 
 
-def run_part_a():
+class LiveTCPAnalyzer(TCPAnalyzer):
     """
-    Part A: 分析四种TCP变体的性能
+    跟随模式: 在ns仍在写trace时增量读取并更新统计
+    
+    每次 poll() 只读取文件新增的字节, 只处理以换行结尾的完整行,
+    最后一个不完整的行留到下一次读取时拼接。
     """
-    print("=" * 60)
-    print("Part A: TCP变体分析 (DropTail)")
-    print("=" * 60)
     
-    variants = ['reno', 'cubic', 'vegas', 'yeah']
-    results = {}
-    analyzers = {}
+    def __init__(self, trace_file, variant_name, bucket_width=1.0, link_filter=None,
+                 flows=DEFAULT_FLOWS, flow_key='src'):
+        super().__init__(trace_file, variant_name, bucket_width, link_filter, flows, flow_key)
+        self.offset = 0
+        self.last_time = 0.0
+        self.lines_read = 0
+        self._partial = b''
     
-    # 1. 解析所有trace文件
-    for variant in variants:
-        # 尝试两种可能的路径
-        trace_file = f'comp3014j/{variant}Trace.tr'
-        if not os.path.exists(trace_file):
-            trace_file = f'{variant}Trace.tr'
+    def reset(self):
+        """清空全部状态, 从文件开头重新读取"""
+        self.__init__(self.trace_file, self.variant_name, self.bucket_width, self.link_filter,
+                      self.flow_ids, self.flow_key)
+    
+    def poll(self, final=False):
+        """
+        读取新增内容并更新统计
         
-        print(f"\n处理 {variant.upper()}...")
-        analyzer = TCPAnalyzer(trace_file, variant)
-        analyzer.parse_trace()
-        analyzers[variant] = analyzer
-        
-        goodput = analyzer.get_total_goodput()
-        plr = analyzer.get_plr()
-        fairness = analyzer.get_fairness_index()
-        cov = analyzer.get_stability_cov()
-        
-        results[variant] = {
-            'goodput': goodput,
-            'plr': plr,
-            'fairness': fairness,
-            'cov': cov
-        }
+        参数:
+            final: ns已经退出, 把末尾不完整的行也当作完整行处理
         
-        print(f"  吞吐量: {goodput:.2f} Mbps")
-        print(f"  PLR: {plr:.4f}%")
-        print(f"  公平性: {fairness:.4f}")
-        print(f"  稳定性(CoV): {cov:.4f}")
-    
-    # 2. 打印表格
-    print("\n表格 1: 每个流的总吞吐量和包丢失率")
-    print("-" * 60)
-    print(f"{'变体':<10} {'吞吐量 (Mbps)':<20} {'PLR (%)':<15}")
-    print("-" * 60)
-    for variant in variants:
-        goodput = results[variant]['goodput']
-        plr = results[variant]['plr']
-        print(f"{variant:<10} {goodput:<20.2f} {plr:<15.4f}")
-    print("-" * 60)
-    
-    # 保存到CSV
-    csv_path = 'partA_goodput_plr.csv'
-    if os.path.exists('comp3014j'):
-        csv_path = 'comp3014j/partA_goodput_plr.csv'
-    
-    with open(csv_path, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(['Variant', 'Goodput (Mbps)', 'PLR (%)'])
-        for variant in variants:
-            writer.writerow([
-                variant,
-                f"{results[variant]['goodput']:.2f}",
-                f"{results[variant]['plr']:.4f}"
-            ])
-    
-    print(f"\nCSV已保存: {csv_path}")
+        返回:
+            本次处理的行数
+        """
+        if not os.path.exists(self.trace_file):
+            return 0
+        if self.offset == 0 and trace_io.is_compressed(self.trace_file):
+            raise ValueError(f"跟随模式只支持未压缩的trace: {self.trace_file}")
+        if os.path.getsize(self.trace_file) < self.offset:
+            # 文件被截断 (新的一次仿真覆盖了它), 从头开始
+            self.reset()
+        
+        processed = 0
+        with open(self.trace_file, 'rb') as f:
+            f.seek(self.offset)
+            while True:
+                data = f.read(trace_reader.DEFAULT_BLOCK_SIZE)
+                if not data:
+                    break
+                self.offset += len(data)
+                processed += self._consume(self._partial + data)
+        if final and self._partial:
+            processed += self._consume(self._partial + b'\n')
+        return processed
+    
+    def _consume(self, data):
+        """处理data中以换行结尾的完整行, 剩余部分留作下次拼接"""
+        end = data.rfind(b'\n') + 1
+        self._partial = data[end:]
+        lines = data[:end].splitlines()
+        if not lines:
+            return 0
+        
+        cols = trace_reader.parse_lines(lines)
+        self._accumulate_block(cols)
+        if len(cols['time']):
+            self.last_time = max(self.last_time, float(cols['time'].max()))
+        self.lines_read += len(lines)
+        return len(lines)
+    
+    def snapshot(self, start_fraction=None):
+        """
+        返回当前的统计快照
+        
+        吞吐量按目前读到的最后事件时间计算, 公平性和CoV的计算方式与TCPAnalyzer相同
+        """
+        self._finish_throughput()
+        return {
+            'time': self.last_time,
+            'lines': self.lines_read,
+            'goodput': float(self.get_total_goodput(sim_time=self.last_time)) if self.last_time > 0 else 0.0,
+            'plr': float(self.get_plr()),
+            'fairness': float(self.get_fairness_index(start_fraction)),
+            'cov': float(self.get_stability_cov(start_fraction)),
+        }
     
-    # 3. 绘制对比图 (4个子图: 吞吐量、PLR、公平性、稳定性)
-    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+    def follow(self, poll_interval=1.0, is_running=None, start_fraction=None):
+        """
+        持续跟随trace文件, 每次轮询后产出一个快照
+        
+        参数:
+            poll_interval: 轮询间隔 (秒)
+            is_running: 返回ns是否仍在运行的函数; 返回False后做最后一次读取并结束。
+                        为None时一直跟随, 由调用方决定何时停止
+            start_fraction: 传给公平性和CoV计算
+        
+        用法:
+            proc = subprocess.Popen(['ns', 'cubicCode.tcl'])
+            live = LiveTCPAnalyzer('cubicTrace.tr', 'cubic')
+            for snap in live.follow(is_running=lambda: proc.poll() is None):
+                if snap['time'] > 20 and snap['goodput'] < 1:
+                    proc.terminate()
+        """
+        while True:
+            running = is_running() if is_running is not None else True
+            self.poll(final=not running)
+            yield self.snapshot(start_fraction)
+            if not running:
+                return
+            sleep(poll_interval)
+
+
+def _event_counts(events):
+    """每种事件的行数; 常见的四种事件逐个比较, 其余的 (很少见) 再分组统计"""
+    counts = {}
+    other = np.ones(len(events), dtype=bool)
+    for event in (b'+', b'-', b'r', b'd'):
+        hit = events == event
+        other &= ~hit
+        counts[event.decode()] = int(hit.sum())
+    if other.any():
+        for event, n in zip(*np.unique(events[other], return_counts=True)):
+            counts[event.decode()] = int(n)
+    return {event: n for event, n in counts.items() if n}
+
+
+def _parse_chunk(trace_file, bucket_width, link_filter, flow_ids, flow_key, start, end):
+    """进程池任务: 统计trace文件 [start, end) 字节范围内的行, 返回流状态表和计数器"""
+    analyzer = TCPAnalyzer(trace_file, 'chunk', bucket_width, link_filter, flow_ids, flow_key)
+    with trace_mmap.MappedTrace(analyzer.trace_file) as trace:
+        for cols in trace.iter_packet_blocks(start, end):
+            analyzer._accumulate_block(cols)
+    analyzer.flow_table.flush()
+    return analyzer.flow_table, analyzer.stats.to_dict()
+
+
+def find_trace(file_name):
+    """优先使用 comp3014j/ 下的trace文件, 否则使用当前目录; 都接受压缩归档的trace"""
+    trace_file = trace_io.resolve_trace(f'comp3014j/{file_name}')
+    if not os.path.exists(trace_file):
+        trace_file = trace_io.resolve_trace(file_name)
+    return trace_file
+
+
+def find_runs(variant):
+    """
+    Part C 的全部运行: 运行编号 -> trace文件, 按编号排序
+
+    运行次数不固定 (generate_runs.py --adaptive 按置信区间决定), 由现有的
+    {variant}Trace_run<编号>.tr 文件得到; 优先使用 comp3014j/ 下的文件
+    """
+    pattern = re.compile(rf'{re.escape(variant)}Trace_run(\d+)\.tr(\.\w+)?$')
+    numbers = set()
+    for directory in ('comp3014j', '.'):
+        for path in glob.glob(os.path.join(directory, f'{variant}Trace_run*')):
+            match = pattern.match(os.path.basename(path))
+            if match:
+                numbers.add(int(match.group(1)))
+    return {number: find_trace(f'{variant}Trace_run{number}.tr') for number in sorted(numbers)}
+
+
+def part_c_intervals(runs):
+    """Part C 每个指标的 (均值, 样本标准差, 置信区间半宽)"""
+    intervals = {}
+    for metric, values in runs.items():
+        mean, half = replication.confidence_interval(values, PART_C_CI_LEVEL, PART_C_CI_METHOD)
+        intervals[metric] = (mean, float(np.std(values, ddof=1)), half)
+    return intervals
+
+
+def analysis_settings():
+    """
+    影响摘要的全部分析设置, 作为增量分析的键 (见 pipeline.py):
+    修改其中任何一项后, 所有trace都会重新分析
+    """
+    return {
+        'link_filter': LINK_FILTER.spec() if LINK_FILTER is not None else None,
+        'flows': list(DEFAULT_FLOWS),
+        'sim_time': SIM_TIME,
+        'start_fraction': START_FRACTION,
+        'queue_limit': QUEUE_LIMIT,
+    }
+
+
+def summarize_trace(trace_file, variant, use_cache=True, link_filter=None, stats=None, extras=()):
+    """
+    解析一个trace并计算全部指标
     
-    colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728']
+    返回可pickle的摘要字典 (不包含分析器对象本身), 供进程池使用
+    stats: instrument.Stats, 记录解析和指标计算的耗时与计数器
+    extras: 另外计算的项, 每项都要再读一遍trace, 只在用到它的Part中请求:
+            'jitter' 每条流和每条链路的抖动 (Part A)
+            'queue'  瓶颈链路的队列统计 (Part B)
+    """
+    analyzer = TCPAnalyzer(trace_file, variant, link_filter=link_filter, stats=stats)
+    analyzer.parse_trace(use_cache=use_cache)
+    
+    flows = []
+    for flow_data in analyzer.flows:
+        flows.append({
+            'flow_id': flow_data['flow_id'],
+            'sent_packets': flow_data['sent_packets'],
+            'rcvd_packets': flow_data['rcvd_packets'],
+            'dropped_packets': flow_data['dropped_packets'],
+            'total_bytes': flow_data['total_bytes'],
+        })
+    
+    with analyzer.stats.stage('metrics'):
+        summary = {
+            'variant': variant,
+            'trace_file': trace_file,
+            'goodput': float(analyzer.get_total_goodput()),
+            'plr': float(analyzer.get_plr()),
+            'fairness': float(analyzer.get_fairness_index()),
+            'cov': float(analyzer.get_stability_cov()),
+            'warmup': analyzer.warmup,
+            'sim_time': analyzer.sim_time,
+            'flows': flows,
+        }
+        if 'jitter' in extras:
+            summary['jitter'] = analyzer.jitter(use_cache)
+        if 'queue' in extras:
+            summary['queue'] = analyzer.queue(limit=QUEUE_LIMIT, use_cache=use_cache).summary()
+        return summary
+
+
+def _summarize_task(trace_file, variant, use_cache, link_filter, stats_settings, extras=()):
+    """进程池任务: 分析一个trace, 返回 (摘要, 统计结果)"""
+    stats = instrument.Stats(**stats_settings)
+    stats.count('traces')
+    summary = summarize_trace(trace_file, variant, use_cache, link_filter, stats, extras)
+    return summary, stats.to_dict()
+
+
+def analyze_traces(tasks, max_workers=None, use_cache=None, link_filter=None, stats=None, extras=()):
+    """
+    在进程池中并行分析多个trace
+    
+    参数:
+        tasks: (key, trace_file, variant) 列表
+        max_workers: 进程数 (默认CPU核数)
+        use_cache: 是否使用列式缓存 (默认 USE_TRACE_CACHE)
+        link_filter: 链路过滤器 (默认 LINK_FILTER)
+        stats: instrument.Stats, 各trace的统计结果合并到它当前所在的阶段下
+        extras: 摘要中另外计算的项 (见 summarize_trace)
+    
+    返回:
+        key -> summarize_trace 摘要字典
+    """
+    tasks = list(tasks)
+    if use_cache is None:
+        use_cache = USE_TRACE_CACHE
+    if link_filter is None:
+        link_filter = LINK_FILTER
+    if stats is None:
+        stats = instrument.Stats()
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, len(tasks))
+    
+    def settings(trace_file):
+        return stats.settings(label=os.path.basename(trace_file))
+    
+    if max_workers <= 1:
+        results = {key: _summarize_task(trace_file, variant, use_cache, link_filter,
+                                        settings(trace_file), extras)
+                   for key, trace_file, variant in tasks}
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {key: pool.submit(_summarize_task, trace_file, variant, use_cache,
+                                        link_filter, settings(trace_file), extras)
+                       for key, trace_file, variant in tasks}
+            results = {key: future.result() for key, future in futures.items()}
+    
+    summaries = {}
+    for key, (summary, trace_stats) in results.items():
+        stats.merge(trace_stats)
+        summaries[key] = summary
+    return summaries
+
+
+def _output_step(pipe, path, inputs, produce, label):
+    """通过pipeline生成一个输出文件, 输入未变化时跳过"""
+    if pipe.step(path, inputs, produce):
+        print(f"{label}已保存: {path}")
+    else:
+        print(f"{label}未变化, 跳过: {path}")
+
+
+def _figure_step(pipe, plotter, path, inputs, plot_func, *args):
+    """
+    通过pipeline生成一张图表, 绘图任务交给plotter
     
-    # 准备所有数据
+    path 按 FIGURE_FORMAT 替换扩展名, 'none' 时不生成图表
+    """
+    img_path = plotting.figure_path(path, FIGURE_FORMAT)
+    if img_path is None:
+        return
+    inputs = {'data': inputs, 'dpi': FIGURE_DPI}
+    _output_step(pipe, img_path, inputs,
+                 lambda img_path: plotter.submit(plot_func, img_path, *args, dpi=FIGURE_DPI),
+                 '图表')
+
+
+def _metrics_of(summary):
+    """从摘要中取出四个指标"""
+    return {key: summary[key] for key in ('goodput', 'plr', 'fairness', 'cov')}
+
+
+def plot_part_a(img_path, variants, results, dpi=300):
+    """Part A 对比图 (4个子图: 吞吐量、PLR、公平性、稳定性)"""
     goodputs = [results[v]['goodput'] for v in variants]
     plrs = [results[v]['plr'] for v in variants]
     fairness_vals = [results[v]['fairness'] for v in variants]
     cov_vals = [results[v]['cov'] for v in variants]
     
+    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+    
+    colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728']
+    
     metrics_data = [goodputs, plrs, fairness_vals, cov_vals]
     titles = ['Goodput Comparison', 'Packet Loss Rate Comparison', 
               'Fairness Index Comparison', 'Stability (CoV) Comparison']
@@ -334,7 +867,7 @@ def run_part_a():
         row = idx // 2
         col = idx % 2
         ax = axes[row, col]
-        
+    
         bars = ax.bar(variants, data, color=colors, alpha=0.8, 
                      edgecolor='black', linewidth=1.5)
         ax.set_ylabel(ylabel, fontsize=13, fontweight='bold')
@@ -342,7 +875,7 @@ def run_part_a():
         ax.set_title(title, fontsize=15, fontweight='bold')
         ax.grid(axis='y', alpha=0.3, linestyle='--')
         ax.set_axisbelow(True)
-        
+    
         # Add value labels on top of bars
         for bar, val in zip(bars, data):
             height = bar.get_height()
@@ -353,12 +886,208 @@ def run_part_a():
     # Adjust layout to prevent overlap
     plt.tight_layout(pad=3.0)
     
+    plotting.save_figure(fig, img_path, dpi)
+
+
+def plot_part_b(img_path, variants, droptail_results, red_results, dpi=300):
+    """Part B 对比图: 每个指标一个子图, DropTail和RED并排"""
+    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+    
+    metrics = ['goodput', 'plr', 'fairness', 'cov']
+    titles = ['Goodput (Mbps)', 'Packet Loss Rate (%)', 'Fairness Index', 'Stability (CoV)']
+    ylabels = ['Goodput (Mbps)', 'PLR (%)', 'Fairness Index', 'CoV']
+    
+    for idx, (metric, title, ylabel) in enumerate(zip(metrics, titles, ylabels)):
+        row = idx // 2
+        col = idx % 2
+        ax = axes[row, col]
+        
+        dt_values = [droptail_results[v][metric] for v in variants]
+        red_values = [red_results[v][metric] for v in variants]
+        
+        x = np.arange(len(variants))
+        width = 0.35
+        
+        bars1 = ax.bar(x - width/2, dt_values, width, label='DropTail', 
+                      color='#1f77b4', alpha=0.8, edgecolor='black', linewidth=1.2)
+        bars2 = ax.bar(x + width/2, red_values, width, label='RED', 
+                      color='#ff7f0e', alpha=0.8, edgecolor='black', linewidth=1.2)
+        
+        ax.set_ylabel(ylabel, fontsize=12, fontweight='bold')
+        ax.set_xlabel('TCP Variants', fontsize=12, fontweight='bold')
+        ax.set_title(f'{title} Comparison: DropTail vs RED', fontsize=13, fontweight='bold')
+        ax.set_xticks(x)
+        ax.set_xticklabels(variants, fontsize=11)
+        ax.legend(fontsize=11, loc='best')
+        ax.grid(axis='y', alpha=0.3, linestyle='--')
+        ax.set_axisbelow(True)
+    
+    plt.tight_layout(pad=3.0)
+    
+    plotting.save_figure(fig, img_path, dpi)
+
+
+def plot_part_c(img_path, variant, runs, dpi=300):
+    """
+    Part C 可重复性图: 每个指标一个子图, 每次运行一根柱, 标出均值和置信区间
+    
+    参数:
+        runs: 指标名 -> 每次运行的值列表
+    """
+    # Plot 4 metrics: Goodput, PLR, Fairness, Stability (CoV)
+    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+    
+    # 准备所有4个指标的数据
+    num_runs = len(runs['goodput'])
+    x_pos = np.arange(num_runs)
+    all_data = [runs[metric] for metric in PART_C_METRICS]
+    intervals = part_c_intervals({metric: runs[metric] for metric in PART_C_METRICS})
+    all_means = [intervals[metric][0] for metric in PART_C_METRICS]
+    all_stds = [intervals[metric][1] for metric in PART_C_METRICS]
+    all_cis = [intervals[metric][2] for metric in PART_C_METRICS]
+    ci_label = f'{PART_C_CI_LEVEL:.0%} CI'
+    
+    titles = ['Goodput', 'Packet Loss Rate', 'Fairness Index (Jain)', 'Stability (CoV)']
+    ylabels = ['Goodput (Mbps)', 'PLR (%)', 'Fairness Index', 'CoV']
+    colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728']
+    formats = ['{:.3f}', '{:.4f}', '{:.4f}', '{:.4f}']
+    
+    for idx in range(4):
+        row = idx // 2
+        col = idx % 2
+        ax = axes[row, col]
+        
+        data = all_data[idx]
+        mean = all_means[idx]
+        ci = all_cis[idx]
+        std = all_stds[idx]
+        
+        # 绘制每次运行的柱状图
+        bars = ax.bar(x_pos, data, color=colors[idx], alpha=0.7, 
+                     edgecolor='black', linewidth=1.5, width=0.6)
+        
+        # 绘制均值线
+        ax.axhline(y=mean, color='red', linestyle='--', 
+                  linewidth=2.5, label=f'Mean: {formats[idx].format(mean)}')
+        
+        # 绘制置信区间区域
+        ax.fill_between([-0.5, num_runs - 0.5], 
+                       mean - ci, mean + ci,
+                       alpha=0.2, color='red', label=f'{ci_label}: ±{formats[idx].format(ci)}')
+        
+        ax.set_ylabel(ylabels[idx], fontsize=13, fontweight='bold')
+        ax.set_xlabel('Run Number', fontsize=13, fontweight='bold')
+        ax.set_title(f'{variant.upper()} - {titles[idx]} ({num_runs} Runs)', 
+                    fontsize=14, fontweight='bold')
+        ax.set_xticks(x_pos)
+        ax.set_xticklabels([f'Run {i+1}' for i in range(num_runs)], fontsize=11)
+        ax.legend(loc='best', fontsize=10)
+        ax.grid(axis='y', alpha=0.3, linestyle='--')
+        ax.set_axisbelow(True)
+        
+        # 动态调整Y轴范围以突出差异
+        if len(data) > 0 and max(data) > 0:
+            y_range = max(data) - min(data)
+            if y_range < mean * 0.1:  # 如果差异小于均值的10%
+                y_center = mean
+                y_span = max(std * 6, mean * 0.08)  # 显示均值8%的范围
+                ax.set_ylim([max(0, y_center - y_span), y_center + y_span])
+        
+        # 添加数值标签
+        for i, (bar, val) in enumerate(zip(bars, data)):
+            height = bar.get_height()
+            ax.text(bar.get_x() + bar.get_width()/2., height,
+                   formats[idx].format(val),
+                   ha='center', va='bottom', fontsize=9, fontweight='bold')
+    
+    plt.tight_layout(pad=2.0)
+    
+    plotting.save_figure(fig, img_path, dpi)
+
+
+def run_part_a(pipe=None, plotter=None, stats=None):
+    """
+    Part A: 分析四种TCP变体的性能
+    
+    参数:
+        pipe: pipeline.Pipeline, 只重新执行输入变化的步骤 (默认全部执行)
+        plotter: plotting.Plotter, 执行绘图任务 (默认在当前进程中立即绘制)
+        stats: instrument.Stats, 记录各阶段的耗时和计数器
+    """
+    pipe = pipe or pipeline.Pipeline(None)
+    stats = stats or instrument.Stats()
+    plotter = plotter or plotting.Plotter(deferred=False, stats=stats)
+    analyze = functools.partial(analyze_traces, stats=stats)
+    print("=" * 60)
+    print("Part A: TCP变体分析 (DropTail)")
+    print("=" * 60)
+    
+    variants = ['reno', 'cubic', 'vegas', 'yeah']
+    results = {}
+    
+    # 1. 并行解析所有trace文件 (输入未变化的trace直接使用上次的摘要)
+    with stats.stage('analyze'):
+        summaries = pipe.summaries(
+            [(variant, find_trace(f'{variant}Trace.tr'), variant) for variant in variants],
+            analyze, extras=('jitter',))
+    
+    for variant in variants:
+        print(f"\n处理 {variant.upper()}...")
+        results[variant] = _metrics_of(summaries[variant])
+        
+        print(f"  吞吐量: {results[variant]['goodput']:.2f} Mbps")
+        print(f"  PLR: {results[variant]['plr']:.4f}%")
+        print(f"  公平性: {results[variant]['fairness']:.4f}")
+        print(f"  稳定性(CoV): {results[variant]['cov']:.4f}")
+    
+    # 2. 打印表格
+    print("\n表格 1: 每个流的总吞吐量和包丢失率")
+    print("-" * 60)
+    print(f"{'变体':<10} {'吞吐量 (Mbps)':<20} {'PLR (%)':<15}")
+    print("-" * 60)
+    for variant in variants:
+        goodput = results[variant]['goodput']
+        plr = results[variant]['plr']
+        print(f"{variant:<10} {goodput:<20.2f} {plr:<15.4f}")
+    print("-" * 60)
+    
+    # 保存到CSV
+    csv_path = 'partA_goodput_plr.csv'
+    if os.path.exists('comp3014j'):
+        csv_path = 'comp3014j/partA_goodput_plr.csv'
+    
+    def write_csv(csv_path):
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Variant', 'Goodput (Mbps)', 'PLR (%)'])
+            for variant in variants:
+                writer.writerow([
+                    variant,
+                    f"{results[variant]['goodput']:.2f}",
+                    f"{results[variant]['plr']:.4f}"
+                ])
+    
+    print()
+    with stats.stage('csv'):
+        _output_step(pipe, csv_path, results, write_csv, 'CSV')
+    
+    # 每条流和每条链路的抖动 (RFC 3550)
+    jitter_rows = {variant: summaries[variant]['jitter'] for variant in variants}
+    jitter_path = os.path.join(os.path.dirname(csv_path), 'partA_jitter.csv')
+    with stats.stage('csv'):
+        _output_step(pipe, jitter_path, jitter_rows,
+                     lambda path: jitter.write_csv(path, jitter_rows), 'CSV')
+    
+    # 3. 绘制对比图 (4个子图: 吞吐量、PLR、公平性、稳定性)
     img_path = 'partA_comparison.png'
     if os.path.exists('comp3014j'):
         img_path = 'comp3014j/partA_comparison.png'
-    plt.savefig(img_path, dpi=300, bbox_inches='tight')
-    plt.close()
-    print(f"\n图表已保存: {img_path}")
+    
+    goodputs = [results[v]['goodput'] for v in variants]
+    
+    print()
+    with stats.stage('figure'):
+        _figure_step(pipe, plotter, img_path, results, plot_part_a, variants, results)
     
     # 4. 公平性分析
     print("\n表格 2: Jain公平性指数 (最后1/3时间)")
@@ -423,10 +1152,19 @@ def run_part_a():
     print(f"特定拓扑和流量模式下提供了最优的性能平衡。")
 
 
-def run_part_b():
+def run_part_b(pipe=None, plotter=None, stats=None):
     """
     Part B: DropTail vs RED队列算法比较
+    
+    参数:
+        pipe: pipeline.Pipeline, 只重新执行输入变化的步骤 (默认全部执行)
+        plotter: plotting.Plotter, 执行绘图任务 (默认在当前进程中立即绘制)
+        stats: instrument.Stats, 记录各阶段的耗时和计数器
     """
+    pipe = pipe or pipeline.Pipeline(None)
+    stats = stats or instrument.Stats()
+    plotter = plotter or plotting.Plotter(deferred=False, stats=stats)
+    analyze = functools.partial(analyze_traces, stats=stats)
     print("\n\n" + "=" * 60)
     print("Part B: DropTail vs RED 队列算法比较")
     print("=" * 60)
@@ -436,48 +1174,14 @@ def run_part_b():
     
     variants = ['reno', 'cubic', 'vegas', 'yeah']
     
-    # DropTail结果 (默认)
-    droptail_results = {}
-    for variant in variants:
-        trace_file = f'comp3014j/{variant}Trace.tr'
-        if not os.path.exists(trace_file):
-            trace_file = f'{variant}Trace.tr'
-        
-        print(f"\n处理 {variant.upper()} (DropTail)...")
-        analyzer = TCPAnalyzer(trace_file, variant)
-        analyzer.parse_trace()
-        
-        droptail_results[variant] = {
-            'goodput': analyzer.get_total_goodput(),
-            'plr': analyzer.get_plr(),
-            'fairness': analyzer.get_fairness_index(),
-            'cov': analyzer.get_stability_cov()
-        }
-    
     # RED结果 (假设文件名为 *Trace_red.tr)
-    red_results = {}
     red_available = True
     for variant in variants:
-        trace_file = f'comp3014j/{variant}Trace_red.tr'
-        if not os.path.exists(trace_file):
-            trace_file = f'{variant}Trace_red.tr'
-        
-        if not os.path.exists(trace_file):
+        if not os.path.exists(find_trace(f'{variant}Trace_red.tr')):
             print(f"\n警告: 未找到RED trace文件")
             print(f"请先运行带RED队列的仿真,或使用 run_all.sh/run_all.bat 脚本")
             red_available = False
             break
-        
-        print(f"处理 {variant.upper()} (RED)...")
-        analyzer = TCPAnalyzer(trace_file, variant)
-        analyzer.parse_trace()
-        
-        red_results[variant] = {
-            'goodput': analyzer.get_total_goodput(),
-            'plr': analyzer.get_plr(),
-            'fairness': analyzer.get_fairness_index(),
-            'cov': analyzer.get_stability_cov()
-        }
     
     if not red_available:
         print("\n请按照以下步骤生成RED trace文件:")
@@ -486,6 +1190,21 @@ def run_part_b():
         print("3. 将生成的trace文件重命名为 *Trace_red.tr")
         return
     
+    # DropTail和RED的8个trace一起并行分析
+    tasks = []
+    for variant in variants:
+        tasks.append((('DropTail', variant), find_trace(f'{variant}Trace.tr'), variant))
+        tasks.append((('RED', variant), find_trace(f'{variant}Trace_red.tr'), variant))
+    with stats.stage('analyze'):
+        summaries = pipe.summaries(tasks, analyze, extras=('queue',))
+    
+    droptail_results = {}
+    red_results = {}
+    for variant in variants:
+        print(f"处理 {variant.upper()} (DropTail / RED)...")
+        droptail_results[variant] = _metrics_of(summaries[('DropTail', variant)])
+        red_results[variant] = _metrics_of(summaries[('RED', variant)])
+    
     # 计算平均值
     dt_avg_goodput = np.mean([droptail_results[v]['goodput'] for v in variants])
     dt_avg_plr = np.mean([droptail_results[v]['plr'] for v in variants])
@@ -508,76 +1227,83 @@ def run_part_b():
     print(f"{'平均稳定性(CoV)':<20} {dt_avg_cov:<25.4f} {red_avg_cov:<25.4f}")
     print("-" * 80)
     
-    # Plot comparison charts
-    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
-    
-    metrics = ['goodput', 'plr', 'fairness', 'cov']
-    titles = ['Goodput (Mbps)', 'Packet Loss Rate (%)', 'Fairness Index', 'Stability (CoV)']
-    ylabels = ['Goodput (Mbps)', 'PLR (%)', 'Fairness Index', 'CoV']
-    
-    for idx, (metric, title, ylabel) in enumerate(zip(metrics, titles, ylabels)):
-        row = idx // 2
-        col = idx % 2
-        ax = axes[row, col]
-        
-        dt_values = [droptail_results[v][metric] for v in variants]
-        red_values = [red_results[v][metric] for v in variants]
-        
-        x = np.arange(len(variants))
-        width = 0.35
-        
-        bars1 = ax.bar(x - width/2, dt_values, width, label='DropTail', 
-                      color='#1f77b4', alpha=0.8, edgecolor='black', linewidth=1.2)
-        bars2 = ax.bar(x + width/2, red_values, width, label='RED', 
-                      color='#ff7f0e', alpha=0.8, edgecolor='black', linewidth=1.2)
-        
-        ax.set_ylabel(ylabel, fontsize=12, fontweight='bold')
-        ax.set_xlabel('TCP Variants', fontsize=12, fontweight='bold')
-        ax.set_title(f'{title} Comparison: DropTail vs RED', fontsize=13, fontweight='bold')
-        ax.set_xticks(x)
-        ax.set_xticklabels(variants, fontsize=11)
-        ax.legend(fontsize=11, loc='best')
-        ax.grid(axis='y', alpha=0.3, linestyle='--')
-        ax.set_axisbelow(True)
-    
-    plt.tight_layout(pad=3.0)
+    # 图表和CSV都只依赖两种队列下的指标
+    inputs = {'DropTail': droptail_results, 'RED': red_results}
     
+    # Plot comparison charts
     img_path = 'partB_comparison.png'
     if os.path.exists('comp3014j'):
         img_path = 'comp3014j/partB_comparison.png'
-    plt.savefig(img_path, dpi=300, bbox_inches='tight')
-    plt.close()
-    print(f"\n图表已保存: {img_path}")
+    
+    print()
+    with stats.stage('figure'):
+        _figure_step(pipe, plotter, img_path, inputs, plot_part_b, variants, droptail_results, red_results)
     
     # 保存Part B的CSV数据
     csv_path = 'partB_droptail_vs_red.csv'
     if os.path.exists('comp3014j'):
         csv_path = 'comp3014j/partB_droptail_vs_red.csv'
     
-    with open(csv_path, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(['Variant', 'Queue', 'Goodput (Mbps)', 'PLR (%)', 'Fairness Index', 'Stability (CoV)'])
-        for variant in variants:
-            # DropTail
-            writer.writerow([
-                variant,
-                'DropTail',
-                f"{droptail_results[variant]['goodput']:.2f}",
-                f"{droptail_results[variant]['plr']:.4f}",
-                f"{droptail_results[variant]['fairness']:.4f}",
-                f"{droptail_results[variant]['cov']:.4f}"
-            ])
-            # RED
-            writer.writerow([
-                variant,
-                'RED',
-                f"{red_results[variant]['goodput']:.2f}",
-                f"{red_results[variant]['plr']:.4f}",
-                f"{red_results[variant]['fairness']:.4f}",
-                f"{red_results[variant]['cov']:.4f}"
-            ])
+    def write_csv(csv_path):
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Variant', 'Queue', 'Goodput (Mbps)', 'PLR (%)', 'Fairness Index', 'Stability (CoV)'])
+            for variant in variants:
+                # DropTail
+                writer.writerow([
+                    variant,
+                    'DropTail',
+                    f"{droptail_results[variant]['goodput']:.2f}",
+                    f"{droptail_results[variant]['plr']:.4f}",
+                    f"{droptail_results[variant]['fairness']:.4f}",
+                    f"{droptail_results[variant]['cov']:.4f}"
+                ])
+                # RED
+                writer.writerow([
+                    variant,
+                    'RED',
+                    f"{red_results[variant]['goodput']:.2f}",
+                    f"{red_results[variant]['plr']:.4f}",
+                    f"{red_results[variant]['fairness']:.4f}",
+                    f"{red_results[variant]['cov']:.4f}"
+                ])
+    
+    with stats.stage('csv'):
+        _output_step(pipe, csv_path, inputs, write_csv, 'CSV')
+    
+    # 瓶颈队列: 由 '+' / '-' / 'd' 事件重建的队列长度、排队时间和丢包时的队列状态
+    queues = {queue: {variant: summaries[(queue, variant)]['queue'] for variant in variants}
+              for queue in ('DropTail', 'RED')}
+    print("\n表格: 瓶颈队列 (四个变体的平均)")
+    print("-" * 80)
+    print(f"{'指标':<20} {'DropTail':<25} {'RED':<25}")
+    print("-" * 80)
+    for label, key, scale, fmt in (('平均队列长度 (包)', 'mean_length', 1, '.3f'),
+                                   ('队列满的时间比例', 'full_fraction', 1, '.4f'),
+                                   ('平均排队时间 (ms)', 'mean_sojourn', 1000, '.3f'),
+                                   ('队列满时的丢包', 'drops_at_full', 1, '.1f'),
+                                   ('提前丢包', 'early_drops', 1, '.1f')):
+        dt_value = np.mean([queues['DropTail'][v][key] for v in variants]) * scale
+        red_value = np.mean([queues['RED'][v][key] for v in variants]) * scale
+        print(f"{label:<20} {dt_value:<25{fmt}} {red_value:<25{fmt}}")
+    print("-" * 80)
+    
+    queue_csv_path = os.path.join(os.path.dirname(csv_path), 'partB_queue.csv')
+    queue_fields = ['link', 'limit', 'arrivals', 'drops', 'drops_at_full', 'early_drops',
+                    'mean_length', 'max_length', 'full_fraction', 'mean_sojourn', 'sojourn_p99']
     
-    print(f"CSV已保存: {csv_path}")
+    def write_queue_csv(queue_csv_path):
+        with open(queue_csv_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Variant', 'Queue'] + queue_fields)
+            for variant in variants:
+                for queue in ('DropTail', 'RED'):
+                    row = queues[queue][variant]
+                    writer.writerow([variant, queue] + [f"{row[field]:.6f}" if isinstance(row[field], float)
+                                                        else row[field] for field in queue_fields])
+    
+    with stats.stage('csv'):
+        _output_step(pipe, queue_csv_path, queues, write_queue_csv, 'CSV')
     
     # 分析和解释
     print("\n解释:")
@@ -592,83 +1318,87 @@ def run_part_b():
     print(f"3. 较高的队列延迟")
 
 
-def run_part_c():
+def run_part_c(pipe=None, plotter=None, stats=None):
     """
     Part C: 可重复性测试
+    
+    参数:
+        pipe: pipeline.Pipeline, 只重新执行输入变化的步骤 (默认全部执行)
+        plotter: plotting.Plotter, 执行绘图任务 (默认在当前进程中立即绘制)
+        stats: instrument.Stats, 记录各阶段的耗时和计数器
     """
+    pipe = pipe or pipeline.Pipeline(None)
+    stats = stats or instrument.Stats()
+    plotter = plotter or plotting.Plotter(deferred=False, stats=stats)
+    analyze = functools.partial(analyze_traces, stats=stats)
     print("\n\n" + "=" * 60)
     print("Part C: 可重复性测试")
     print("=" * 60)
     
     print("\n说明: Part C需要运行多次仿真(不同随机种子)")
-    print("请使用提供的shell脚本来生成多次运行的结果。")
-    print("\n示例: 对于cubic变体,运行5次:")
-    print("  运行1: cubicTrace_run1.tr")
-    print("  运行2: cubicTrace_run2.tr")
-    print("  ...")
-    print("  运行5: cubicTrace_run5.tr")
-    
-    # 检查是否有多次运行的文件
-    variant = 'yeah'  # 选择yeah作为示例
-    num_runs = 5
-    
-    goodputs = []
-    plrs = []
-    fairness_values = []
-    cov_values = []
-    
-    all_runs_available = True
-    
-    for run_idx in range(1, num_runs + 1):
-        trace_file = f'comp3014j/{variant}Trace_run{run_idx}.tr'
-        if not os.path.exists(trace_file):
-            trace_file = f'{variant}Trace_run{run_idx}.tr'
-        
-        if not os.path.exists(trace_file):
-            all_runs_available = False
-            break
-        
-        print(f"处理运行 {run_idx}/{num_runs}...")
-        analyzer = TCPAnalyzer(trace_file, variant)
-        analyzer.parse_trace()
-        
-        goodputs.append(analyzer.get_total_goodput())
-        plrs.append(analyzer.get_plr())
-        fairness_values.append(analyzer.get_fairness_index())
-        cov_values.append(analyzer.get_stability_cov())
-    
-    if not all_runs_available:
-        print(f"\n警告: 未找到所有运行的trace文件")
-        print(f"需要文件: {variant}Trace_run1.tr 到 {variant}Trace_run{num_runs}.tr")
+    print("请使用 generate_runs.py 生成多次运行的结果, 例如:")
+    print(f"  python3 generate_runs.py --variant {PART_C_VARIANT}              固定5次")
+    print(f"  python3 generate_runs.py --variant {PART_C_VARIANT} --adaptive   运行到置信区间收敛")
+    print(f"输出: {PART_C_VARIANT}Trace_run1.tr, {PART_C_VARIANT}Trace_run2.tr, ...")
+    
+    # 检查有多少次运行的文件
+    variant = PART_C_VARIANT
+    runs = find_runs(variant)
+    num_runs = len(runs)
+    
+    if num_runs < 2:
+        print(f"\n警告: 至少需要2次运行的trace文件才能计算置信区间, 找到 {num_runs} 个")
+        print(f"需要文件: {variant}Trace_run1.tr, {variant}Trace_run2.tr, ...")
         return
     
-    # 计算统计量
-    goodput_mean = np.mean(goodputs)
-    goodput_std = np.std(goodputs)
-    goodput_ci = 1.96 * goodput_std  # 95% 置信区间
-    
-    plr_mean = np.mean(plrs)
-    plr_std = np.std(plrs)
-    plr_ci = 1.96 * plr_std
+    print(f"并行处理 {num_runs} 次运行...")
+    with stats.stage('analyze'):
+        summaries = pipe.summaries(
+            [(run_idx, trace_file, variant) for run_idx, trace_file in runs.items()],
+            analyze)
+    
+    run_numbers = list(runs)
+    goodputs = [summaries[run_idx]['goodput'] for run_idx in run_numbers]
+    plrs = [summaries[run_idx]['plr'] for run_idx in run_numbers]
+    fairness_values = [summaries[run_idx]['fairness'] for run_idx in run_numbers]
+    cov_values = [summaries[run_idx]['cov'] for run_idx in run_numbers]
+    
+    # 计算统计量: 样本标准差和 t 分布 (或 bootstrap) 的置信区间
+    inputs = {'goodput': goodputs, 'plr': plrs, 'fairness': fairness_values, 'cov': cov_values}
+    intervals = part_c_intervals(inputs)
+    goodput_mean, goodput_std, goodput_ci = intervals['goodput']
+    plr_mean, plr_std, plr_ci = intervals['plr']
+    fairness_mean, fairness_std, fairness_ci = intervals['fairness']
+    cov_mean, cov_std, cov_ci = intervals['cov']
+    ci_label = f'{PART_C_CI_LEVEL:.0%} CI'
     
     # 打印结果
-    print(f"\n{variant.upper()} 变体 - {num_runs}次运行的统计结果:")
+    print(f"\n{variant.upper()} 变体 - {num_runs}次运行的统计结果 ({PART_C_CI_METHOD} 置信区间):")
     print("-" * 60)
-    print(f"{'指标':<20} {'均值':<15} {'标准差':<15} {'95% CI':<15}")
+    print(f"{'指标':<20} {'均值':<15} {'标准差':<15} {ci_label:<15}")
     print("-" * 60)
     print(f"{'吞吐量 (Mbps)':<20} {goodput_mean:<15.3f} {goodput_std:<15.3f} ±{goodput_ci:<15.3f}")
     print(f"{'PLR (%)':<20} {plr_mean:<15.4f} {plr_std:<15.4f} ±{plr_ci:<15.4f}")
     print("-" * 60)
     
+    # 置信区间是否已经足够窄
+    wide = [metric for metric, (mean, _, half) in intervals.items()
+            if replication.relative_half_width(mean, half) >= PART_C_TARGET]
+    if wide:
+        print(f"\n置信区间半宽超过均值的 {PART_C_TARGET:.0%}: {', '.join(wide)}")
+        print(f"  增加运行次数: python3 generate_runs.py --variant {variant} --adaptive")
+    else:
+        print(f"\n所有指标的置信区间半宽都在均值的 {PART_C_TARGET:.0%} 以内")
+    
     # 打印每次运行的详细数据
     print(f"\n详细数据 ({num_runs}次运行):")
     print("-" * 80)
     print(f"{'运行':<10} {'Goodput (Mbps)':<20} {'PLR (%)':<20} {'差异':<20}")
     print("-" * 80)
-    for i in range(num_runs):
+    for i, run_idx in enumerate(run_numbers):
         goodput_diff = goodputs[i] - goodput_mean
         plr_diff = plrs[i] - plr_mean
-        print(f"Run {i+1:<5} {goodputs[i]:<20.4f} {plrs[i]:<20.4f} "
+        print(f"Run {run_idx:<5} {goodputs[i]:<20.4f} {plrs[i]:<20.4f} "
               f"G:{goodput_diff:+.4f} P:{plr_diff:+.4f}")
     print("-" * 80)
     
@@ -680,170 +1410,133 @@ def run_part_c():
     print(f"  Goodput: {min(goodputs):.4f} - {max(goodputs):.4f} Mbps (范围: {goodput_range:.4f})")
     print(f"  PLR: {min(plrs):.4f} - {max(plrs):.4f}% (范围: {plr_range:.4f})")
     
-    # 计算所有指标的统计量
-    fairness_mean = np.mean(fairness_values)
-    fairness_std = np.std(fairness_values)
-    fairness_ci = 1.96 * fairness_std
-    
-    cov_mean = np.mean(cov_values)
-    cov_std = np.std(cov_values)
-    cov_ci = 1.96 * cov_std
-    
-    # Plot 4 metrics: Goodput, PLR, Fairness, Stability (CoV)
-    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
-    
-    # 准备所有4个指标的数据
-    x_pos = np.arange(num_runs)
-    all_data = [goodputs, plrs, fairness_values, cov_values]
-    all_means = [goodput_mean, plr_mean, fairness_mean, cov_mean]
-    all_cis = [goodput_ci, plr_ci, fairness_ci, cov_ci]
-    all_stds = [goodput_std, plr_std, fairness_std, cov_std]
-    
-    titles = ['Goodput', 'Packet Loss Rate', 'Fairness Index (Jain)', 'Stability (CoV)']
-    ylabels = ['Goodput (Mbps)', 'PLR (%)', 'Fairness Index', 'CoV']
-    colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728']
-    formats = ['{:.3f}', '{:.4f}', '{:.4f}', '{:.4f}']
-    
-    for idx in range(4):
-        row = idx // 2
-        col = idx % 2
-        ax = axes[row, col]
-        
-        data = all_data[idx]
-        mean = all_means[idx]
-        ci = all_cis[idx]
-        std = all_stds[idx]
-        
-        # 绘制5次运行的柱状图
-        bars = ax.bar(x_pos, data, color=colors[idx], alpha=0.7, 
-                     edgecolor='black', linewidth=1.5, width=0.6)
-        
-        # 绘制均值线
-        ax.axhline(y=mean, color='red', linestyle='--', 
-                  linewidth=2.5, label=f'Mean: {formats[idx].format(mean)}')
-        
-        # 绘制95% CI区域
-        ax.fill_between([-0.5, num_runs - 0.5], 
-                       mean - ci, mean + ci,
-                       alpha=0.2, color='red', label=f'95% CI: ±{formats[idx].format(ci)}')
-        
-        ax.set_ylabel(ylabels[idx], fontsize=13, fontweight='bold')
-        ax.set_xlabel('Run Number', fontsize=13, fontweight='bold')
-        ax.set_title(f'{variant.upper()} - {titles[idx]} (5 Runs)', 
-                    fontsize=14, fontweight='bold')
-        ax.set_xticks(x_pos)
-        ax.set_xticklabels([f'Run {i+1}' for i in range(num_runs)], fontsize=11)
-        ax.legend(loc='best', fontsize=10)
-        ax.grid(axis='y', alpha=0.3, linestyle='--')
-        ax.set_axisbelow(True)
-        
-        # 动态调整Y轴范围以突出差异
-        if len(data) > 0 and max(data) > 0:
-            y_range = max(data) - min(data)
-            if y_range < mean * 0.1:  # 如果差异小于均值的10%
-                y_center = mean
-                y_span = max(std * 6, mean * 0.08)  # 显示均值8%的范围
-                ax.set_ylim([max(0, y_center - y_span), y_center + y_span])
-        
-        # 添加数值标签
-        for i, (bar, val) in enumerate(zip(bars, data)):
-            height = bar.get_height()
-            ax.text(bar.get_x() + bar.get_width()/2., height,
-                   formats[idx].format(val),
-                   ha='center', va='bottom', fontsize=9, fontweight='bold')
-    
-    plt.tight_layout(pad=2.0)
+    # 图表和CSV都只依赖每次运行的指标和置信区间的设置
+    fingerprint = dict(inputs, runs=run_numbers, ci=[PART_C_CI_METHOD, PART_C_CI_LEVEL])
     
     img_path = 'partC_reproducibility.png'
     if os.path.exists('comp3014j'):
         img_path = 'comp3014j/partC_reproducibility.png'
-    plt.savefig(img_path, dpi=300, bbox_inches='tight')
-    plt.close()
-    print(f"\n图表已保存: {img_path}")
+    
+    print()
+    with stats.stage('figure'):
+        _figure_step(pipe, plotter, img_path, fingerprint, plot_part_c, variant, inputs)
     
     # 保存Part C的CSV数据
     csv_path = 'partC_reproducibility.csv'
     if os.path.exists('comp3014j'):
         csv_path = 'comp3014j/partC_reproducibility.csv'
     
-    with open(csv_path, 'w', newline='') as f:
-        writer = csv.writer(f)
-        # 写入表头
-        writer.writerow(['Run', 'Goodput (Mbps)', 'PLR (%)', 'Fairness Index', 'Stability (CoV)'])
-        
-        # 写入每次运行的数据
-        for i in range(num_runs):
+    def write_csv(csv_path):
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            # 写入表头
+            writer.writerow(['Run', 'Goodput (Mbps)', 'PLR (%)', 'Fairness Index', 'Stability (CoV)'])
+            
+            # 写入每次运行的数据
+            for i, run_idx in enumerate(run_numbers):
+                writer.writerow([
+                    f'Run {run_idx}',
+                    f"{goodputs[i]:.4f}",
+                    f"{plrs[i]:.4f}",
+                    f"{fairness_values[i]:.4f}",
+                    f"{cov_values[i]:.4f}"
+                ])
+            
+            # 写入统计数据
+            writer.writerow([])  # 空行
+            writer.writerow(['Statistic', 'Goodput (Mbps)', 'PLR (%)', 'Fairness Index', 'Stability (CoV)'])
             writer.writerow([
-                f'Run {i+1}',
-                f"{goodputs[i]:.4f}",
-                f"{plrs[i]:.4f}",
-                f"{fairness_values[i]:.4f}",
-                f"{cov_values[i]:.4f}"
+                'Mean',
+                f"{goodput_mean:.4f}",
+                f"{plr_mean:.4f}",
+                f"{fairness_mean:.4f}",
+                f"{cov_mean:.4f}"
             ])
-        
-        # 写入统计数据
-        writer.writerow([])  # 空行
-        writer.writerow(['Statistic', 'Goodput (Mbps)', 'PLR (%)', 'Fairness Index', 'Stability (CoV)'])
-        writer.writerow([
-            'Mean',
-            f"{goodput_mean:.4f}",
-            f"{plr_mean:.4f}",
-            f"{fairness_mean:.4f}",
-            f"{cov_mean:.4f}"
-        ])
-        writer.writerow([
-            'Std Dev',
-            f"{goodput_std:.4f}",
-            f"{plr_std:.4f}",
-            f"{fairness_std:.4f}",
-            f"{cov_std:.4f}"
-        ])
-        writer.writerow([
-            '95% CI',
-            f"±{goodput_ci:.4f}",
-            f"±{plr_ci:.4f}",
-            f"±{fairness_ci:.4f}",
-            f"±{cov_ci:.4f}"
-        ])
-        writer.writerow([
-            'Min',
-            f"{min(goodputs):.4f}",
-            f"{min(plrs):.4f}",
-            f"{min(fairness_values):.4f}",
-            f"{min(cov_values):.4f}"
-        ])
-        writer.writerow([
-            'Max',
-            f"{max(goodputs):.4f}",
-            f"{max(plrs):.4f}",
-            f"{max(fairness_values):.4f}",
-            f"{max(cov_values):.4f}"
-        ])
-        writer.writerow([
-            'Range',
-            f"{max(goodputs) - min(goodputs):.4f}",
-            f"{max(plrs) - min(plrs):.4f}",
-            f"{max(fairness_values) - min(fairness_values):.4f}",
-            f"{max(cov_values) - min(cov_values):.4f}"
-        ])
-    
-    print(f"CSV已保存: {csv_path}")
-
-
-def main():
-    """主函数"""
+            writer.writerow([
+                'Std Dev',
+                f"{goodput_std:.4f}",
+                f"{plr_std:.4f}",
+                f"{fairness_std:.4f}",
+                f"{cov_std:.4f}"
+            ])
+            writer.writerow([
+                ci_label,
+                f"±{goodput_ci:.4f}",
+                f"±{plr_ci:.4f}",
+                f"±{fairness_ci:.4f}",
+                f"±{cov_ci:.4f}"
+            ])
+            writer.writerow([
+                'Min',
+                f"{min(goodputs):.4f}",
+                f"{min(plrs):.4f}",
+                f"{min(fairness_values):.4f}",
+                f"{min(cov_values):.4f}"
+            ])
+            writer.writerow([
+                'Max',
+                f"{max(goodputs):.4f}",
+                f"{max(plrs):.4f}",
+                f"{max(fairness_values):.4f}",
+                f"{max(cov_values):.4f}"
+            ])
+            writer.writerow([
+                'Range',
+                f"{max(goodputs) - min(goodputs):.4f}",
+                f"{max(plrs) - min(plrs):.4f}",
+                f"{max(fairness_values) - min(fairness_values):.4f}",
+                f"{max(cov_values) - min(cov_values):.4f}"
+            ])
+    
+    with stats.stage('csv'):
+        _output_step(pipe, csv_path, fingerprint, write_csv, 'CSV')
+
+
+def main(force=False, profile=None, profile_stages=None):
+    """
+    主函数
+    
+    参数:
+        force: 忽略增量分析的状态, 重新分析所有trace并重写所有输出
+        profile: None、'cprofile' 或 'tracemalloc', 对各阶段做性能剖析
+        profile_stages: 只剖析名称中包含这些片段的阶段 (默认每个Part一个结果文件)
+    """
     print("\n" + "=" * 60)
     print("TCP性能分析器 - analyser3.py")
     print("=" * 60)
     
+    # 每一步的输入指纹记录在输出目录的状态文件中, 只重新执行输入变化的步骤
+    output_dir = 'comp3014j' if os.path.exists('comp3014j') else '.'
+    settings = analysis_settings()
+    pipe = pipeline.Pipeline(os.path.join(output_dir, pipeline.STATE_FILE), settings, force=force)
+    
+    # 各阶段的耗时和计数器写入输出目录的JSON报告
+    stats = instrument.Stats(profile, os.path.join(output_dir, instrument.PROFILE_DIR), profile_stages)
+    
+    # 图表在单独的进程中绘制, 与后面Part的trace分析重叠
+    plotter = plotting.Plotter(deferred=True, stats=stats)
+    
     # Part A: TCP变体分析
-    run_part_a()
+    with stats.stage('partA'):
+        run_part_a(pipe, plotter, stats)
     
     # Part B: DropTail vs RED
-    run_part_b()
+    with stats.stage('partB'):
+        run_part_b(pipe, plotter, stats)
     
     # Part C: 可重复性
-    run_part_c()
+    with stats.stage('partC'):
+        run_part_c(pipe, plotter, stats)
+    
+    with stats.stage('wait_figures'):
+        plotter.wait()
+    print(f"\n增量分析: {pipe.report()}")
+    
+    report_path = os.path.join(output_dir, REPORT_FILE)
+    stats.write_report(report_path, settings={**settings, 'force': force,
+                                              'figure_format': FIGURE_FORMAT})
+    print(f"\n各阶段耗时 (报告: {report_path}):")
+    print(stats.summary())
     
     print("\n\n" + "=" * 60)
     print("分析完成!")
@@ -851,15 +1544,25 @@ def main():
     print("\n生成的文件:")
     print("\n  CSV数据文件:")
     print("    - partA_goodput_plr.csv         (Part A数据)")
+    print("    - partA_jitter.csv              (Part A: 每条流和链路的抖动)")
     print("    - partB_droptail_vs_red.csv     (Part B数据)")
+    print("    - partB_queue.csv               (Part B: 瓶颈队列)")
     print("    - partC_reproducibility.csv     (Part C数据)")
-    print("\n  图表文件:")
-    print("    - partA_comparison.png          (Part A: 4个子图)")
-    print("    - partB_comparison.png          (Part B: 4个子图)")
-    print("    - partC_reproducibility.png     (Part C: 4个子图)")
+    if FIGURE_FORMAT != 'none':
+        print("\n  图表文件:")
+        print(f"    - partA_comparison.{FIGURE_FORMAT:<13}(Part A: 4个子图)")
+        print(f"    - partB_comparison.{FIGURE_FORMAT:<13}(Part B: 4个子图)")
+        print(f"    - partC_reproducibility.{FIGURE_FORMAT:<8}(Part C: 4个子图)")
     print("=" * 60)
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='分析Part A/B/C的trace并生成CSV和图表')
+    parser.add_argument('--force', action='store_true', help='忽略增量分析的状态, 全部重新分析')
+    parser.add_argument('--profile', choices=instrument.PROFILERS,
+                        help='对各阶段做性能剖析, 结果写入输出目录的 profiles/')
+    parser.add_argument('--profile-stage', action='append', dest='profile_stages', metavar='NAME',
+                        help='只剖析名称中包含NAME的阶段 (例如 parse_trace), 可重复')
+    args = parser.parse_args()
+    main(force=args.force, profile=args.profile, profile_stages=args.profile_stages)
 
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+benchmark.py - trace解析和指标计算的基准测试
+
+用 trace_gen.py 生成指定大小的合成trace (或使用已有的trace), 对每个用例计时:
+
+- TCPAnalyzer.parse_trace 的各个引擎 (python / numpy / mmap / 缓存 / 并行)
+- TCPAnalyzer 的各个指标方法, 滑动窗口吞吐量, 摘要索引的构建和查询, 端到端时延, 抖动, 队列重建
+- analyser.py 的 splitFile / split* / extractMetrics
+
+每个用例在单独的进程中运行 (峰值RSS互不影响), 报告:
+
+    seconds            多次运行中最快的一次 (秒)
+    lines_per_sec      扫描trace的用例: 每秒处理的行数
+    rss_before_mb      准备阶段 (例如先解析trace) 结束后的峰值RSS
+    peak_rss_mb        用例结束后的峰值RSS
+    tracemalloc_peak_mb, alloc_blocks
+                       使用 --tracemalloc 时额外运行一次: tracemalloc 记录的内存分配峰值,
+                       以及运行后比运行前多出的Python内存块数 (sys.getallocatedblocks)
+
+结果保存为JSON, 用 --compare 与之前 (例如上一个提交) 的结果对比,
+变慢超过 --threshold 的用例会被标出, 并以返回码1退出。
+
+用法:
+    python benchmark.py --size 10MB 100MB -o bench.json
+    python benchmark.py --size 10MB --cases parse_trace --compare bench.json
+    python benchmark.py --trace cubicTrace.tr --repeat 5
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import analyser
+import delay
+import jitter
+import queue_state
+import trace_cache
+import trace_gen
+import trace_index
+import trace_io
+from analyser3 import TCPAnalyzer
+
+RESULTS_VERSION = 1
+
+# 默认的回归阈值: 比对照慢10%以上
+DEFAULT_THRESHOLD = 0.10
+
+
+# ---- 用例 ----
+# 每个用例是 (setup, run, 是否扫描整个trace):
+# setup(trace_file) 返回状态, 不计时; run(state) 计时
+
+def _analyzer(trace_file):
+    return TCPAnalyzer(trace_file, 'bench', flows=None)
+
+
+def _parsed(trace_file):
+    analyzer = _analyzer(trace_file)
+    analyzer.parse_trace(engine='mmap')
+    return analyzer
+
+
+def _parse_case(**kwargs):
+    return (lambda trace_file: trace_file,
+            lambda trace_file: _analyzer(trace_file).parse_trace(**kwargs),
+            True)
+
+
+def _cached(trace_file):
+    trace_cache.read_columns_cached(trace_file)
+    return trace_file
+
+
+def _metric_case(method, *args, **kwargs):
+    return (_parsed, lambda analyzer: getattr(analyzer, method)(*args, **kwargs), False)
+
+
+def _sliding(analyzer):
+    analyzer._sliding.clear()
+    analyzer.sliding_throughput(window=0.1, step=0.01)
+
+
+def _index_queries(index):
+    for start in range(0, max(1, int(index.duration)) - 20, 10):
+        index.goodput(start, start + 20)
+        index.plr(start, start + 20)
+        index.fairness(start, start + 20)
+
+
+def _split_case(name):
+    split = getattr(analyser, name)
+    return {
+        name: (analyser.splitFile, split, True),
+        f'{name}[mmap]': (analyser.mapFile, split, True),
+    }
+
+
+CASES = {
+    'parse_trace[python]': _parse_case(engine='python'),
+    'parse_trace[numpy]': _parse_case(engine='numpy'),
+    'parse_trace[mmap]': _parse_case(engine='mmap'),
+    'parse_trace[cache]': (_cached, lambda trace_file: _analyzer(trace_file).parse_trace(use_cache=True),
+                           True),
+    'parse_trace[parallel]': _parse_case(workers=max(2, os.cpu_count() or 1)),
+    'get_total_goodput': _metric_case('get_total_goodput'),
+    'get_plr': _metric_case('get_plr'),
+    'get_fairness_index': _metric_case('get_fairness_index'),
+    'get_stability_cov': _metric_case('get_stability_cov'),
+    'sliding_throughput': (_parsed, _sliding, False),
+    'summary_index[build]': (lambda trace_file: trace_file,
+                             lambda trace_file: trace_index.TraceIndex.build(trace_file), True),
+    'summary_index[query]': (lambda trace_file: trace_index.TraceIndex.build(trace_file),
+                             _index_queries, False),
+    'end_to_end_delay': (lambda trace_file: trace_file, delay.DelayTable.from_trace, True),
+    'jitter': (lambda trace_file: trace_file, jitter.trace_jitter, True),
+    'queue_state': (lambda trace_file: trace_file,
+                    lambda trace_file: queue_state.queues_of_trace(trace_file, [(2, 3)]), True),
+    'splitFile': (lambda trace_file: trace_file, analyser.splitFile, True),
+    **_split_case('splitCWND'),
+    **_split_case('splitAcks'),
+    **_split_case('splitloss'),
+    **_split_case('splitRtt'),
+    'extractMetrics': (lambda trace_file: trace_file, analyser.extractMetrics, True),
+}
+
+
+# ---- 测量 ----
+
+def _peak_rss_mb():
+    """当前进程的峰值RSS (MB), 不支持时返回None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以KB为单位, macOS 以字节为单位
+    return peak / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+
+
+def _run_case(name, trace_file, repeat, trace_alloc):
+    """在工作进程中运行一个用例 (进程池任务)"""
+    setup, run, _ = CASES[name]
+    state = setup(trace_file)
+    rss_before = _peak_rss_mb()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+    result = {'seconds': min(times), 'rss_before_mb': rss_before, 'peak_rss_mb': _peak_rss_mb()}
+
+    if trace_alloc:
+        blocks = sys.getallocatedblocks()
+        tracemalloc.start()
+        try:
+            kept = run(state)
+            result['tracemalloc_peak_mb'] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        finally:
+            tracemalloc.stop()
+        result['alloc_blocks'] = sys.getallocatedblocks() - blocks
+        del kept
+    return result
+
+
+def run_case(name, trace_file, repeat=3, trace_alloc=False):
+    """在一个新的进程中运行用例, 返回测量结果字典"""
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(_run_case, name, trace_file, repeat, trace_alloc).result()
+
+
+def select_cases(patterns=None):
+    """按名称前缀选择用例, 默认全部"""
+    if not patterns:
+        return list(CASES)
+    return [name for name in CASES if any(name.startswith(p) for p in patterns)]
+
+
+def run_suite(trace_file, cases=None, repeat=3, trace_alloc=False, label=None, log=print):
+    """
+    对一个trace运行一组用例
+
+    返回:
+        结果字典的列表, 每项包含 trace、case 和各项测量值
+    """
+    lines = trace_io.count_lines(trace_file)
+    label = label or os.path.basename(trace_file)
+    results = []
+    for name in cases or list(CASES):
+        measured = run_case(name, trace_file, repeat, trace_alloc)
+        if CASES[name][2] and measured['seconds'] > 0:
+            measured['lines_per_sec'] = lines / measured['seconds']
+        results.append({'trace': label, 'case': name, 'lines': lines, **measured})
+        if log:
+            log(_format_row(results[-1]))
+    return results
+
+
+def _format_row(row):
+    rate = f"{row['lines_per_sec'] / 1e6:8.2f} M行/s" if 'lines_per_sec' in row else ' ' * 14
+    rss = f"{row['peak_rss_mb']:8.1f} MB" if row.get('peak_rss_mb') is not None else ''
+    return f"  {row['case']:<24} {row['seconds']:10.4f} s  {rate}  {rss}"
+
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    与对照结果比较, 返回每个共同用例的 (trace, case, 对照秒数, 当前秒数, 比值)
+
+    比值 = 当前 / 对照, 大于 1 + threshold 视为变慢
+    """
+    before = {(row['trace'], row['case']): row['seconds'] for row in baseline['results']}
+    rows = []
+    for row in results['results']:
+        key = (row['trace'], row['case'])
+        if key in before and before[key] > 0:
+            rows.append(key + (before[key], row['seconds'], row['seconds'] / before[key]))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='trace解析和指标计算的基准测试')
+    parser.add_argument('--size', nargs='+', default=['10MB'],
+                        help='合成trace的大小, 例如 10MB 1GB (默认10MB)')
+    parser.add_argument('--trace', nargs='+', help='使用已有的trace文件代替合成trace')
+    parser.add_argument('--flows', type=int, default=2)
+    parser.add_argument('--drop-rate', type=float, default=0.01)
+    parser.add_argument('--var-every', type=int, default=10,
+                        help='每多少个包写一组tracevar行, 0 表示不写')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--cases', nargs='+', help='只运行名称以这些前缀开头的用例')
+    parser.add_argument('--list', action='store_true', help='列出所有用例')
+    parser.add_argument('--repeat', type=int, default=3, help='每个用例运行的次数, 取最快的一次')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='额外运行一次, 记录内存分配峰值和分配的内存块数 (较慢)')
+    parser.add_argument('--workdir', help='合成trace存放的目录 (默认临时目录, 结束后删除)')
+    parser.add_argument('-o', '--output', help='结果JSON文件')
+    parser.add_argument('--compare', metavar='JSON', help='与之前的结果JSON比较')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='变慢超过这个比例视为回归 (默认0.10)')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print('\n'.join(CASES))
+        return 0
+    cases = select_cases(args.cases)
+    if not cases:
+        parser.error(f"没有匹配的用例: {' '.join(args.cases)}")
+
+    output = {'version': RESULTS_VERSION, **_environment(), 'traces': [], 'results': []}
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        os.makedirs(workdir, exist_ok=True)
+        if args.trace:
+            traces = [(os.path.basename(path), path, None) for path in args.trace]
+        else:
+            traces = []
+            for size in args.size:
+                label = f"synthetic-{size}-{args.flows}f"
+                path = os.path.join(workdir, f"{label}-d{args.drop_rate}-v{args.var_every}"
+                                             f"-s{args.seed}.tr")
+                stats = None
+                if not os.path.exists(path):
+                    print(f"生成 {path} ...")
+                    stats = trace_gen.generate_trace(path, size, args.flows, args.drop_rate,
+                                                     args.var_every, seed=args.seed)
+                traces.append((label, path, stats))
+
+        for label, path, stats in traces:
+            info = {'trace': label, 'path': os.path.abspath(path), 'bytes': os.path.getsize(path)}
+            if stats is not None:
+                info.update({key: stats[key] for key in ('lines', 'packets', 'flows', 'drop_rate',
+                                                         'var_every', 'seed')})
+            output['traces'].append(info)
+            print(f"\n{label} ({info['bytes'] / 1024 ** 2:.1f} MB)")
+            output['results'].extend(run_suite(path, cases, args.repeat, args.tracemalloc, label))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+        print(f"\n结果已保存: {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        rows = compare(output, baseline, args.threshold)
+        slower = [row for row in rows if row[4] > 1 + args.threshold]
+        print(f"\n与 {args.compare} (提交 {baseline.get('commit')}) 比较:")
+        for trace, case, before, after, ratio in rows:
+            mark = '  <-- 变慢' if ratio > 1 + args.threshold else ''
+            print(f"  {trace:<24} {case:<24} {before:10.4f} s -> {after:10.4f} s  x{ratio:.2f}{mark}")
+        if slower:
+            print(f"\n{len(slower)} 个用例变慢超过 {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
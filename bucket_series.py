@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bucket_series.py - 按时间桶聚合的定长NumPy数组
+
+替代 {秒: 字节数} 字典和 [0] * 1001 预分配列表:
+- 桶宽可配置 (1秒、100毫秒、10毫秒……)
+- 底层数组按需倍增扩容, 没有硬编码的时间上限
+- 内存只与 仿真时长 / 桶宽 成正比, 与包的数量无关
+
+两种写入方式:
+- add:    把值累加到所在的桶 (每秒字节数等)
+- assign: 桶内最后一次写入的值生效 (cwnd、rtt等采样值)
+
+分段统计的结果分别用 merge (add方式) 和 overlay (assign方式) 合并。
+"""
+
+from math import ceil, floor
+
+import numpy as np
+
+# 初始容量 (桶数)
+DEFAULT_CAPACITY = 128
+
+
+class TimeBuckets:
+    """时间 -> 桶号 的换算"""
+
+    def __init__(self, bucket_width=1.0, rounding='floor'):
+        """
+        参数:
+            bucket_width: 桶宽 (秒)
+            rounding: 'floor' 时间t落在第 floor(t/桶宽) 个桶 (与 int(time) 一致);
+                      'ceil'  落在第 ceil(t/桶宽) 个桶 (与 analyser.py 的 ceil(time) 一致)
+        """
+        if bucket_width <= 0:
+            raise ValueError(f"桶宽必须为正数: {bucket_width}")
+        if rounding not in ('floor', 'ceil'):
+            raise ValueError(f"未知的取整方式: {rounding}")
+        self.bucket_width = bucket_width
+        self.rounding = rounding
+
+        # 桶宽能整除1秒时用乘法计算桶号, 避免 0.3 / 0.1 = 2.999... 这类误差
+        scale = 1.0 / bucket_width
+        self._scale = round(scale) if abs(scale - round(scale)) < 1e-9 else None
+
+    def index_of(self, times):
+        """把时间 (标量或数组) 转换为桶号"""
+        times = np.asarray(times, dtype=np.float64)
+        scaled = times * self._scale if self._scale is not None else times / self.bucket_width
+        rounded = np.floor(scaled) if self.rounding == 'floor' else np.ceil(scaled)
+        return rounded.astype(np.int64)
+
+    def bucket_of(self, t):
+        """把单个时间转换为桶号 (纯Python, 供逐行解析使用)"""
+        scaled = t * self._scale if self._scale is not None else t / self.bucket_width
+        return floor(scaled) if self.rounding == 'floor' else ceil(scaled)
+
+    def times_of(self, length):
+        """返回前length个桶对应的时间 (桶号 * 桶宽)"""
+        return np.arange(length) * self.bucket_width
+
+
+class BucketSeries(TimeBuckets):
+    """一条按时间桶聚合的序列"""
+
+    def __init__(self, bucket_width=1.0, dtype=np.int64, rounding='floor',
+                 capacity=DEFAULT_CAPACITY):
+        """
+        参数:
+            bucket_width: 桶宽 (秒)
+            dtype: 值的类型
+            rounding: 取整方式, 见 TimeBuckets
+            capacity: 初始容量 (桶数)
+        """
+        super().__init__(bucket_width, rounding)
+        self.length = 0
+        self._values = np.zeros(max(1, capacity), dtype=dtype)
+        self._written = np.zeros(len(self._values), dtype=bool)
+
+    @property
+    def nbytes(self):
+        """底层数组占用的字节数"""
+        return self._values.nbytes + self._written.nbytes
+
+    def _reserve(self, needed):
+        """保证至少能容纳 needed 个桶, 容量不足时倍增"""
+        if needed > self.length:
+            self.length = needed
+        if needed <= len(self._values):
+            return
+        capacity = len(self._values)
+        while capacity < needed:
+            capacity *= 2
+        values = np.zeros(capacity, dtype=self._values.dtype)
+        values[:len(self._values)] = self._values
+        written = np.zeros(capacity, dtype=bool)
+        written[:len(self._written)] = self._written
+        self._values = values
+        self._written = written
+
+    def add(self, times, weights):
+        """把weights累加到times所在的桶 (向量化)"""
+        idx = self.index_of(times)
+        if idx.size == 0:
+            return
+        self._reserve(int(idx.max()) + 1)
+        np.add.at(self._values, idx, weights)
+        self._written[idx] = True
+
+    def add_index(self, index, weight):
+        """把单个值累加到第index个桶"""
+        self._reserve(index + 1)
+        self._values[index] += weight
+        self._written[index] = True
+
+    def assign(self, times, values):
+        """把values写入times所在的桶, 同一个桶以最后一次写入为准 (向量化)"""
+        idx = self.index_of(times)
+        if idx.size == 0:
+            return
+        values = np.asarray(values)
+        # 每个桶只保留数组中最后一次出现的位置
+        uniq, first_rev = np.unique(idx[::-1], return_index=True)
+        last = len(idx) - 1 - first_rev
+        self._reserve(int(uniq.max()) + 1)
+        self._values[uniq] = values[last]
+        self._written[uniq] = True
+
+    def assign_index(self, index, value):
+        """把单个值写入第index个桶"""
+        self._reserve(index + 1)
+        self._values[index] = value
+        self._written[index] = True
+
+    def values(self):
+        """返回长度为 self.length 的值数组视图"""
+        return self._values[:self.length]
+
+    def written(self):
+        """返回每个桶是否被写入过"""
+        return self._written[:self.length]
+
+    def forward_filled(self, initial=0, length=None):
+        """
+        未写入的桶沿用前一个桶的值, 开头未写入的桶取initial
+
+        与 analyser.adjustArray 的补值方式一致。
+
+        参数:
+            initial: 开头未写入的桶的值
+            length: 输出长度, 超出 self.length 的部分沿用最后一个值
+        """
+        if length is None:
+            length = self.length
+        n = min(length, self.length)
+        # 每个位置最近一次写入的下标
+        last_idx = np.where(self._written[:n], np.arange(n), -1)
+        np.maximum.accumulate(last_idx, out=last_idx)
+        filled = np.empty(length, dtype=self._values.dtype)
+        filled[:n] = self._values[np.maximum(last_idx, 0)]
+        filled[:n][last_idx < 0] = initial
+        filled[n:] = filled[n - 1] if n > 0 else initial
+        return filled
+
+    def times(self):
+        """返回每个桶对应的时间 (桶号 * 桶宽)"""
+        return self.times_of(self.length)
+
+    def merge(self, other):
+        """把另一条同桶宽的序列累加进来 (add 方式)"""
+        if other.bucket_width != self.bucket_width or other.rounding != self.rounding:
+            raise ValueError("只能合并桶宽和取整方式相同的序列")
+        if other.length == 0:
+            return
+        self._reserve(other.length)
+        self._values[:other.length] += other.values()
+        self._written[:other.length] |= other.written()
+
+    def overlay(self, other, offset=0):
+        """
+        用另一条同桶宽序列写入过的桶覆盖本序列 (assign 方式)
+
+        other 是时间上紧随其后的一段 (例如并行解析的下一段文件),
+        同一个桶以 other 中的值为准, 与按顺序 assign 的结果一致。
+
+        参数:
+            offset: 覆盖时给 other 的值加上的偏移 (累计计数分段统计时使用)
+        """
+        if other.bucket_width != self.bucket_width or other.rounding != self.rounding:
+            raise ValueError("只能合并桶宽和取整方式相同的序列")
+        idx = np.flatnonzero(other.written())
+        if idx.size == 0:
+            return
+        self._reserve(int(idx[-1]) + 1)
+        self._values[idx] = other.values()[idx] + offset
+        self._written[idx] = True
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+flow_table.py - N条流的状态表
+
+每条流占表中的一行, 所有流的计数器和每个时间桶的接收字节数
+分别保存在两个二维NumPy数组中:
+
+    counts[行, 0..3]  发送包数、接收包数、丢包数、接收字节数
+    bytes[行, 桶号]   该桶内接收的字节数
+
+流标识 -> 行号 的索引只在流第一次出现时建立一次, 之后每条trace行
+只做一次字典查找 (逐行解析) 或一次数组下标查找 (向量化解析),
+解析代价与流的数量无关。
+
+流标识可以是源节点号 (key='src', 地址 'node.port' 中的 node)
+或 TCL 中设置的 fid_ (key='fid')。
+"""
+
+import numpy as np
+
+from bucket_series import DEFAULT_CAPACITY, TimeBuckets
+
+# 计数器列
+COUNTERS = ('sent_packets', 'rcvd_packets', 'dropped_packets', 'total_bytes')
+SENT, RCVD, DROPPED, TOTAL_BYTES = range(len(COUNTERS))
+
+# 事件 -> 计数器列
+EVENT_CODES = {'+': SENT, 'r': RCVD, 'd': DROPPED}
+
+# 可用的流标识
+FLOW_KEYS = ('src', 'fid')
+
+# 逐行解析时缓冲多少个事件后批量写入
+FLUSH_EVENTS = 64 * 1024
+
+
+class FlowTable:
+    """按流标识索引的状态表"""
+
+    def __init__(self, flow_ids=None, key='src', bucket_width=1.0,
+                 capacity=DEFAULT_CAPACITY):
+        """
+        参数:
+            flow_ids: 要统计的流标识列表; None 表示统计trace中出现的所有流
+            key: 'src' 按源节点号区分流, 'fid' 按流号区分
+            bucket_width: 接收字节数时间序列的桶宽 (秒)
+            capacity: 初始容量 (桶数)
+        """
+        if key not in FLOW_KEYS:
+            raise ValueError(f"未知的流标识: {key}")
+        self.key = key
+        self.buckets = TimeBuckets(bucket_width)
+        self.discover = flow_ids is None
+
+        self.ids = []        # 行号 -> 流标识
+        self.index = {}      # 流标识 -> 行号
+        self._tokens = {}    # trace中的字符串形式 -> 行号, 供逐行解析使用
+        self._lookup = np.full(0, -1, dtype=np.int64)  # 流标识 -> 行号, 供向量化解析使用
+
+        self.counts = np.zeros((0, len(COUNTERS)), dtype=np.int64)
+        self.bytes = np.zeros((0, max(1, capacity)), dtype=np.int64)
+        self.lengths = np.zeros(0, dtype=np.int64)  # 每行写入过的桶数
+        self._pending = []   # add_event 缓冲的 (行号, 事件编码, 桶号, 包大小)
+
+        for flow_id in flow_ids or ():
+            self.add_flow(flow_id)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add_flow(self, flow_id):
+        """添加一条流, 返回它的行号"""
+        flow_id = int(flow_id)
+        if flow_id in self.index:
+            return self.index[flow_id]
+        if flow_id < 0:
+            raise ValueError(f"流标识必须为非负整数: {flow_id}")
+
+        row = len(self.ids)
+        self.ids.append(flow_id)
+        self.index[flow_id] = row
+        self._tokens[str(flow_id)] = row
+        if flow_id >= len(self._lookup):
+            lookup = np.full(max(flow_id + 1, 2 * len(self._lookup)), -1, dtype=np.int64)
+            lookup[:len(self._lookup)] = self._lookup
+            self._lookup = lookup
+        self._lookup[flow_id] = row
+
+        self.counts = np.vstack([self.counts, np.zeros((1, len(COUNTERS)), dtype=np.int64)])
+        self.bytes = np.vstack([self.bytes, np.zeros((1, self.bytes.shape[1]), dtype=np.int64)])
+        self.lengths = np.append(self.lengths, 0)
+        return row
+
+    def row_of_token(self, token):
+        """
+        逐行解析用: 由trace中的流标识字符串得到行号
+
+        不统计的流返回None
+        """
+        row = self._tokens.get(token)
+        if row is None and self.discover:
+            try:
+                return self.add_flow(int(token))
+            except ValueError:
+                return None
+        return row
+
+    def rows_of(self, flow_ids):
+        """向量化解析用: 由流标识数组得到行号数组, 不统计的流为-1"""
+        flow_ids = np.asarray(flow_ids, dtype=np.int64)
+        if self.discover and len(flow_ids):
+            for flow_id in np.unique(flow_ids[flow_ids >= 0]):
+                if int(flow_id) not in self.index:
+                    self.add_flow(int(flow_id))
+        known = (flow_ids >= 0) & (flow_ids < len(self._lookup))
+        rows = np.full(len(flow_ids), -1, dtype=np.int64)
+        rows[known] = self._lookup[flow_ids[known]]
+        return rows
+
+    def _reserve(self, needed):
+        """保证每行至少能容纳 needed 个桶, 容量不足时倍增"""
+        capacity = self.bytes.shape[1]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        grown = np.zeros((self.bytes.shape[0], capacity), dtype=np.int64)
+        grown[:, :self.bytes.shape[1]] = self.bytes
+        self.bytes = grown
+
+    def add_event(self, row, code, bucket, size):
+        """
+        逐行解析用: 记录一个事件
+
+        事件先放进缓冲区, 攒够 FLUSH_EVENTS 个后再批量写入数组,
+        避免每行都做NumPy标量运算。
+
+        参数:
+            row: 行号
+            code: EVENT_CODES 中的事件编码
+            bucket: 事件时间所在的桶号
+            size: 包大小 (字节)
+        """
+        self._pending.append((row, code, bucket, size))
+        if len(self._pending) >= FLUSH_EVENTS:
+            self.flush()
+
+    def flush(self):
+        """把缓冲区中的事件写入数组"""
+        if not self._pending:
+            return
+        events = np.array(self._pending, dtype=np.int64)
+        self._pending = []
+        self._add_rows(events[:, 0], events[:, 1], events[:, 2], events[:, 3])
+
+    def add_events(self, flow_ids, codes, times, sizes):
+        """
+        向量化解析用: 记录一批事件
+
+        参数:
+            flow_ids: 流标识数组
+            codes: 事件编码数组, 不在 EVENT_CODES 中的编码被忽略
+            times: 事件时间数组
+            sizes: 包大小数组
+        """
+        codes = np.asarray(codes)
+        rows = np.full(len(codes), -1, dtype=np.int64)
+        counted = codes <= DROPPED
+        rows[counted] = self.rows_of(np.asarray(flow_ids)[counted])
+        keep = rows >= 0
+        if not keep.any():
+            return
+        self._add_rows(rows[keep], codes[keep], self.buckets.index_of(np.asarray(times)[keep]),
+                       np.asarray(sizes)[keep].astype(np.int64))
+
+    def _add_rows(self, rows, codes, buckets, sizes):
+        """按行号累加一批事件"""
+        n = len(self.ids)
+        self.counts[:, :TOTAL_BYTES] += np.bincount(
+            rows * TOTAL_BYTES + codes, minlength=n * TOTAL_BYTES).reshape(n, TOTAL_BYTES)
+
+        rcvd = codes == RCVD
+        if not rcvd.any():
+            return
+        rows, buckets, sizes = rows[rcvd], buckets[rcvd], sizes[rcvd]
+        np.add.at(self.counts[:, TOTAL_BYTES], rows, sizes)
+        self._reserve(int(buckets.max()) + 1)
+        np.add.at(self.bytes, (rows, buckets), sizes)
+        np.maximum.at(self.lengths, rows, buckets + 1)
+
+    def merge(self, other):
+        """
+        把另一张同样配置的表 (例如并行解析的另一段文件) 累加进来
+
+        按流标识对齐行; 本表不自动发现流时, 只合并已有的流
+        """
+        if other.key != self.key or other.buckets.bucket_width != self.buckets.bucket_width:
+            raise ValueError("只能合并流标识和桶宽相同的表")
+        self.flush()
+        other.flush()
+        for other_row, flow_id in enumerate(other.ids):
+            if flow_id not in self.index and not self.discover:
+                continue
+            row = self.add_flow(flow_id)
+            self.counts[row] += other.counts[other_row]
+            length = int(other.lengths[other_row])
+            if length:
+                self._reserve(length)
+                self.bytes[row, :length] += other.bytes[other_row, :length]
+                self.lengths[row] = max(self.lengths[row], length)
+
+    def order(self):
+        """按输出顺序返回行号: 指定了流时按指定顺序, 否则按流标识排序"""
+        self.flush()
+        if self.discover:
+            return sorted(range(len(self.ids)), key=self.ids.__getitem__)
+        return list(range(len(self.ids)))
+
+    def counters(self, row):
+        """返回一行的计数器字典"""
+        self.flush()
+        return {name: int(value) for name, value in zip(COUNTERS, self.counts[row])}
+
+    def row_bytes(self, row):
+        """返回一行每个桶的接收字节数"""
+        self.flush()
+        return self.bytes[row, :self.lengths[row]]
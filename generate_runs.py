@@ -1,138 +1,151 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-生成5次不同的cubic运行
+生成 Part C 的多次不同的运行 (默认与 analyser3.PART_C_VARIANT 相同)
 使用不同的参数来保证结果不同
+
+固定次数 (默认5次):
+    python3 generate_runs.py
+自适应次数: 按批并行运行, 每批之后更新各指标的置信区间, 所有指标的
+相对半宽都小于目标时停止, 或者达到运行次数上限 (见 replication.py):
+    python3 generate_runs.py --variant yeah --adaptive --target 0.05 --max-runs 20
 """
 
+import argparse
+import glob
 import os
-import subprocess
-import random
 
-def modify_tcl_for_run(input_file, output_file, trace_file, nam_file, run_number):
+import analyser3
+import replication
+import scenario
+import sim_runner
+import trace_io
+
+NUM_RUNS = 5
+START_JITTER = 0.5
+
+
+def run_seed(run_number):
+    """第run_number次运行的随机种子"""
+    return run_number * 12345 + 6789
+
+
+def remove_runs(variant):
+    """删除该变体以前所有运行的输出文件, 避免旧的运行混入分析"""
+    for pattern in (f'{variant}Trace_run*', f'{variant}_run*.nam'):
+        for path in glob.glob(pattern):
+            if os.path.isfile(path):
+                os.remove(path)
+
+
+def simulate_runs(variant, run_numbers, steady=None):
     """
-    修改TCL文件以生成不同的运行
-    
-    策略:
-    1. 修改随机种子 (多种方式)
-    2. 修改启动时间(添加随机抖动)
-    3. 修改输出文件名
+    并行运行一批仿真, 每次使用不同的随机种子和启动抖动
+
+    参数:
+        steady: 稳态检测的参数字典, 稳定后提前结束仿真 (见 steady_state.py)
+
+    返回:
+        运行编号 -> trace文件 (只包括成功的运行)
     """
-    with open(input_file, 'r') as f:
-        content = f.read()
-    
-    # 生成不同的随机种子
-    seed = run_number * 12345 + 6789
-    
-    # 生成启动时间抖动 (0-0.5秒)
-    random.seed(seed)
-    jitter1 = random.uniform(0, 0.5)
-    jitter2 = random.uniform(0, 0.5)
-    
-    # 替换输出文件名
-    variant = 'reno' if 'reno' in input_file else 'cubic'
-    content = content.replace(f'{variant}Trace.tr', trace_file)
-    content = content.replace(f'{variant}.nam', nam_file)
-    
-    # 在 "set ns [new Simulator]" 之后添加随机种子配置
-    lines = content.split('\n')
-    new_lines = []
-    
-    for i, line in enumerate(lines):
-        new_lines.append(line)
+    jobs = []
+    for run_idx in run_numbers:
+        print(f"\n运行 {run_idx}:")
+        print("-" * 40)
         
-        # 在创建Simulator后添加随机种子
-        if 'set ns [new Simulator]' in line:
-            new_lines.append('')
-            new_lines.append(f'# Random seed configuration - Run {run_number}')
-            new_lines.append('set rng [new RNG]')
-            new_lines.append(f'$rng seed {seed}')
-            new_lines.append('')
-            new_lines.append('# Additional RNG for packet drops')
-            new_lines.append('set rng2 [new RNG]')
-            new_lines.append(f'$rng2 seed {seed + 111}')
-            new_lines.append('')
-            new_lines.append('# Set random seed for ns-random')
-            new_lines.append(f'ns-random {seed}')
+        seed = run_seed(run_idx)
+        run = scenario.Scenario(variant, seed=seed, jitter=START_JITTER, tag=f'run{run_idx}')
         
-        # 修改FTP启动时间,添加随机抖动
-        if '$ns at 0.0 "$myftp1 start"' in line:
-            new_lines[-1] = f'$ns at {jitter1:.6f} "$myftp1 start"'
-        elif '$ns at 0.0 "$myftp2 start"' in line:
-            new_lines[-1] = f'$ns at {jitter2:.6f} "$myftp2 start"'
-    
-    # 写入新文件
-    with open(output_file, 'w') as f:
-        f.write('\n'.join(new_lines))
-    
-    print(f"  创建配置文件: {output_file}")
-    print(f"  随机种子: {seed}")
-    print(f"  FTP1启动抖动: {jitter1:.3f}秒")
-    print(f"  FTP2启动抖动: {jitter2:.3f}秒")
-    print(f"  输出trace: {trace_file}")
-
-def run_ns2_simulation(tcl_file):
-    """运行NS2仿真"""
-    try:
-        result = subprocess.run(['ns', tcl_file], 
-                              capture_output=True, 
-                              text=True, 
-                              timeout=300)
-        return result.returncode == 0
-    except Exception as e:
-        print(f"  错误: {e}")
-        return False
-
-def main():
+        # 删除旧文件
+        for f in [run.trace_file, run.nam_file]:
+            if os.path.exists(f):
+                os.remove(f)
+        
+        jitter1, jitter2 = run.start_times()
+        print(f"  随机种子: {seed}")
+        print(f"  FTP1启动抖动: {jitter1:.3f}秒")
+        print(f"  FTP2启动抖动: {jitter2:.3f}秒")
+        print(f"  输出trace: {run.trace_file}")
+        jobs.append(run.job(steady=steady))
+    
+    # 并行运行仿真
+    print(f"\n运行NS2仿真...")
+    results = sim_runner.run_jobs(jobs)
+    
+    traces = {}
+    for run_idx, result in zip(run_numbers, results):
+        trace_file = trace_io.resolve_trace(f'{variant}Trace_run{run_idx}.tr')
+        if result['ok'] and os.path.exists(trace_file):
+            size = os.path.getsize(trace_file)
+            print(f"  ✓ Run {run_idx} 完成! 文件大小: {size/1024:.1f} KB")
+            traces[run_idx] = trace_file
+        else:
+            print(f"  ✗ Run {run_idx} 失败! 未生成trace文件")
+    return traces
+
+
+def adaptive_runs(variant, target, max_runs, min_runs=3, batch_size=None, method='t',
+                  level=replication.DEFAULT_LEVEL, steady=None):
+    """
+    按批运行直到 Part C 的每个指标的置信区间相对半宽都小于 target
+
+    返回:
+        replication.SequentialSampler
+    """
+    sampler = replication.SequentialSampler(analyser3.PART_C_METRICS, target=target, level=level,
+                                            method=method, min_runs=min_runs, max_runs=max_runs,
+                                            batch_size=batch_size)
+    
+    def run_batch(run_numbers):
+        traces = simulate_runs(variant, run_numbers, steady)
+        summaries = analyser3.analyze_traces(
+            [(run_idx, trace_file, variant) for run_idx, trace_file in traces.items()])
+        return [summaries.get(run_idx) for run_idx in run_numbers]
+    
+    print(f"\n每批 {sampler.batch_size} 次, 最多 {max_runs} 次, "
+          f"目标相对半宽 {target:.1%} ({level:.0%} {method} 置信区间)")
+    sampler.run(run_batch)
+    return sampler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='生成Part C的多次运行')
+    parser.add_argument('--variant', choices=sorted(scenario.VARIANTS), default=analyser3.PART_C_VARIANT)
+    parser.add_argument('--runs', type=int, default=NUM_RUNS, help=f'固定的运行次数 (默认{NUM_RUNS})')
+    parser.add_argument('--adaptive', action='store_true', help='按批运行直到置信区间收敛')
+    parser.add_argument('--target', type=float, default=analyser3.PART_C_TARGET,
+                        help='自适应: 置信区间半宽相对于均值的目标')
+    parser.add_argument('--max-runs', type=int, default=20, help='自适应: 运行次数上限')
+    parser.add_argument('--min-runs', type=int, default=3, help='自适应: 判断收敛前至少运行的次数')
+    parser.add_argument('--batch', type=int, default=None, help='自适应: 每批的运行次数 (默认CPU核数)')
+    parser.add_argument('--ci', choices=replication.CI_METHODS, default=analyser3.PART_C_CI_METHOD,
+                        help='置信区间: t 分布或 bootstrap')
+    sim_runner.add_steady_arguments(parser)
+    args = parser.parse_args(argv)
+    steady = sim_runner.steady_settings(args)
+    
+    variant = args.variant
     print("=" * 60)
-    print("生成5次可重复性测试运行 (Cubic)")
+    if args.adaptive:
+        print(f"自适应次数的可重复性测试运行 ({variant})")
+    else:
+        print(f"生成{args.runs}次可重复性测试运行 ({variant})")
     print("=" * 60)
     
-    variant = 'cubic'
-    num_runs = 5
-    
     # 切换到脚本目录
     script_dir = os.path.dirname(os.path.abspath(__file__))
     os.chdir(script_dir)
     
-    input_file = f'{variant}Code.tcl'
-    
-    if not os.path.exists(input_file):
-        print(f"错误: 找不到 {input_file}")
-        return
+    print(f"\n场景: {variant}, 由 scenario.py 生成\n")
+    remove_runs(variant)
     
-    print(f"\n使用输入文件: {input_file}\n")
-    
-    # 生成并运行5次
-    for run_idx in range(1, num_runs + 1):
-        print(f"\n运行 {run_idx}/{num_runs}:")
-        print("-" * 40)
-        
-        temp_file = f'{variant}Code_run{run_idx}.tcl'
-        trace_file = f'{variant}Trace_run{run_idx}.tr'
-        nam_file = f'{variant}_run{run_idx}.nam'
-        
-        # 删除旧文件
-        for f in [trace_file, nam_file, temp_file]:
-            if os.path.exists(f):
-                os.remove(f)
-        
-        # 修改TCL文件
-        modify_tcl_for_run(input_file, temp_file, trace_file, nam_file, run_idx)
-        
-        # 运行仿真
-        print(f"  运行NS2仿真...")
-        success = run_ns2_simulation(temp_file)
-        
-        if success and os.path.exists(trace_file):
-            size = os.path.getsize(trace_file)
-            print(f"  ✓ 完成! 文件大小: {size/1024:.1f} KB")
-        else:
-            print(f"  ✗ 失败! 未生成trace文件")
-        
-        # 清理临时文件
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
+    if args.adaptive:
+        sampler = adaptive_runs(variant, args.target, args.max_runs, args.min_runs,
+                                args.batch, args.ci, steady=steady)
+        num_runs = sampler.launched
+    else:
+        num_runs = args.runs
+        simulate_runs(variant, list(range(1, num_runs + 1)), steady)
     
     # 验证文件
     print("\n" + "=" * 60)
@@ -141,10 +154,10 @@ def main():
     
     all_sizes = []
     for run_idx in range(1, num_runs + 1):
-        trace_file = f'{variant}Trace_run{run_idx}.tr'
+        trace_file = trace_io.resolve_trace(f'{variant}Trace_run{run_idx}.tr')
         if os.path.exists(trace_file):
             size = os.path.getsize(trace_file)
-            lines = sum(1 for _ in open(trace_file))
+            lines = trace_io.count_lines(trace_file)
             all_sizes.append(size)
             print(f"✓ Run {run_idx}: {size/1024:.1f} KB, {lines} 行")
         else:
@@ -163,4 +176,3 @@ def main():
 
 if __name__ == '__main__':
     main()
-
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+instrument.py - 分析流程的阶段计时、计数器和按阶段的性能剖析
+
+Stats 记录:
+- 阶段 (stage): 嵌套的计时区间, 名称按嵌套关系用 '/' 连接,
+  例如 'partA/analyze/parse_trace', 每个阶段累计耗时和调用次数
+- 计数器 (counter): 读取的行数、跳过的行数、每种事件的数量、读取的字节数等
+
+工作进程中的 Stats 用 to_dict() 传回, 由 merge() 合并到主进程当前所在的阶段下。
+write_report() 把全部结果写成JSON报告。
+
+可选的性能剖析 (profile='cprofile' 或 'tracemalloc') 在匹配的阶段外面套上
+cProfile 或 tracemalloc, 每个阶段一个结果文件:
+
+    <profile_dir>/<阶段名>.prof               cProfile, 可用 pstats / snakeviz 查看
+    <profile_dir>/<阶段名>.tracemalloc.txt    分配最多的代码行
+
+默认只剖析最外层的阶段; profile_stages 给出名称片段时只剖析名称中包含它们的阶段。
+剖析不嵌套: 已经在剖析的阶段内部的阶段只计时。
+工作进程中的 Stats (settings() 创建) 各自剖析, 结果文件名带上 label。
+"""
+
+import cProfile
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+PROFILERS = ('cprofile', 'tracemalloc')
+PROFILE_DIR = 'profiles'
+
+# tracemalloc 结果文件中列出的代码行数
+TRACEMALLOC_TOP = 25
+
+
+class Stats:
+    """阶段计时器和计数器"""
+
+    def __init__(self, profile=None, profile_dir=PROFILE_DIR, profile_stages=None, label=None):
+        """
+        参数:
+            profile: None、'cprofile' 或 'tracemalloc'
+            profile_dir: 剖析结果的输出目录
+            profile_stages: 只剖析名称中包含这些片段的阶段; None 表示最外层的阶段
+            label: 加在剖析结果文件名后面 (例如工作进程处理的trace名), 避免互相覆盖
+        """
+        if profile is not None and profile not in PROFILERS:
+            raise ValueError(f"未知的剖析方式: {profile}")
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.profile_stages = list(profile_stages) if profile_stages else None
+        self.label = label
+        self.stages = {}    # 阶段名 -> {'seconds', 'calls', ...}
+        self.counters = {}  # 计数器名 -> 值
+        self._stack = []
+        self._profiling = False
+        self._profilers = {}  # 阶段名 -> cProfile.Profile (多次调用时累计)
+
+    def settings(self, label=None):
+        """在工作进程中创建同样配置的 Stats 所需的参数"""
+        return {'profile': self.profile, 'profile_dir': self.profile_dir,
+                'profile_stages': self.profile_stages, 'label': label}
+
+    def _path(self, name):
+        return '/'.join(self._stack + [name])
+
+    def _wants_profile(self, path):
+        if self.profile is None or self._profiling:
+            return False
+        # 同一进程中另一个 Stats 已经在剖析 (例如在主进程中顺序分析trace时)
+        if self.profile == 'cprofile' and sys.getprofile() is not None:
+            return False
+        if self.profile == 'tracemalloc' and tracemalloc.is_tracing():
+            return False
+        if self.profile_stages is None:
+            return not self._stack
+        return any(part in path for part in self.profile_stages)
+
+    def _profile_file(self, path, suffix):
+        name = re.sub(r'[^\w.\-]+', '_', path)
+        if self.label:
+            name += '-' + re.sub(r'[^\w.\-]+', '_', self.label)
+        os.makedirs(self.profile_dir, exist_ok=True)
+        return os.path.join(self.profile_dir, name + suffix)
+
+    @contextmanager
+    def stage(self, name):
+        """计时一个阶段, 需要时对它做性能剖析"""
+        path = self._path(name)
+        profiling = self._wants_profile(path)
+        if profiling:
+            self._profiling = True
+            self._start_profile(path)
+        self._stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stack.pop()
+            self.add_time(path, elapsed)
+            if profiling:
+                self._stop_profile(path)
+                self._profiling = False
+
+    def _start_profile(self, path):
+        if self.profile == 'cprofile':
+            self._profilers.setdefault(path, cProfile.Profile()).enable()
+        else:
+            tracemalloc.start()
+
+    def _stop_profile(self, path):
+        if self.profile == 'cprofile':
+            profiler = self._profilers[path]
+            profiler.disable()
+            profiler.dump_stats(self._profile_file(path, '.prof'))
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        entry = self.stages[path]
+        entry['tracemalloc_peak_mb'] = max(entry.get('tracemalloc_peak_mb', 0), peak / 1024 ** 2)
+        with open(self._profile_file(path, '.tracemalloc.txt'), 'w') as f:
+            f.write(f"# {path}: 峰值 {peak / 1024 ** 2:.1f} MB\n")
+            for stat in snapshot.statistics('lineno')[:TRACEMALLOC_TOP]:
+                f.write(f"{stat}\n")
+
+    def add_time(self, path, seconds, calls=1):
+        """累加一个阶段的耗时"""
+        entry = self.stages.setdefault(path, {'seconds': 0.0, 'calls': 0})
+        entry['seconds'] += seconds
+        entry['calls'] += calls
+
+    def count(self, name, value=1):
+        """累加一个计数器"""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def count_all(self, values, prefix=''):
+        """累加一组计数器, 例如 {'+': 10, 'r': 8} 加上前缀 'events.'"""
+        for name, value in values.items():
+            self.count(prefix + str(name), value)
+
+    def to_dict(self):
+        """可pickle、可写成JSON的结果"""
+        return {'stages': {path: dict(entry) for path, entry in self.stages.items()},
+                'counters': dict(self.counters)}
+
+    def merge(self, other):
+        """
+        把另一个 Stats 的结果 (to_dict() 或 Stats 对象) 合并到当前所在的阶段下:
+        阶段名加上当前阶段的前缀, 计数器直接累加
+        """
+        if isinstance(other, Stats):
+            other = other.to_dict()
+        prefix = '/'.join(self._stack)
+        for path, entry in other['stages'].items():
+            target = self.stages.setdefault(f'{prefix}/{path}' if prefix else path,
+                                            {'seconds': 0.0, 'calls': 0})
+            for key, value in entry.items():
+                if key == 'tracemalloc_peak_mb':
+                    target[key] = max(target.get(key, 0), value)
+                else:
+                    target[key] = target.get(key, 0) + value
+        self.count_all(other['counters'])
+
+    def summary(self):
+        """按耗时排序的阶段列表的文本形式"""
+        lines = []
+        for path, entry in sorted(self.stages.items(), key=lambda item: -item[1]['seconds']):
+            lines.append(f"  {path:<40} {entry['seconds']:10.3f} s  x{entry['calls']}")
+        return '\n'.join(lines)
+
+    def write_report(self, path, **extra):
+        """
+        写入JSON报告
+
+        参数:
+            extra: 一并写入报告的其他字段 (例如运行设置)
+        """
+        report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), **extra, **self.to_dict()}
+        if self.profile is not None:
+            report['profile'] = {'mode': self.profile, 'dir': os.path.abspath(self.profile_dir)}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+        return report
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+jitter.py - 每条流、每条链路的时延抖动
+
+按 RFC 3550 第6.4.1节计算到达间隔抖动: 对相邻两个到达的包,
+
+    D = (R_j - R_i) - (S_j - S_i)        传输时间之差 (时延变化, IPDV)
+    J = J + (|D| - J) / 16
+
+其中 S 为发送时间, R 为到达时间。两种范围:
+
+- 流: S 为包最早的入队时间 ('+', 即在源节点入队), R 为在目的节点的接收时间
+- 链路: S 为在链路上入队的时间, R 为链路另一端的接收时间 (排队 + 发送 + 传播)
+
+trace按块流式读取, 一次扫描得到所有流和所有链路的结果。每条流/链路只保存
+几个累计量; 另外只保存尚未到达的包 (uid -> 入队时间), 包到达或被丢弃后删除,
+所以内存与流和链路的数量加上在途的包数成正比, 与trace长度无关。
+每块内的计算都是向量化的, J 的递推按段用闭式解计算。
+
+代替 Test/jitter.sh 的 awk 管道:
+
+    python jitter.py cubicTrace.tr -o cubic_jitter.csv
+"""
+
+import argparse
+import csv
+import sys
+
+import numpy as np
+
+import trace_mmap
+from flow_table import FLOW_KEYS
+
+# RFC 3550 中抖动估计的增益
+JITTER_GAIN = 1 / 16
+
+# 闭式解每段的长度: (1 - 1/16) ** -_SEGMENT 不会溢出
+_SEGMENT = 512
+
+# 链路上的包用 uid * _LINK_SPACE + from * _NODE_SPACE + to 标识
+_NODE_SPACE = 1 << 12
+_LINK_SPACE = _NODE_SPACE * _NODE_SPACE
+
+# 结果行的字段 (时间单位为毫秒)
+FIELDS = ('scope', 'id', 'packets', 'jitter_ms', 'mean_jitter_ms',
+          'mean_delay_ms', 'delay_std_ms', 'mean_ipdv_ms', 'max_ipdv_ms')
+
+
+def rfc3550(deltas, initial=0.0):
+    """
+    J 的递推 J_n = J_{n-1} + (|D_n| - J_{n-1}) / 16 的全部中间值
+
+    J_n = a^n (J_0 + sum_k g |D_k| a^-k), a = 1 - g, 按段计算避免 a^-k 溢出
+    """
+    deltas = np.abs(np.asarray(deltas, dtype=np.float64))
+    out = np.empty(len(deltas))
+    decay = 1 - JITTER_GAIN
+    powers = decay ** np.arange(1, _SEGMENT + 1)
+    for start in range(0, len(deltas), _SEGMENT):
+        segment = deltas[start:start + _SEGMENT]
+        scale = powers[:len(segment)]
+        out[start:start + len(segment)] = scale * (initial + np.cumsum(segment * JITTER_GAIN / scale))
+        initial = out[start + len(segment) - 1]
+    return out
+
+
+class _Pending:
+    """尚未到达的包: 按键排序的 (键, 入队时间, 流标识)"""
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.int64)
+        self.times = np.empty(0, dtype=np.float64)
+        self.flows = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, keys, times, flows):
+        """加入新的入队事件, 同一个键只保留最早的一条"""
+        if not len(keys):
+            return
+        keys = np.concatenate([self.keys, keys])
+        # 已有的条目在前面, np.unique 返回第一次出现的位置
+        self.keys, first = np.unique(keys, return_index=True)
+        self.times = np.concatenate([self.times, times])[first]
+        self.flows = np.concatenate([self.flows, flows])[first]
+
+    def _find(self, keys):
+        index = np.searchsorted(self.keys, keys)
+        found = index < len(self.keys)
+        found[found] = self.keys[index[found]] == keys[found]
+        return index, found
+
+    def _drop(self, index):
+        keep = np.ones(len(self.keys), dtype=bool)
+        keep[index] = False
+        self.keys, self.times, self.flows = self.keys[keep], self.times[keep], self.flows[keep]
+
+    def remove(self, keys):
+        """删除被丢弃的包"""
+        if len(keys) and len(self.keys):
+            index, found = self._find(keys)
+            self._drop(index[found])
+
+    def take(self, keys):
+        """取出到达的包: 返回 (是否找到, 入队时间, 流标识), 并删除找到的条目"""
+        if not len(self.keys):
+            return np.zeros(len(keys), dtype=bool), np.empty(0), np.empty(0, dtype=np.int64)
+        index, found = self._find(keys)
+        index = index[found]
+        times, flows = self.times[index], self.flows[index]
+        self._drop(index)
+        return found, times, flows
+
+
+class _Accumulator:
+    """一条流或一条链路的累计量"""
+
+    def __init__(self):
+        self.packets = 0
+        self.jitter = 0.0
+        self.jitter_sum = 0.0
+        self.last_transit = None
+        self.transit_mean = 0.0
+        self.transit_m2 = 0.0   # 与均值之差的平方和 (按批合并, 避免大均值下的相消误差)
+        self.ipdv_sum = 0.0
+        self.ipdv_max = 0.0
+
+    def add(self, transits):
+        """按到达顺序加入一批包的传输时间"""
+        if self.last_transit is not None:
+            deltas = np.diff(transits, prepend=self.last_transit)
+        else:
+            deltas = np.diff(transits)
+        if len(deltas):
+            jitters = rfc3550(deltas, self.jitter)
+            self.jitter = float(jitters[-1])
+            self.jitter_sum += float(jitters.sum())
+            self.ipdv_sum += float(np.abs(deltas).sum())
+            self.ipdv_max = max(self.ipdv_max, float(np.abs(deltas).max()))
+        count = self.packets + len(transits)
+        batch_mean = float(transits.mean())
+        shift = batch_mean - self.transit_mean
+        self.transit_m2 += (float(((transits - batch_mean) ** 2).sum())
+                            + shift ** 2 * self.packets * len(transits) / count)
+        self.transit_mean += shift * len(transits) / count
+        self.packets = count
+        self.last_transit = float(transits[-1])
+
+    def row(self, scope, name):
+        pairs = max(self.packets - 1, 1)
+        variance = self.transit_m2 / self.packets
+        return {
+            'scope': scope,
+            'id': name,
+            'packets': self.packets,
+            'jitter_ms': self.jitter * 1000,
+            'mean_jitter_ms': self.jitter_sum / pairs * 1000,
+            'mean_delay_ms': self.transit_mean * 1000,
+            'delay_std_ms': variance ** 0.5 * 1000,
+            'mean_ipdv_ms': self.ipdv_sum / pairs * 1000,
+            'max_ipdv_ms': self.ipdv_max * 1000,
+        }
+
+
+def _add_grouped(accumulators, groups, transits):
+    """按组 (流或链路) 把传输时间加入对应的累计量, 组内保持到达顺序"""
+    if not len(groups):
+        return
+    order = np.argsort(groups, kind='stable')
+    groups, transits = groups[order], transits[order]
+    bounds = np.flatnonzero(np.diff(groups)) + 1
+    for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(groups)]):
+        group = int(groups[start])
+        accumulators.setdefault(group, _Accumulator()).add(transits[start:end])
+
+
+class JitterMeter:
+    """流式计算所有流和链路的抖动"""
+
+    def __init__(self, flow_key='src', packet_type=b'tcp'):
+        """
+        参数:
+            flow_key: 流标识 ('src' 或 'fid')
+            packet_type: 只统计该类型的包, None 表示所有类型
+        """
+        if flow_key not in FLOW_KEYS:
+            raise ValueError(f"不支持的流标识: {flow_key}")
+        self.flow_key = flow_key
+        self.packet_type = packet_type
+        self.flows = {}   # 流标识 -> _Accumulator
+        self.links = {}   # from * _NODE_SPACE + to -> _Accumulator
+        self._flow_pending = _Pending()
+        self._link_pending = _Pending()
+
+    @property
+    def pending(self):
+        """当前保存的尚未到达的包数 (流和链路两部分之和)"""
+        return len(self._flow_pending) + len(self._link_pending)
+
+    def update(self, cols):
+        """处理一块 trace_reader 格式的列字典 (块按时间顺序给出)"""
+        if self.packet_type is not None:
+            typed = cols['type'] == self.packet_type
+            cols = {name: column[typed] for name, column in cols.items()}
+        # 列式缓存中的列可能是压缩过的较窄整数类型, 计算键之前先转为int64
+        event, time = cols['event'], cols['time']
+        uid = cols['uid'].astype(np.int64)
+        from_node = cols['from_node'].astype(np.int64)
+        to_node = cols['to_node'].astype(np.int64)
+        if len(uid) and (max(from_node.max(), to_node.max()) >= _NODE_SPACE
+                         or uid.max() >= np.iinfo(np.int64).max // _LINK_SPACE):
+            raise ValueError(f"节点号或uid超出范围 (节点号最大 {_NODE_SPACE - 1})")
+        links = from_node * _NODE_SPACE + to_node
+        link_keys = uid * _LINK_SPACE + links
+        flows = cols[self.flow_key].astype(np.int64)
+
+        # 入队、丢弃和到达事件在块内按时间顺序出现, 一个包的入队总在到达之前,
+        # 所以先登记整块的入队, 再删除丢弃的包, 最后匹配到达的包
+        send = event == b'+'
+        self._flow_pending.add(uid[send], time[send], flows[send])
+        self._link_pending.add(link_keys[send], time[send], links[send])
+
+        drop = event == b'd'
+        self._flow_pending.remove(uid[drop])
+        self._link_pending.remove(link_keys[drop])
+
+        recv = event == b'r'
+        found, sent, link_ids = self._link_pending.take(link_keys[recv])
+        _add_grouped(self.links, link_ids, time[recv][found] - sent)
+
+        final = recv & (to_node == cols['dst'])
+        found, sent, flow_ids = self._flow_pending.take(uid[final])
+        _add_grouped(self.flows, flow_ids, time[final][found] - sent)
+
+    def update_all(self, blocks):
+        """处理一个或多个列字典"""
+        if isinstance(blocks, dict):
+            blocks = [blocks]
+        for cols in blocks:
+            self.update(cols)
+        return self
+
+    def rows(self):
+        """每条流、每条链路一行结果 (字段见 FIELDS), 可以直接写成CSV或JSON"""
+        rows = [self.flows[flow_id].row('flow', str(flow_id)) for flow_id in sorted(self.flows)]
+        for link in sorted(self.links):
+            name = f'{link // _NODE_SPACE}-{link % _NODE_SPACE}'
+            rows.append(self.links[link].row('link', name))
+        return rows
+
+
+def trace_jitter(trace_file, flow_key='src', packet_type=b'tcp'):
+    """一次流式读取trace文件 (支持压缩的trace), 返回 JitterMeter.rows()"""
+    meter = JitterMeter(flow_key, packet_type)
+    return meter.update_all(trace_mmap.iter_trace_blocks(trace_file)).rows()
+
+
+def write_csv(path, rows_by_name, name_column='Variant'):
+    """
+    把多个trace的结果写成一个CSV
+
+    参数:
+        rows_by_name: 名称 (例如变体名) -> rows() 结果
+    """
+    with open(path, 'w', newline='') as f:
+        _write_rows(f, rows_by_name, name_column)
+
+
+def _write_rows(f, rows_by_name, name_column):
+    writer = csv.writer(f)
+    writer.writerow([name_column] + list(FIELDS))
+    for name, rows in rows_by_name.items():
+        for row in rows:
+            writer.writerow([name] + [f"{row[field]:.4f}" if field.endswith('_ms') else row[field]
+                                      for field in FIELDS])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='计算trace中每条流和每条链路的RFC 3550抖动')
+    parser.add_argument('traces', nargs='+', help='trace文件')
+    parser.add_argument('-o', '--output', help='写入CSV文件 (默认打印到标准输出)')
+    parser.add_argument('--flow-key', choices=FLOW_KEYS, default='src')
+    parser.add_argument('--type', default='tcp', help="统计的包类型, 'all' 表示所有类型 (默认tcp)")
+    args = parser.parse_args(argv)
+
+    packet_type = None if args.type == 'all' else args.type.encode()
+    results = {trace_file: trace_jitter(trace_file, args.flow_key, packet_type)
+               for trace_file in args.traces}
+    if args.output:
+        write_csv(args.output, results, name_column='Trace')
+    else:
+        _write_rows(sys.stdout, results, 'Trace')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+link_filter.py - 按链路筛选trace事件
+
+trace-all 会在数据包经过的每一条链路上都记录 + - r 事件。
+在 renoCode.tcl 等模板的6节点拓扑中, 每个数据包要经过3条链路,
+不加筛选时发送和接收都会被重复计数。LinkFilter 为每种事件指定
+只在哪些链路上计数, 例如:
+
+    '+' 只在 n1->n3 / n2->n3 (源端发出)
+    'r' 只在 n4->n5 / n4->n6 (到达目的端)
+    'd' 只在 n3->n4 (瓶颈链路)
+
+节点号与TCL中的创建顺序一致: n1 为节点0, n2 为节点1, 依此类推。
+没有指定链路的事件不受限制。
+"""
+
+import numpy as np
+
+
+def node_id(name):
+    """把 'n3' 或 '2' 这样的节点名转换为NS2节点号"""
+    name = str(name).strip()
+    if name.startswith('n'):
+        return int(name[1:]) - 1
+    return int(name)
+
+
+class LinkFilter:
+    """按 (事件, from节点, to节点) 筛选trace行"""
+
+    def __init__(self, send=None, recv=None, drop=None):
+        """
+        参数:
+            send: '+' 事件允许的 (from, to) 链路列表, None 表示不限制
+            recv: 'r' 事件允许的链路列表
+            drop: 'd' 事件允许的链路列表
+        """
+        self.links = {}
+        for event, links in (('+', send), ('r', recv), ('d', drop)):
+            if links is not None:
+                self.links[event] = [(node_id(a), node_id(b)) for a, b in links]
+
+        # 逐行解析使用的字符串形式
+        self._allowed = {(event, str(a), str(b))
+                         for event, links in self.links.items() for a, b in links}
+        self.restricted_events = frozenset(self.links)
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        从字符串创建过滤器
+
+        格式: "+:n1-n3,n2-n3 r:n4-n5,n4-n6 d:n3-n4" (节点名也可以直接写节点号)
+        """
+        kwargs = {}
+        names = {'+': 'send', 'r': 'recv', 'd': 'drop'}
+        for part in spec.split():
+            event, _, links = part.partition(':')
+            if event not in names:
+                raise ValueError(f"不支持的事件类型: {event}")
+            kwargs[names[event]] = [tuple(link.split('-')) for link in links.split(',') if link]
+        return cls(**kwargs)
+
+    def accepts(self, event, from_node, to_node):
+        """逐行判断: event/from_node/to_node 为trace中的原始字符串"""
+        if event not in self.restricted_events:
+            return True
+        return (event, from_node, to_node) in self._allowed
+
+    def mask(self, cols):
+        """对 trace_reader 列字典返回保留行的布尔数组"""
+        keep = np.ones(len(cols['event']), dtype=bool)
+        for event, links in self.links.items():
+            is_event = cols['event'] == event.encode()
+            on_link = np.zeros(len(keep), dtype=bool)
+            for a, b in links:
+                on_link |= (cols['from_node'] == a) & (cols['to_node'] == b)
+            keep &= ~is_event | on_link
+        return keep
+
+    def traced_links(self):
+        """过滤器涉及的所有链路 (from, to), 按首次出现的顺序"""
+        links = []
+        for event_links in self.links.values():
+            for link in event_links:
+                if link not in links:
+                    links.append(link)
+        return links
+
+    def spec(self):
+        """返回 LinkFilter.parse 可以读回的字符串形式"""
+        parts = []
+        for event, links in self.links.items():
+            parts.append(event + ':' + ','.join(f'{a}-{b}' for a, b in links))
+        return ' '.join(parts)
+
+    def __repr__(self):
+        return f"LinkFilter.parse({self.spec()!r})"
+
+
+def dumbbell_bottleneck(flows=2):
+    """N条流哑铃拓扑的瓶颈链路 (左路由器, 右路由器)"""
+    return flows, flows + 1
+
+
+def dumbbell_filter(flows=2):
+    """
+    scenario.py 生成的N条流哑铃拓扑的端到端计数方式
+
+    源节点为 0..N-1, 路由器为 N 和 N+1, 目的节点为 N+2..2N+1
+    """
+    left, right = dumbbell_bottleneck(flows)
+    return LinkFilter(send=[(i, left) for i in range(flows)],
+                      recv=[(right, right + 1 + i) for i in range(flows)],
+                      drop=[(left, right)])
+
+
+# 模板中哑铃拓扑的端到端计数方式:
+# '+' 只在 n1->n3 / n2->n3, 'r' 只在 n4->n5 / n4->n6, 'd' 只在 n3->n4
+DUMBBELL_FILTER = dumbbell_filter(2)
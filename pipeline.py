@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pipeline.py - 增量重新分析
+
+analyser3.py 的每一步在状态文件中记录输入的指纹, 再次运行时只执行
+输入发生变化 (或输出文件不存在) 的步骤:
+
+    trace文件 --(大小、修改时间、.links 过滤器、分析设置)--> 摘要 (保存在状态文件中)
+    摘要      --(所用指标的哈希)-->                          CSV / 图表
+
+例如重新生成 yeahTrace_red.tr 之后再运行, 只会重新解析这一个trace,
+并重写依赖它的 partB_droptail_vs_red.csv 和 partB_comparison.png;
+指标没有变化时连这两个文件也不会重写。
+
+状态文件为 JSON, 默认是输出目录下的 .analysis_state.json,
+删除它 (或使用 --force) 即可完整地重新分析。
+"""
+
+import hashlib
+import json
+import os
+
+import trace_layout
+
+STATE_FILE = '.analysis_state.json'
+STATE_VERSION = 5
+
+
+def digest_of(value):
+    """JSON可序列化的值的哈希"""
+    text = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def trace_fingerprint(trace_file):
+    """
+    trace文件的指纹: 大小和修改时间, 精简布局时还包括 .links 中的过滤器,
+    提前结束的仿真还包括 .steady 中的预热期边界和结束时间; 文件不存在时返回None
+    """
+    if not os.path.isfile(trace_file):
+        return None
+    st = os.stat(trace_file)
+    info = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    link_filter = trace_layout.link_filter_for(trace_file)
+    if link_filter is not None:
+        info['links'] = link_filter.spec()
+    steady = trace_layout.read_steady(trace_file)
+    if steady is not None:
+        info['steady'] = [steady.get('warmup'), steady.get('end')]
+    return info
+
+
+class Pipeline:
+    """记录每一步输入指纹的增量执行器"""
+
+    def __init__(self, state_file=STATE_FILE, settings=None, force=False):
+        """
+        参数:
+            state_file: 状态文件路径; None 表示不保存状态 (每一步都执行)
+            settings: 影响摘要的分析设置 (链路过滤器等), 改变后所有摘要失效
+            force: 忽略已有的状态, 执行所有步骤
+        """
+        self.state_file = state_file
+        self.settings = digest_of(settings or {})
+        self.force = force
+        self.state = self._load()
+        # 本次运行中执行 / 跳过的步骤
+        self.ran = []
+        self.skipped = []
+
+    def _load(self):
+        empty = {'version': STATE_VERSION, 'traces': {}, 'outputs': {}}
+        if self.state_file is None or self.force:
+            return empty
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return empty
+        if state.get('version') != STATE_VERSION:
+            return empty
+        return state
+
+    def save(self):
+        """原子地写入状态文件"""
+        if self.state_file is None:
+            return
+        tmp_path = self.state_file + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.state_file)
+
+    def _trace_inputs(self, trace_file, variant):
+        return {'fingerprint': trace_fingerprint(trace_file), 'variant': variant,
+                'settings': self.settings}
+
+    def summaries(self, tasks, analyze, extras=()):
+        """
+        返回每个trace的摘要, 只分析输入发生变化的trace
+
+        参数:
+            tasks: (key, trace_file, variant) 列表
+            analyze: 分析函数, 接收需要重新分析的 tasks, 返回 key -> 摘要字典
+                     (与 analyser3.analyze_traces 相同)
+            extras: 摘要中需要的额外项 (见 analyser3.summarize_trace), 非空时以
+                    analyze(tasks, extras=...) 请求; 已记录的摘要缺少其中某项时重新分析,
+                    并保留它原有的额外项, 多个Part共用的trace不会来回重新分析
+        返回:
+            key -> 摘要字典
+
+        不存在的trace每次都交给 analyze (由它输出警告), 但不记录状态。
+        """
+        tasks = list(tasks)
+        traces = self.state['traces']
+        results = {}
+        stale = []
+        needed = set(extras)
+        for key, trace_file, variant in tasks:
+            entry = traces.get(os.path.abspath(trace_file))
+            inputs = self._trace_inputs(trace_file, variant)
+            if entry is None or inputs['fingerprint'] is None or entry['inputs'] != inputs:
+                stale.append((key, trace_file, variant))
+            elif not set(extras) <= set(entry['extras']):
+                stale.append((key, trace_file, variant))
+                needed.update(entry['extras'])
+            else:
+                results[key] = entry['summary']
+                self.skipped.append(trace_file)
+
+        if stale:
+            needed = tuple(sorted(needed))
+            fresh = analyze(stale, extras=needed) if needed else analyze(stale)
+            for key, trace_file, variant in stale:
+                results[key] = fresh[key]
+                inputs = self._trace_inputs(trace_file, variant)
+                if inputs['fingerprint'] is None:
+                    traces.pop(os.path.abspath(trace_file), None)
+                    continue
+                traces[os.path.abspath(trace_file)] = {'inputs': inputs, 'extras': list(needed),
+                                                       'summary': fresh[key]}
+                self.ran.append(trace_file)
+            self.save()
+        return results
+
+    def step(self, output, inputs, produce):
+        """
+        需要时生成一个输出文件
+
+        参数:
+            output: 输出文件路径
+            inputs: 生成该文件所用的全部数据 (JSON可序列化)
+            produce: produce(output) 写出文件
+        返回:
+            是否执行了该步骤
+        """
+        key = os.path.abspath(output)
+        inputs_digest = digest_of(inputs)
+        entry = self.state['outputs'].get(key)
+        if entry is not None and entry['inputs'] == inputs_digest and os.path.exists(output):
+            self.skipped.append(output)
+            return False
+
+        produce(output)
+        self.state['outputs'][key] = {'inputs': inputs_digest}
+        self.ran.append(output)
+        self.save()
+        return True
+
+    def report(self):
+        """本次运行的统计"""
+        return f"执行 {len(self.ran)} 步, 跳过 {len(self.skipped)} 步 (输入未变化)"
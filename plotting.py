@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+plotting.py - 图表输出
+
+- 可配置的输出格式 ('png' / 'svg' / 'none') 和PNG分辨率
+- Plotter: 在单独的工作进程中生成图表, 分析进程提交绘图任务后继续计算,
+  结束前统一等待
+- lttb / downsample: 绘制很长的时间序列前用 LTTB (Largest-Triangle-Three-Buckets)
+  降采样, 保留曲线的形状, 10万点的亚秒级序列也能很快画完
+
+绘图任务必须是模块级函数, 参数可以pickle。
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# 支持的输出格式, 'none' 表示不生成图表
+FORMATS = ('png', 'svg', 'none')
+
+# 时间序列超过这个点数时降采样
+MAX_POINTS = 2000
+
+
+def figure_path(path, fmt):
+    """
+    按输出格式替换扩展名
+
+    'none' 时返回None
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"未知的图表格式: {fmt}")
+    if fmt == 'none':
+        return None
+    return os.path.splitext(path)[0] + '.' + fmt
+
+
+def save_figure(fig, path, dpi=300):
+    """保存并关闭图表; 矢量格式忽略dpi"""
+    import matplotlib.pyplot as plt
+    fig.savefig(path, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets 降采样
+
+    保留第一个和最后一个点, 其余的点分成 threshold-2 个桶,
+    每个桶选出与前一个选中点、下一个桶的平均点构成最大三角形的点。
+
+    返回:
+        (x, y) 降采样后的数组
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    # 第 i 个桶 (1..threshold-2) 覆盖 [edges[i], edges[i+1])
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    prev = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # 下一个桶的平均点 (最后一个桶用最后一个点)
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+            avg_x = x[next_start:next_end].mean()
+            avg_y = y[next_start:next_end].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        areas = np.abs((x[prev] - avg_x) * (y[start:end] - y[prev])
+                       - (x[prev] - x[start:end]) * (avg_y - y[prev]))
+        prev = start + int(np.argmax(areas))
+        selected[i + 1] = prev
+    return x[selected], y[selected]
+
+
+def downsample(x, y, max_points=MAX_POINTS):
+    """点数超过max_points时用LTTB降采样, 否则原样返回"""
+    if max_points is None or len(x) <= max_points:
+        return x, y
+    return lttb(x, y, max_points)
+
+
+def _timed_call(func, *args, **kwargs):
+    """执行一个绘图任务, 返回耗时 (秒)"""
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+class Plotter:
+    """
+    绘图任务的执行器
+
+    deferred=True 时任务在单独的工作进程中按提交顺序执行, wait() 等待全部完成
+    (并抛出绘图中的异常); 否则提交时立即在当前进程中执行。
+    给出 stats (instrument.Stats) 时每个任务的绘制耗时记为阶段 'render/<函数名>'。
+    """
+
+    def __init__(self, deferred=True, stats=None):
+        self.deferred = deferred
+        self.stats = stats
+        self._pool = None
+        self._futures = []
+
+    def _record(self, func, seconds):
+        if self.stats is not None:
+            self.stats.add_time(f'render/{func.__name__}', seconds)
+
+    def submit(self, func, *args, **kwargs):
+        """提交一个绘图任务"""
+        if not self.deferred:
+            self._record(func, _timed_call(func, *args, **kwargs))
+            return
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=1)
+        self._futures.append((func, self._pool.submit(_timed_call, func, *args, **kwargs)))
+
+    def wait(self):
+        """等待所有已提交的任务完成"""
+        try:
+            for func, future in self._futures:
+                self._record(func, future.result())
+        finally:
+            self._futures = []
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
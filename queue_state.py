@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+queue_state.py - 由trace中的 '+' / '-' / 'd' 事件重建链路队列的状态
+
+ns 在每条被跟踪的链路上记录:
+
+    +  包进入链路的队列
+    -  包离开队列, 开始发送
+    d  包被丢弃 (DropTail 队列满时, 或 RED 提前丢弃)
+
+把一条链路上的事件按时间排序后, 每个事件对队列长度的贡献为 +1 / -1 / 0,
+累加和就是每个事件之后的瞬时队列长度。被丢弃的包虽然也有 '+' 事件,
+但从未真正占用队列, 它的 '+' 和 'd' 都记为0; 没有 '+' 的 'd' 同样记为0。
+
+由此得到:
+- 瞬时队列长度和按时间加权的平均队列长度 (任意时间段, 用面积的累加和查询)
+- 每个包的排队时间 (sojourn time): 按uid连接 '+' 和 '-'
+- 丢包时的队列长度: 队列已满时的丢包 (DropTail 的尾部丢弃) 与未满时的
+  提前丢弃 (RED) 分开统计
+
+队列 "满" 按 ns-2 的语义: DropTail 在 q_->length() + 1 >= qlim_ 时丢包, RED 也在
+入队后的长度达到 qlim 时丢包, 正在发送的包不在队列中, 所以 queue-limit 为 limit 时
+重建出的队列长度最多为 limit - 1, 达到 limit - 1 即为满 (见 LinkQueue.full_length)。
+
+除了读取trace只有排序 (np.argsort / np.unique), O(n log n);
+按块读取时只保留所选链路上的事件。
+
+    queues = queue_state.queues_of_trace('yeahTrace_red.tr', [(2, 3)], limit=10)
+    queues[(2, 3)].summary()
+"""
+
+import numpy as np
+
+import trace_mmap
+
+# 排队时间的百分位数
+SOJOURN_PERCENTILES = (50, 90, 99)
+
+
+class LinkQueue:
+    """一条链路的队列状态"""
+
+    def __init__(self, link, events, times, uids, limit=None):
+        """
+        参数:
+            link: (from, to)
+            events, times, uids: 该链路上的 '+' / '-' / 'd' 事件, 按trace中的顺序
+            limit: 队列长度上限 (TCL中的 queue-limit), 队列长度达到 limit - 1 时为满;
+                   None 表示把观察到的最大长度当作满 (limit 记为最大长度 + 1)
+        """
+        self.link = tuple(link)
+        order = np.argsort(times, kind='stable')
+        events = np.asarray(events)[order]
+        self.times = np.asarray(times, dtype=np.float64)[order]
+        uids = np.asarray(uids, dtype=np.int64)[order]
+
+        enqueue, dequeue, drop = events == b'+', events == b'-', events == b'd'
+        # 被丢弃的包的 '+' 不计入队列长度
+        dropped = np.isin(uids, uids[drop]) & enqueue
+        steps = enqueue.astype(np.int64) - dequeue - dropped
+        self.lengths = np.cumsum(steps)
+        # 到达队列的包 (包括被丢弃的) 和离开队列的包
+        self.arrival_times = np.sort(np.concatenate([self.times[enqueue & ~dropped], self.times[drop]]))
+        self.dequeue_times = self.times[dequeue]
+
+        # 丢包时的队列长度 (丢包事件之前)
+        self.drop_times = self.times[drop]
+        self.drop_lengths = self.lengths[drop]
+        observed = int(self.lengths.max()) if len(self.lengths) else 0
+        self.limit = max(observed, 1) + 1 if limit is None else int(limit)
+        # 队列满时的长度 (ns-2 的 qlim 包括了正在发送的包)
+        self.full_length = self.limit - 1
+
+        # 排队时间: 同一个uid的第一个 '+' 和第一个 '-'
+        enq_uids, enq_first = np.unique(uids[enqueue], return_index=True)
+        deq_uids, deq_first = np.unique(uids[dequeue], return_index=True)
+        _, e, d = np.intersect1d(enq_uids, deq_uids, assume_unique=True, return_indices=True)
+        departed = self.times[dequeue][deq_first[d]]
+        sojourn_order = np.argsort(departed, kind='stable')
+        self.departure_times = departed[sojourn_order]
+        self.sojourn = (departed - self.times[enqueue][enq_first[e]])[sojourn_order]
+
+        # 队列长度曲线下的面积, 用于任意时间段的时间加权平均
+        widths = np.diff(self.times)
+        self._area = np.concatenate([[0.0], np.cumsum(self.lengths[:-1] * widths)])
+
+    @classmethod
+    def from_trace(cls, trace_file, link, limit=None, packet_type=None):
+        """读取一次trace文件得到一条链路的队列状态"""
+        return queues_of_trace(trace_file, [link], limit, packet_type)[tuple(link)]
+
+    def __len__(self):
+        return len(self.times)
+
+    def length_at(self, t):
+        """时刻t (可以是数组) 之后的瞬时队列长度, 第一个事件之前 (以及没有事件时) 为0"""
+        if not len(self.times):
+            return np.zeros(np.shape(t), dtype=np.int64)
+        index = np.searchsorted(self.times, t, side='right') - 1
+        return np.where(index >= 0, self.lengths[np.maximum(index, 0)], 0)
+
+    def _area_at(self, t):
+        t = np.asarray(t, dtype=np.float64)
+        if not len(self.times):
+            return np.zeros(t.shape)
+        index = np.searchsorted(self.times, t, side='right') - 1
+        safe = np.maximum(index, 0)
+        area = self._area[safe] + self.lengths[safe] * (t - self.times[safe])
+        return np.where(index >= 0, area, 0.0)
+
+    def _span(self, start, end):
+        if not len(self.times):
+            return 0.0, 0.0
+        start = self.times[0] if start is None else start
+        end = self.times[-1] if end is None else end
+        return start, end
+
+    def mean_length(self, start=None, end=None):
+        """[start, end) 内按时间加权的平均队列长度 (默认从第一个事件到最后一个事件)"""
+        start, end = self._span(start, end)
+        if end <= start:
+            return 0.0
+        return float((self._area_at(end) - self._area_at(start)) / (end - start))
+
+    def full_fraction(self, start=None, end=None):
+        """[start, end) 内队列长度达到上限的时间比例"""
+        start, end = self._span(start, end)
+        if end <= start or not len(self.times):
+            return 0.0
+        edges = np.clip(np.append(self.times, end), start, end)
+        full = self.lengths >= self.full_length
+        return float(np.sum(np.diff(edges)[full]) / (end - start))
+
+    def sample(self, step=1.0):
+        """
+        每 step 秒的时间加权平均队列长度
+
+        返回 (每段的开始时间, 平均长度), 从0时刻到最后一个事件
+        """
+        if step <= 0:
+            raise ValueError(f"取样步长必须为正数: {step}")
+        if not len(self.times):
+            return np.empty(0), np.empty(0)
+        edges = np.arange(0.0, self.times[-1] + step, step)
+        areas = self._area_at(edges)
+        return edges[:-1], np.diff(areas) / step
+
+    def summary(self, start=None, end=None):
+        """
+        队列统计 (JSON可序列化), start/end 限定时间段 (例如去掉预热期);
+        链路上没有事件时各项均为0
+        """
+        start, end = self._span(start, end)
+
+        def within(times):
+            return (times >= start) & (times < end) if end > start else np.zeros(len(times), dtype=bool)
+
+        drop_lengths = self.drop_lengths[within(self.drop_times)]
+        sojourn = self.sojourn[within(self.departure_times)]
+        lengths = np.append(self.lengths[within(self.times)], self.length_at(start))
+        arrivals = int(within(self.arrival_times).sum())
+        at_full = int(np.sum(drop_lengths >= self.full_length))
+        result = {
+            'link': f'{self.link[0]}-{self.link[1]}',
+            'limit': self.limit,
+            'arrivals': arrivals,
+            'departures': int(within(self.dequeue_times).sum()),
+            'drops': int(len(drop_lengths)),
+            'drops_at_full': at_full,
+            'early_drops': int(len(drop_lengths)) - at_full,
+            'drop_rate': len(drop_lengths) / arrivals if arrivals else 0.0,
+            'mean_length': self.mean_length(start, end),
+            'max_length': int(lengths.max()),
+            'full_fraction': self.full_fraction(start, end),
+            'mean_sojourn': float(sojourn.mean()) if len(sojourn) else 0.0,
+            'max_sojourn': float(sojourn.max()) if len(sojourn) else 0.0,
+        }
+        for q, value in zip(SOJOURN_PERCENTILES,
+                            np.percentile(sojourn, SOJOURN_PERCENTILES) if len(sojourn)
+                            else [0.0] * len(SOJOURN_PERCENTILES)):
+            result[f'sojourn_p{q}'] = float(value)
+        return result
+
+
+def queues_of_trace(trace_file, links, limit=None, packet_type=None):
+    """
+    读取一次trace文件 (支持压缩的trace), 重建多条链路的队列
+
+    参数:
+        links: (from, to) 列表
+        limit: 队列长度上限 (TCL中的 queue-limit), 所有链路相同; None 表示取各自观察到的最大长度
+        packet_type: 只统计该类型的包 (例如 b'tcp'), None 表示所有类型
+    返回:
+        (from, to) -> LinkQueue
+    """
+    return queues_of_columns(trace_mmap.iter_trace_blocks(trace_file), links, limit, packet_type)
+
+
+def queues_of_columns(blocks, links, limit=None, packet_type=None):
+    """由 trace_reader 格式的列字典 (一个或多个块) 重建多条链路的队列"""
+    links = [tuple(link) for link in links]
+    if isinstance(blocks, dict):
+        blocks = [blocks]
+    parts = {link: ([], [], []) for link in links}
+    for cols in blocks:
+        keep = np.isin(cols['event'], [b'+', b'-', b'd'])
+        if packet_type is not None:
+            keep &= cols['type'] == packet_type
+        for link in links:
+            on_link = keep & (cols['from_node'] == link[0]) & (cols['to_node'] == link[1])
+            for part, name in zip(parts[link], ('event', 'time', 'uid')):
+                part.append(cols[name][on_link])
+    queues = {}
+    for link, (events, times, uids) in parts.items():
+        queues[link] = LinkQueue(link, np.concatenate(events) if events else np.empty(0, dtype='S1'),
+                                 np.concatenate(times) if times else np.empty(0),
+                                 np.concatenate(uids) if uids else np.empty(0, dtype=np.int64),
+                                 limit)
+    return queues
@@ -1,4 +1,4 @@
-
+# Generated by scenario.py - edit the generator, not this file
 # Simulation Topology
 #              n1                  n5
 #               \                  /
@@ -6,7 +6,7 @@
 #              n3 --------------- n4
 #   4000Mb,800ms /                \ 4000Mb,800ms
 #               /                  \
-#             n2                   n6 
+#             n2                   n6
 
 set ns [new Simulator]
 
@@ -36,7 +36,7 @@ set n5 [$ns node]
 set n6 [$ns node]
 
 $ns duplex-link $n1 $n3 4000Mb 500ms DropTail
-$ns duplex-link $n2 $n3 4000Mb 800ms DropTail 
+$ns duplex-link $n2 $n3 4000Mb 800ms DropTail
 $ns duplex-link $n3 $n4 1000Mb 50ms DropTail
 $ns duplex-link $n4 $n5 4000Mb 500ms DropTail
 $ns duplex-link $n4 $n6 4000Mb 800ms DropTail
@@ -75,28 +75,24 @@ $ns connect $source2 $sink2
 $source2 set fid_ 2
 
 $source1 attach $tracefile1
-$source1 tracevar cwnd_ 
+$source1 tracevar cwnd_
 $source1 tracevar ssthresh_
 $source1 tracevar ack_
 $source1 tracevar maxseq_
 $source1 tracevar rtt_
 
 $source2 attach $tracefile1
-$source2 tracevar cwnd_ 
+$source2 tracevar cwnd_
 $source2 tracevar ssthresh_
 $source2 tracevar ack_
 $source2 tracevar maxseq_
 $source2 tracevar rtt_
 
-
 set myftp1 [new Application/FTP]
 $myftp1 attach-agent $source1
-
-
 set myftp2 [new Application/FTP]
 $myftp2 attach-agent $source2
 
-
 $ns at 0.0 "$myftp2 start"
 $ns at 0.0 "$myftp1 start"
 
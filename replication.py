@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+replication.py - 重复运行的置信区间和自适应的运行次数
+
+confidence_interval() 计算样本均值的置信区间半宽:
+
+- 't': Student t 分布, mean ± t_{(1+level)/2, n-1} * s / sqrt(n), s 为样本标准差
+- 'bootstrap': 百分位 bootstrap, 重抽样均值的 [(1-level)/2, (1+level)/2] 分位数
+
+SequentialSampler 按批增加运行次数: 每批运行结束后更新每个指标的均值和置信区间,
+所有指标的半宽都小于 target * |均值| 时停止, 或者达到运行次数上限:
+
+    sampler = SequentialSampler(['goodput', 'plr'], target=0.05, max_runs=20)
+    sampler.run(run_batch)      # run_batch(运行编号列表) -> 每次运行的指标字典列表
+
+t 分布的分位数由整数自由度下CDF的有限级数二分求得, 不依赖 scipy。
+"""
+
+import math
+import os
+
+import numpy as np
+
+CI_METHODS = ('t', 'bootstrap')
+DEFAULT_LEVEL = 0.95
+BOOTSTRAP_RESAMPLES = 2000
+
+
+def t_cdf(t, df):
+    """自由度为整数df的 Student t 分布的CDF"""
+    theta = math.atan2(t, math.sqrt(df))
+    s, c = math.sin(theta), math.cos(theta)
+    total = term = 1.0
+    if df % 2:
+        if df == 1:
+            return 0.5 + theta / math.pi
+        for k in range(3, df, 2):
+            term *= c * c * (k - 1) / k
+            total += term
+        return 0.5 + (theta + s * c * total) / math.pi
+    for k in range(2, df, 2):
+        term *= c * c * (k - 1) / k
+        total += term
+    return 0.5 + s * total / 2
+
+
+def t_quantile(p, df):
+    """Student t 分布的p分位数 (0.5 <= p < 1)"""
+    if not 0.5 <= p < 1:
+        raise ValueError(f"分位数必须在 [0.5, 1) 内: {p}")
+    lo, hi = 0.0, 1.0
+    while t_cdf(hi, df) < p:
+        hi *= 2
+    for _ in range(100):
+        mid = (lo + hi) / 2
+        if t_cdf(mid, df) < p:
+            lo = mid
+        else:
+            hi = mid
+    return (lo + hi) / 2
+
+
+def confidence_interval(values, level=DEFAULT_LEVEL, method='t', resamples=BOOTSTRAP_RESAMPLES, seed=0):
+    """
+    样本均值的置信区间
+
+    返回:
+        (均值, 半宽); 少于2个样本时半宽为 inf
+    """
+    if method not in CI_METHODS:
+        raise ValueError(f"未知的置信区间方法: {method}")
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n == 0:
+        return float('nan'), float('inf')
+    mean = float(values.mean())
+    if n < 2:
+        return mean, float('inf')
+    if method == 't':
+        return mean, t_quantile((1 + level) / 2, n - 1) * float(values.std(ddof=1)) / math.sqrt(n)
+    rng = np.random.default_rng(seed)
+    means = values[rng.integers(n, size=(resamples, n))].mean(axis=1)
+    lo, hi = np.percentile(means, [50 * (1 - level), 50 * (1 + level)])
+    return mean, float(hi - lo) / 2
+
+
+def relative_half_width(mean, half_width):
+    """半宽相对于均值的比例; 均值为0时, 半宽为0记为0, 否则为 inf"""
+    if mean == 0 or not math.isfinite(mean):
+        return 0.0 if half_width == 0 else float('inf')
+    return half_width / abs(mean)
+
+
+class SequentialSampler:
+    """按批增加运行次数, 直到每个指标的置信区间足够窄"""
+
+    def __init__(self, metrics, target=0.05, level=DEFAULT_LEVEL, method='t',
+                 min_runs=3, max_runs=20, batch_size=None):
+        """
+        参数:
+            metrics: 指标名列表
+            target: 停止条件, 每个指标的半宽 / |均值| 都小于它
+            level: 置信水平
+            method: 't' 或 'bootstrap'
+            min_runs: 判断收敛前至少运行的次数
+            max_runs: 运行次数上限 (包括失败的运行)
+            batch_size: 每批并行运行的次数 (默认CPU核数)
+        """
+        if method not in CI_METHODS:
+            raise ValueError(f"未知的置信区间方法: {method}")
+        if min_runs < 2 or max_runs < min_runs:
+            raise ValueError(f"运行次数设置无效: min_runs={min_runs}, max_runs={max_runs}")
+        self.metrics = list(metrics)
+        self.target = target
+        self.level = level
+        self.method = method
+        self.min_runs = min_runs
+        self.max_runs = max_runs
+        self.batch_size = batch_size or os.cpu_count() or 1
+        self.samples = {metric: [] for metric in self.metrics}
+        self.launched = 0
+        self.history = []  # 每批之后的 intervals()
+
+    @property
+    def runs(self):
+        """成功的运行次数"""
+        return len(self.samples[self.metrics[0]]) if self.metrics else 0
+
+    def add(self, results):
+        """加入一批运行的指标字典, 失败的运行为 None"""
+        for result in results:
+            if result is None:
+                continue
+            for metric in self.metrics:
+                self.samples[metric].append(float(result[metric]))
+
+    def intervals(self):
+        """指标名 -> (均值, 半宽, 相对半宽)"""
+        intervals = {}
+        for metric, values in self.samples.items():
+            mean, half = confidence_interval(values, self.level, self.method)
+            intervals[metric] = (mean, half, relative_half_width(mean, half))
+        return intervals
+
+    def converged(self):
+        """所有指标的相对半宽都小于目标"""
+        if self.runs < self.min_runs:
+            return False
+        return all(rel < self.target for _, _, rel in self.intervals().values())
+
+    def done(self):
+        return self.converged() or self.launched >= self.max_runs
+
+    def next_batch(self):
+        """下一批的运行编号 (从1开始); 第一批至少 min_runs 次"""
+        size = max(self.batch_size, self.min_runs - self.runs)
+        size = min(size, self.max_runs - self.launched)
+        return list(range(self.launched + 1, self.launched + size + 1))
+
+    def run(self, run_batch, log=print):
+        """
+        逐批运行直到收敛或达到上限
+
+        参数:
+            run_batch: run_batch(运行编号列表) -> 与之对应的指标字典列表 (失败为None)
+            log: 进度输出函数, None 表示不输出
+        返回:
+            intervals()
+        """
+        while not self.done():
+            numbers = self.next_batch()
+            self.launched += len(numbers)
+            self.add(run_batch(numbers))
+            intervals = self.intervals()
+            self.history.append(intervals)
+            if log is not None:
+                widths = ', '.join(f"{metric} ±{half:.4g} ({rel:.1%})"
+                                   for metric, (_, half, rel) in intervals.items())
+                log(f"  {self.runs} 次运行: {widths}")
+        if log is not None:
+            status = '已收敛' if self.converged() else f'达到运行次数上限 {self.max_runs}'
+            log(f"  {status}: 目标相对半宽 {self.target:.1%}, {self.level:.0%} {self.method} 置信区间")
+        return self.intervals()
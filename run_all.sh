@@ -16,47 +16,28 @@ echo ""
 echo "Part A: 运行DropTail仿真..."
 echo "------------------------------------------"
 
-if [ ! -f "renoTrace.tr" ]; then
-    echo "运行 Reno..."
-    ns renoCode.tcl
-else
-    echo "renoTrace.tr 已存在，跳过"
-fi
-
-if [ ! -f "cubicTrace.tr" ]; then
-    echo "运行 Cubic..."
-    ns cubicCode.tcl
-else
-    echo "cubicTrace.tr 已存在，跳过"
-fi
-
-if [ ! -f "vegasTrace.tr" ]; then
-    echo "运行 Vegas..."
-    ns vegasCode.tcl
-else
-    echo "vegasTrace.tr 已存在，跳过"
-fi
+# 需要运行的仿真作业, 最后交给 sim_runner.py 并行执行
+SIM_JOBS=()
+TEMP_FILES=()
 
-if [ ! -f "yeahTrace.tr" ]; then
-    echo "运行 Yeah..."
-    ns yeahCode.tcl
-else
-    echo "yeahTrace.tr 已存在，跳过"
-fi
+for variant in reno cubic vegas yeah; do
+    if [ ! -f "${variant}Trace.tr" ]; then
+        echo "加入作业: ${variant}"
+        SIM_JOBS+=("${variant}Code.tcl")
+    else
+        echo "${variant}Trace.tr 已存在，跳过"
+    fi
+done
 
-echo "DropTail仿真完成!"
 
 # Part B: 创建RED版本的TCL文件并运行
 echo ""
 echo "Part B: 准备RED仿真..."
 echo "------------------------------------------"
 
-# 创建RED版本的TCL文件
+# 由 scenario.py 生成RED版本的TCL文件 (只把队列类型换成RED)
 for variant in reno cubic vegas yeah; do
-    input_file="${variant}Code.tcl"
-    output_file="${variant}Code_red.tcl"
     trace_output="${variant}Trace_red.tr"
-    nam_output="${variant}_red.nam"
     
     # 检查RED trace是否已存在
     if [ -f "$trace_output" ]; then
@@ -64,18 +45,13 @@ for variant in reno cubic vegas yeah; do
         continue
     fi
     
-    # 替换DropTail为RED,并修改输出文件名
-    sed "s/DropTail/RED/g" "$input_file" | \
-    sed "s/${variant}Trace.tr/${trace_output}/g" | \
-    sed "s/${variant}.nam/${nam_output}/g" > "$output_file"
+    output_file=$(python3 scenario.py --variant "$variant" --queue RED --write .)
     
-    echo "运行 ${variant} (RED)..."
-    ns "$output_file"
-    rm -f "$output_file"
+    echo "加入作业: ${variant} (RED)"
+    SIM_JOBS+=("$output_file")
+    TEMP_FILES+=("$output_file")
 done
 
-echo "RED仿真完成!"
-
 # Part C: 运行多次仿真(可重复性测试)
 echo ""
 echo "Part C: 运行可重复性测试 (5次运行)..."
@@ -88,80 +64,37 @@ echo "清理旧的可重复性测试文件..."
 rm -f ${variant}Trace_run*.tr ${variant}_run*.nam
 
 for run_idx in {1..5}; do
-    echo "运行 ${variant} - 第 ${run_idx} 次..."
+    echo "准备 ${variant} - 第 ${run_idx} 次..."
     
-    temp_file="${variant}Code_run${run_idx}.tcl"
-    trace_output="${variant}Trace_run${run_idx}.tr"
-    nam_output="${variant}_run${run_idx}.nam"
-    
-    # 计算不同的随机种子
+    # 每次运行使用不同的随机种子, 启动时间抖动 (0到0.5秒) 由种子决定
     seed=$((run_idx * 12345 + 6789))
-    
-    # 计算启动时间抖动 (0到0.5秒的随机延迟)
-    jitter1=$(awk -v seed=$seed 'BEGIN{srand(seed); print rand() * 0.5}')
-    jitter2=$(awk -v seed=$((seed+999)) 'BEGIN{srand(seed+999); print rand() * 0.5}')
-    
-    # 使用awk创建修改后的TCL文件,添加随机种子和启动时间抖动
-    awk -v seed="$seed" -v trace="$trace_output" -v nam="$nam_output" \
-        -v jitter1="$jitter1" -v jitter2="$jitter2" '
-    {
-        # 修改trace文件名
-        if ($0 ~ /set tracefile1 \[open.*\.tr w\]/) {
-            print "set tracefile1 [open " trace " w]"
-            next
-        }
-        # 修改nam文件名
-        if ($0 ~ /set namfile \[open.*\.nam w\]/) {
-            print "set namfile [open " nam " w]"
-            next
-        }
-        # 在创建Simulator后添加随机种子
-        if ($0 ~ /set ns \[new Simulator\]/) {
-            print $0
-            print ""
-            print "# Random seed configuration - Run with different seed"
-            print "set rng [new RNG]"
-            print "$rng seed " seed
-            print ""
-            print "# Additional RNG for packet drops"
-            print "set rng2 [new RNG]"
-            print "$rng2 seed " (seed + 111)
-            print ""
-            print "# Set random seed for ns-random"
-            print "ns-random " seed
-            next
-        }
-        # 修改FTP1启动时间,添加随机抖动
-        if ($0 ~ /\$ns at 0\.0 "\$myftp1 start"/) {
-            print "$ns at " jitter1 " \"$myftp1 start\""
-            next
-        }
-        # 修改FTP2启动时间,添加随机抖动
-        if ($0 ~ /\$ns at 0\.0 "\$myftp2 start"/) {
-            print "$ns at " jitter2 " \"$myftp2 start\""
-            next
-        }
-        print $0
-    }' "${variant}Code.tcl" > "$temp_file"
+    temp_file=$(python3 scenario.py --variant "$variant" --seed "$seed" --jitter 0.5 \
+        --tag "run${run_idx}" --write .)
     
     echo "  随机种子: $seed"
-    echo "  FTP1启动时间抖动: $jitter1 秒"
-    echo "  FTP2启动时间抖动: $jitter2 秒"
-    echo "  输出文件: $trace_output"
+    echo "  输出文件: ${variant}Trace_run${run_idx}.tr"
     
-    # 运行仿真
-    ns "$temp_file"
-    
-    # 检查是否成功
+    SIM_JOBS+=("$temp_file")
+    TEMP_FILES+=("$temp_file")
+done
+
+# 并行运行所有仿真 (Part A + B + C), 并行度默认等于CPU核数
+echo ""
+echo "并行运行仿真..."
+echo "------------------------------------------"
+if [ ${#SIM_JOBS[@]} -gt 0 ]; then
+    python3 sim_runner.py "${SIM_JOBS[@]}"
+fi
+rm -f "${TEMP_FILES[@]}"
+
+for run_idx in {1..5}; do
+    trace_output="${variant}Trace_run${run_idx}.tr"
     if [ -f "$trace_output" ]; then
         size=$(du -h "$trace_output" | cut -f1)
-        echo "  ✓ 完成! 文件大小: $size"
+        echo "  ✓ ${trace_output} 完成! 文件大小: $size"
     else
-        echo "  ✗ 失败! 未生成trace文件"
+        echo "  ✗ ${trace_output} 失败! 未生成trace文件"
     fi
-    
-    # 清理临时文件
-    rm -f "$temp_file"
 done
 
 echo ""
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+scenario.py - 参数化的NS2仿真场景生成器
+
+按参数生成哑铃拓扑的TCL脚本, 代替手工复制的 renoCode.tcl 等文件、
+run_all.sh 中的 sed/awk 文本替换和 generate_runs.py 中原来的TCL文本替换。
+
+拓扑 (N 条流):
+    源节点 s1..sN -- 左路由器 ===瓶颈链路=== 右路由器 -- 目的节点 d1..dN
+
+节点按 源节点、两个路由器、目的节点 的顺序创建, N=2 时与原来的
+n1..n6 完全一致 (源节点为节点0和1, 瓶颈链路为 2->3)。
+
+参数:
+    variant       TCP变体 (reno / cubic / vegas / yeah)
+    queue         队列类型 (DropTail / RED ...)
+    bandwidth     瓶颈带宽, delay 瓶颈时延
+    queue_limit   瓶颈队列长度
+    flows         流的数量
+    jitter        FTP启动时间的最大随机抖动 (秒), 0 表示都在0时刻启动
+    seed          随机种子, None 表示不设置
+    duration      仿真时长 (秒)
+    lean          精简trace模式: 不写NAM, 只在端到端计数需要的链路上记录包事件,
+                  tracevar写到单独的文件 (见 trace_layout.py)
+
+用法:
+    # 生成Part A的四个TCL文件
+    python3 scenario.py --variant reno cubic vegas yeah --write .
+    # 参数扫描: 4个变体 x 2种队列 x 3种流数, 直接并行运行
+    python3 scenario.py --variant reno cubic vegas yeah --queue DropTail RED \\
+        --flows 2 8 32 --run -o sweep/
+"""
+
+import argparse
+import itertools
+import os
+import random
+import sys
+
+import sim_runner
+import trace_io
+import trace_layout
+from link_filter import dumbbell_filter
+
+# 变体 -> (发送端Agent, 接收端Agent, select_ca 算法名, 额外的发送端参数)
+VARIANTS = {
+    'reno': ('Agent/TCP/Reno', 'Agent/TCPSink', None, ()),
+    'cubic': ('Agent/TCP/Linux', 'Agent/TCPSink/Sack1', 'cubic', ()),
+    'vegas': ('Agent/TCP/Vegas', 'Agent/TCPSink/Sack1', None, ()),
+    'yeah': ('Agent/TCP/Linux', 'Agent/TCPSink/Sack1', 'yeah', (('windowSize_', 8),)),
+}
+
+# 参数默认值, 与原来的模板一致
+DEFAULTS = {
+    'variant': 'reno',
+    'queue': 'DropTail',
+    'bandwidth': '1000Mb',
+    'delay': '50ms',
+    'queue_limit': 10,
+    'flows': 2,
+    'jitter': 0.0,
+    'seed': None,
+    'duration': 100.0,
+    'lean': False,
+}
+
+# 接入链路: 带宽和时延 (按流的序号轮流使用)
+ACCESS_BANDWIDTH = '4000Mb'
+ACCESS_DELAYS = ('500ms', '800ms')
+
+# 每个发送端记录的tracevar
+TRACED_VARS = ('cwnd_', 'ssthresh_', 'ack_', 'maxseq_', 'rtt_')
+
+FLOW_COLORS = ('Blue', 'Red', 'Green', 'Orange', 'Purple', 'Brown')
+
+# 生成的默认模板 (Part A) 的文件头
+GENERATED_HEADER = '# Generated by scenario.py - edit the generator, not this file'
+
+
+class Scenario:
+    """一个仿真场景 (一组参数)"""
+
+    def __init__(self, variant=DEFAULTS['variant'], queue=DEFAULTS['queue'],
+                 bandwidth=DEFAULTS['bandwidth'], delay=DEFAULTS['delay'],
+                 queue_limit=DEFAULTS['queue_limit'], flows=DEFAULTS['flows'],
+                 jitter=DEFAULTS['jitter'], seed=DEFAULTS['seed'],
+                 duration=DEFAULTS['duration'], lean=DEFAULTS['lean'], tag=None):
+        """
+        参数见模块说明; tag 为输出文件名的后缀, 默认由与默认值不同的参数组成
+        """
+        if variant not in VARIANTS:
+            raise ValueError(f"未知的TCP变体: {variant}")
+        if flows < 1:
+            raise ValueError(f"流的数量必须为正数: {flows}")
+        self.variant = variant
+        self.queue = queue
+        self.bandwidth = bandwidth
+        self.delay = delay
+        self.queue_limit = int(queue_limit)
+        self.flows = int(flows)
+        self.jitter = float(jitter)
+        self.seed = None if seed is None else int(seed)
+        self.duration = float(duration)
+        self.lean = bool(lean)
+        self.tag = self._default_tag() if tag is None else tag
+
+    def _default_tag(self):
+        tokens = []
+        if self.queue != DEFAULTS['queue']:
+            tokens.append(self.queue.lower())
+        if self.bandwidth != DEFAULTS['bandwidth']:
+            tokens.append(f'bw{self.bandwidth}')
+        if self.delay != DEFAULTS['delay']:
+            tokens.append(f'd{self.delay}')
+        if self.queue_limit != DEFAULTS['queue_limit']:
+            tokens.append(f'q{self.queue_limit}')
+        if self.flows != DEFAULTS['flows']:
+            tokens.append(f'f{self.flows}')
+        if self.jitter != DEFAULTS['jitter']:
+            tokens.append(f'j{self.jitter:g}')
+        if self.seed is not None:
+            tokens.append(f's{self.seed}')
+        if self.duration != DEFAULTS['duration']:
+            tokens.append(f't{self.duration:g}')
+        if self.lean:
+            tokens.append('lean')
+        return '_'.join(tokens)
+
+    @property
+    def suffix(self):
+        return f'_{self.tag}' if self.tag else ''
+
+    @property
+    def name(self):
+        """作业名, 也是TCL文件名 (不含扩展名)"""
+        return f'{self.variant}Code{self.suffix}'
+
+    @property
+    def trace_file(self):
+        return f'{self.variant}Trace{self.suffix}.tr'
+
+    @property
+    def nam_file(self):
+        return f'{self.variant}{self.suffix}.nam'
+
+    @property
+    def vars_file(self):
+        return trace_layout.vars_file_for(self.trace_file)
+
+    def link_filter(self):
+        """端到端计数使用的链路过滤器, 精简模式只记录其中的链路"""
+        return dumbbell_filter(self.flows)
+
+    def params(self):
+        """返回参数字典"""
+        return {key: getattr(self, key) for key in DEFAULTS}
+
+    def start_times(self):
+        """每条流FTP的启动时间, 由种子决定"""
+        if self.jitter <= 0:
+            return [0.0] * self.flows
+        rng = random.Random(self.seed if self.seed is not None else 0)
+        return [rng.uniform(0, self.jitter) for _ in range(self.flows)]
+
+    def render(self):
+        """生成TCL脚本"""
+        n = self.flows
+        agent, sink_agent, congestion, extra = VARIANTS[self.variant]
+        # 节点名: 源节点 n1..nN, 路由器 n(N+1) n(N+2), 目的节点 n(N+3)..n(2N+2)
+        sources = [f'n{i + 1}' for i in range(n)]
+        left, right = f'n{n + 1}', f'n{n + 2}'
+        sinks = [f'n{n + 3 + i}' for i in range(n)]
+        access_delays = [ACCESS_DELAYS[i % len(ACCESS_DELAYS)] for i in range(n)]
+
+        out = [GENERATED_HEADER]
+        out += self._topology_comment(sources, left, right, sinks, access_delays)
+        out += ['', 'set ns [new Simulator]', '']
+        if self.seed is not None:
+            out += [
+                '# Random seed configuration',
+                'set rng [new RNG]',
+                f'$rng seed {self.seed}',
+                '',
+                '# Additional RNG for packet drops',
+                'set rng2 [new RNG]',
+                f'$rng2 seed {self.seed + 111}',
+                '',
+                '# Set random seed for ns-random',
+                f'ns-random {self.seed}',
+                '',
+            ]
+        for i in range(n):
+            out.append(f'$ns color {i + 1} {FLOW_COLORS[i % len(FLOW_COLORS)]}')
+        out.append('')
+        if self.lean:
+            out += [
+                '# Lean trace: packet events on selected links only, tracevars in a separate file',
+                f'set tracefile1 [open {self.trace_file} w]',
+                f'set varfile [open {self.vars_file} w]',
+                '',
+                'proc finish {} {',
+                '    global ns tracefile1 varfile',
+                '    $ns flush-trace',
+                '    close $tracefile1',
+                '    close $varfile',
+                '    exit 0',
+                '}',
+                '',
+            ]
+        else:
+            out += [
+                f'set namfile [open {self.nam_file} w]',
+                '$ns namtrace-all $namfile',
+                f'set tracefile1 [open {self.trace_file} w]',
+                '$ns trace-all $tracefile1',
+                '',
+                'proc finish {} {',
+                '    global ns namfile',
+                '    $ns flush-trace',
+                '    #Close the NAM trace file',
+                '    close $namfile',
+                '    #Execute NAM on the trace file',
+                f'    # exec nam {self.nam_file} &',
+                '    exit 0',
+                '}',
+                '',
+            ]
+
+        for node in sources + [left, right] + sinks:
+            out.append(f'set {node} [$ns node]')
+        out.append('')
+        for node, delay in zip(sources, access_delays):
+            out.append(f'$ns duplex-link ${node} ${left} {ACCESS_BANDWIDTH} {delay} {self.queue}')
+        out.append(f'$ns duplex-link ${left} ${right} {self.bandwidth} {self.delay} {self.queue}')
+        for node, delay in zip(sinks, access_delays):
+            out.append(f'$ns duplex-link ${right} ${node} {ACCESS_BANDWIDTH} {delay} {self.queue}')
+        out += [
+            '',
+            f'$ns queue-limit ${left} ${right} {self.queue_limit}',
+            f'$ns queue-limit ${right} ${left} {self.queue_limit}',
+            '',
+        ]
+        if self.lean:
+            names = sources + [left, right] + sinks
+            link_filter = self.link_filter()
+            for a, b in link_filter.traced_links():
+                out.append(f'$ns trace-queue ${names[a]} ${names[b]} $tracefile1')
+            out += [
+                f'set linksfile [open {trace_layout.links_file_for(self.trace_file)} w]',
+                f'puts $linksfile "{link_filter.spec()}"',
+                'close $linksfile',
+                '',
+            ]
+        for i, node in enumerate(sources):
+            out.append(f'$ns duplex-link-op ${node} ${left} orient {"right-down" if i % 2 == 0 else "right-up"}')
+        out.append(f'$ns duplex-link-op ${left} ${right} orient right')
+        for i, node in enumerate(sinks):
+            out.append(f'$ns duplex-link-op ${right} ${node} orient {"right-up" if i % 2 == 0 else "right-down"}')
+        out.append('')
+
+        for i in range(n):
+            k = i + 1
+            out.append(f'set source{k} [new {agent}]')
+            if congestion:
+                out.append(f'$ns at 0.0 "$source{k} select_ca {congestion}"')
+            out += [
+                f'$source{k} set class_ {n - i}',
+                f'$source{k} set ttl_ 64',
+            ]
+            out += [f'$source{k} set {var} {value}' for var, value in extra]
+            out += [
+                f'$source{k} set window_ 1000',
+                f'$source{k} set packet_size_ 1000',
+                '',
+                f'$ns attach-agent ${sources[i]} $source{k}',
+                f'set sink{k} [new {sink_agent}]',
+                f'$ns attach-agent ${sinks[i]} $sink{k}',
+                f'$ns connect $source{k} $sink{k}',
+                f'$source{k} set fid_ {k}',
+                '',
+            ]
+
+        var_channel = '$varfile' if self.lean else '$tracefile1'
+        for k in range(1, n + 1):
+            out.append(f'$source{k} attach {var_channel}')
+            out += [f'$source{k} tracevar {var}' for var in TRACED_VARS]
+            out.append('')
+
+        for k in range(1, n + 1):
+            out += [f'set myftp{k} [new Application/FTP]', f'$myftp{k} attach-agent $source{k}']
+        out.append('')
+        # 与原来的模板一样倒序启动 (myftpN 先于 myftp1): 同一时刻的事件按加入调度器的顺序执行
+        for k, start in reversed(list(enumerate(self.start_times(), start=1))):
+            out.append(f'$ns at {start:.6f} "$myftp{k} start"' if start else
+                       f'$ns at 0.0 "$myftp{k} start"')
+        out += [
+            '',
+            f'$ns at {self.duration} "finish"',
+            '',
+            '$ns run',
+            '',
+        ]
+        return '\n'.join(out)
+
+    def _topology_comment(self, sources, left, right, sinks, access_delays):
+        if len(sources) == 2:
+            return [
+                '# Simulation Topology',
+                f'#              {sources[0]}                  {sinks[0]}',
+                '#               \\                  /',
+                f'#   {ACCESS_BANDWIDTH},{access_delays[0]} \\   {self.bandwidth},{self.delay}  / {ACCESS_BANDWIDTH},{access_delays[0]}',
+                f'#              {left} --------------- {right}',
+                f'#   {ACCESS_BANDWIDTH},{access_delays[1]} /                \\ {ACCESS_BANDWIDTH},{access_delays[1]}',
+                '#               /                  \\',
+                f'#             {sources[1]}                   {sinks[1]}',
+            ]
+        return [
+            '# Simulation Topology (dumbbell)',
+            f'#   sources {sources[0]}..{sources[-1]} -> {left} ==={self.bandwidth},{self.delay}=== '
+            f'{right} -> sinks {sinks[0]}..{sinks[-1]}',
+        ]
+
+    def write(self, directory='.'):
+        """把TCL脚本写入 directory/<name>.tcl, 返回文件路径"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{self.name}.tcl')
+        with open(path, 'w') as f:
+            f.write(self.render())
+        return path
+
+    def job(self, output_dir='.', compress=None, steady=None):
+        """
+        返回运行这个场景的 sim_runner.SimJob
+
+        参数:
+            output_dir: 仿真输出文件存放目录
+            compress: 'gzip' / 'zstd' / 'lz4', 把trace输出直接流式压缩
+            steady: 稳态检测的参数字典, 稳定后提前结束仿真 (见 steady_state.py)
+        """
+        outputs = [self.trace_file] + ([self.vars_file] if self.lean else [])
+        return sim_runner.SimJob(self.name, tcl_content=self.render(), output_dir=output_dir,
+                                 compress=compress, compressed_outputs=outputs, steady=steady)
+
+    def __repr__(self):
+        args = ', '.join(f'{key}={value!r}' for key, value in self.params().items()
+                         if value != DEFAULTS[key])
+        return f'Scenario({args})'
+
+
+def sweep(tag=None, **param_lists):
+    """
+    枚举参数组合, 产出 Scenario
+
+    参数:
+        tag: 所有场景共用的文件名后缀 (默认由参数自动生成)
+        param_lists: 参数名 -> 取值列表 (或单个值), 没有给出的参数取默认值
+
+    用法:
+        for scenario in sweep(variant=['reno', 'cubic'], flows=[2, 8, 32], seed=range(5)):
+            ...
+    """
+    unknown = set(param_lists) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"未知的参数: {', '.join(sorted(unknown))}")
+    keys = list(param_lists)
+    values = [v if isinstance(v, (list, tuple, range)) else [v] for v in param_lists.values()]
+    for combo in itertools.product(*values):
+        yield Scenario(tag=tag, **dict(zip(keys, combo)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='生成 (并运行) 参数化的NS2仿真场景')
+    parser.add_argument('--variant', nargs='+', default=[DEFAULTS['variant']],
+                        choices=sorted(VARIANTS))
+    parser.add_argument('--queue', nargs='+', default=[DEFAULTS['queue']])
+    parser.add_argument('--bandwidth', nargs='+', default=[DEFAULTS['bandwidth']])
+    parser.add_argument('--delay', nargs='+', default=[DEFAULTS['delay']])
+    parser.add_argument('--queue-limit', nargs='+', type=int, default=[DEFAULTS['queue_limit']])
+    parser.add_argument('--flows', nargs='+', type=int, default=[DEFAULTS['flows']])
+    parser.add_argument('--jitter', nargs='+', type=float, default=[DEFAULTS['jitter']])
+    parser.add_argument('--seed', nargs='+', type=int, default=[DEFAULTS['seed']])
+    parser.add_argument('--duration', nargs='+', type=float, default=[DEFAULTS['duration']])
+    parser.add_argument('--lean', action='store_true',
+                        help='精简trace模式: 不写NAM, 只记录选定链路, tracevar单独成文件')
+    parser.add_argument('--tag', default=None, help='输出文件名后缀 (默认由参数生成)')
+    parser.add_argument('--write', metavar='DIR', help='把TCL文件写入DIR并打印文件路径')
+    parser.add_argument('--run', action='store_true', help='直接并行运行所有场景')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='同时运行的ns进程数 (默认CPU核数)')
+    parser.add_argument('-o', '--output-dir', default='.', help='仿真输出文件存放目录')
+    parser.add_argument('-z', '--compress', choices=sorted(trace_io.FORMATS), default=None,
+                        help='运行时把trace输出直接流式压缩')
+    sim_runner.add_steady_arguments(parser)
+    args = parser.parse_args(argv)
+
+    scenarios = list(sweep(tag=args.tag, variant=args.variant, queue=args.queue,
+                           bandwidth=args.bandwidth, delay=args.delay,
+                           queue_limit=args.queue_limit, flows=args.flows,
+                           jitter=args.jitter, seed=args.seed, duration=args.duration,
+                           lean=args.lean))
+    if len({s.name for s in scenarios}) != len(scenarios):
+        parser.error('多个场景的文件名相同, 请不要为参数扫描指定 --tag')
+
+    if args.write:
+        for scenario in scenarios:
+            print(scenario.write(args.write))
+    if args.run:
+        steady = sim_runner.steady_settings(args)
+        results = sim_runner.run_jobs([s.job(args.output_dir, args.compress, steady) for s in scenarios],
+                                      max_workers=args.jobs)
+        return 0 if all(res['ok'] for res in results) else 1
+    if not args.write:
+        for scenario in scenarios:
+            print(scenario.render())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
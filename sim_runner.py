@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sim_runner.py - 并行运行NS2仿真
+
+每个仿真作业:
+- 在自己的临时工作目录中运行, 使用自己的TCL文件副本
+- 有独立的超时时间 (默认300秒)
+- 捕获stdout和stderr
+- 结束后把生成的文件 (trace、nam等) 移回输出目录
+
+作业本身就是独立的 ns 进程, 调度器用线程池同时维持 N 个 ns 进程,
+N 默认等于CPU核数。
+
+指定压缩格式时, 作业的trace文件在工作目录中被替换为命名管道,
+ns 写入的数据直接流式压缩为 xxx.tr.gz (或 .zst/.lz4), 磁盘上不出现
+未压缩的trace。分析器可以直接读取压缩的trace (见 trace_io.py)。
+
+指定稳态检测时 (steady), 运行期间跟随作业的trace, 公平性和CoV稳定后
+结束ns进程, trace截断在检测到稳定的时刻, 预热期边界写入 .steady 文件
+(见 steady_state.py)。
+
+用法:
+    python3 sim_runner.py renoCode.tcl cubicCode.tcl vegasCode.tcl yeahCode.tcl
+    python3 sim_runner.py -j 4 -t 600 *Code_red.tcl
+    python3 sim_runner.py -z gzip renoCode.tcl
+    python3 sim_runner.py --steady renoCode.tcl
+"""
+
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import steady_state
+import trace_io
+import trace_layout
+
+# NS2可执行文件, 可用环境变量 NS 覆盖
+NS_BINARY = os.environ.get('NS', 'ns')
+DEFAULT_TIMEOUT = 300
+
+# TCL中打开用于写入的trace文件: set tracefile1 [open renoTrace.tr w]
+_TRACE_OPEN_RE = re.compile(r'\[open\s+"?([^\s"\]]+\.tr)"?\s+w\]')
+
+# 从命名管道读取并压缩时每次读取的字节数
+PIPE_BLOCK_SIZE = 1024 * 1024
+
+
+class SimJob:
+    """一个NS2仿真作业"""
+
+    def __init__(self, name, tcl_file=None, tcl_content=None, output_dir='.',
+                 compress=None, compressed_outputs=None, steady=None):
+        """
+        参数:
+            name: 作业名 (也用作工作目录中的TCL文件名)
+            tcl_file: TCL脚本路径
+            tcl_content: TCL脚本内容 (与tcl_file二选一)
+            output_dir: 仿真输出文件最终存放的目录
+            compress: 'gzip' / 'zstd' / 'lz4', 把trace输出直接压缩; None 不压缩
+            compressed_outputs: 要压缩的输出文件名, 默认为TCL中以写方式打开的所有 .tr 文件
+            steady: 稳态检测的参数字典 (steady_state.SteadyStateDetector 的参数, {} 为默认值),
+                    稳定后提前结束仿真; None 运行到TCL中的结束时间
+        """
+        if (tcl_file is None) == (tcl_content is None):
+            raise ValueError("tcl_file 和 tcl_content 必须且只能指定一个")
+        if compress is not None and steady is not None:
+            raise ValueError("稳态检测需要跟随未压缩的trace, 不能与压缩同时使用")
+        if compress is not None:
+            trace_io.check_available(compress)
+        self.name = name
+        self.tcl_file = tcl_file
+        self.tcl_content = tcl_content
+        self.output_dir = output_dir
+        self.compress = compress
+        self.compressed_outputs = compressed_outputs
+        self.steady = steady
+
+    def read_tcl(self):
+        """返回TCL脚本内容"""
+        if self.tcl_content is not None:
+            return self.tcl_content
+        with open(self.tcl_file, 'r') as f:
+            return f.read()
+
+    def trace_outputs(self, tcl=None):
+        """返回要压缩的输出文件名"""
+        if self.compressed_outputs is not None:
+            return list(self.compressed_outputs)
+        if tcl is None:
+            tcl = self.read_tcl()
+        return sorted(set(_TRACE_OPEN_RE.findall(tcl)))
+
+    def packet_trace(self, tcl=None):
+        """稳态检测跟随的包事件trace: 第一个不是tracevar文件的输出"""
+        outputs = self.trace_outputs(tcl)
+        packet = [name for name in outputs if not name.endswith(trace_layout.VARS_SUFFIX + '.tr')]
+        return (packet or outputs or [None])[0]
+
+
+def run_job(job, timeout=DEFAULT_TIMEOUT, work_root=None):
+    """
+    在独立工作目录中运行一个作业
+
+    返回:
+        结果字典: name, ok, returncode, duration, stdout, stderr, outputs, error,
+        以及稳态检测时的 steady (预热期边界等) 和 stopped_early (是否提前结束)
+    """
+    result = {
+        'name': job.name,
+        'ok': False,
+        'returncode': None,
+        'duration': 0.0,
+        'stdout': '',
+        'stderr': '',
+        'outputs': [],
+        'error': None,
+    }
+
+    workdir = tempfile.mkdtemp(prefix=f'ns-{job.name}-', dir=work_root)
+    tcl_name = f'{job.name}.tcl'
+    pipes = []
+    start = time.time()
+    try:
+        tcl = job.read_tcl()
+        with open(os.path.join(workdir, tcl_name), 'w') as f:
+            f.write(tcl)
+        if job.compress is not None:
+            pipes = [_start_compressor(workdir, name, job.compress)
+                     for name in job.trace_outputs(tcl)]
+
+        if job.steady is not None:
+            _run_steady(job, tcl, tcl_name, workdir, timeout, result)
+        else:
+            proc = subprocess.run([NS_BINARY, tcl_name], cwd=workdir,
+                                  capture_output=True, text=True, timeout=timeout)
+            result['returncode'] = proc.returncode
+            result['stdout'] = proc.stdout
+            result['stderr'] = proc.stderr
+            result['ok'] = proc.returncode == 0
+    except subprocess.TimeoutExpired as e:
+        result['error'] = f'超时 ({timeout}秒)'
+        result['stdout'] = _decode(e.stdout)
+        result['stderr'] = _decode(e.stderr)
+    except (OSError, ValueError) as e:
+        # ValueError: 稳态检测的参数无效或TCL中没有trace输出, 只让这一个作业失败
+        result['error'] = str(e)
+    finally:
+        errors = _finish_compressors(pipes)
+        if errors and result['error'] is None:
+            result['ok'] = False
+            result['error'] = '压缩失败: ' + '; '.join(errors)
+        result['duration'] = time.time() - start
+        try:
+            result['outputs'] = _collect_outputs(workdir, tcl_name, job.output_dir)
+            _remove_stale_traces(job, result['outputs'])
+            _remove_stale_steady(job, result['outputs'])
+        except OSError as e:
+            # 例如磁盘已满或输出目录不可写: 只让这一个作业失败
+            result['ok'] = False
+            if result['error'] is None:
+                result['error'] = f'收集输出失败: {e}'
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return result
+
+
+def _run_steady(job, tcl, tcl_name, workdir, timeout, result):
+    """运行ns并跟随它的trace, 稳定后提前结束; 截断输出并写入 .steady 文件"""
+    detector = steady_state.SteadyStateDetector(**job.steady)
+    trace_name = job.packet_trace(tcl)
+    if trace_name is None:
+        raise ValueError(f"{job.name}: TCL中没有找到trace输出, 无法检测稳态")
+    # 输出写到匿名临时文件, 不会被当作仿真输出收集, 也不会因为管道写满而阻塞ns
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen([NS_BINARY, tcl_name], cwd=workdir, stdout=out, stderr=err)
+        try:
+            stopped = steady_state.watch(proc, os.path.join(workdir, trace_name), detector,
+                                         deadline=time.time() + timeout)
+        except subprocess.TimeoutExpired:
+            out.seek(0)
+            err.seek(0)
+            raise subprocess.TimeoutExpired(proc.args, timeout, out.read(), err.read())
+        except Exception:
+            # 跟随trace失败时不留下仍在运行的ns进程
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            raise
+        out.seek(0)
+        err.seek(0)
+        result['stdout'] = _decode(out.read())
+        result['stderr'] = _decode(err.read())
+    result['returncode'] = proc.returncode
+    result['ok'] = stopped or proc.returncode == 0
+    result['stopped_early'] = stopped
+
+    trace_path = os.path.join(workdir, trace_name)
+    if stopped:
+        # 被结束的ns可能写了一半的行; 只保留检测到稳定之前的数据
+        for name in job.trace_outputs(tcl):
+            if os.path.exists(os.path.join(workdir, name)):
+                steady_state.truncate_trace(os.path.join(workdir, name), detector.stable_at)
+    result['steady'] = detector.result()
+    if os.path.exists(trace_path) and detector.warmup is not None:
+        trace_layout.write_steady(trace_path, result['steady'])
+
+
+def _remove_stale_traces(job, outputs):
+    """
+    删除以前的运行留下的同一trace的其他版本 (未压缩的或其他压缩格式的), 以免
+    trace_io.resolve_trace 优先找到过时的未压缩文件; 这次没有生成的trace保留原样
+    """
+    for name in job.trace_outputs():
+        path = os.path.join(job.output_dir, name)
+        versions = [path] + [path + ext for _, ext in trace_io.FORMATS.values()]
+        if not any(version in outputs for version in versions):
+            continue
+        for version in versions:
+            if version not in outputs and os.path.exists(version):
+                os.remove(version)
+
+
+def _remove_stale_steady(job, outputs):
+    """删除以前的运行留下、这次没有重新生成的 .steady 文件, 以免分析器使用过时的预热期"""
+    for name in job.trace_outputs():
+        steady_file = trace_layout.steady_file_for(os.path.join(job.output_dir, name))
+        if steady_file not in outputs and os.path.exists(steady_file):
+            os.remove(steady_file)
+
+
+def _start_compressor(workdir, name, fmt):
+    """
+    把工作目录中的输出文件name换成命名管道, 后台线程把ns写入的数据压缩到 name + 扩展名
+
+    返回 (管道路径, 线程, 错误列表)
+    """
+    fifo = os.path.join(workdir, name)
+    target = fifo + trace_io.FORMATS[fmt][1]
+    os.mkfifo(fifo)
+    errors = []
+
+    def compress():
+        try:
+            with open(fifo, 'rb') as src:
+                block = src.read(PIPE_BLOCK_SIZE)
+                if not block:
+                    # ns没有写这个文件
+                    return
+                with trace_io.open_compressed_writer(target, fmt) as dst:
+                    while block:
+                        dst.write(block)
+                        block = src.read(PIPE_BLOCK_SIZE)
+        except OSError as e:
+            errors.append(f'{name}: {e}')
+
+    thread = threading.Thread(target=compress, name=f'compress-{name}', daemon=True)
+    thread.start()
+    return fifo, thread, errors
+
+
+def _finish_compressors(pipes):
+    """
+    等待所有压缩线程结束, 返回错误信息列表
+
+    ns没有打开某个管道时 (仿真出错、TCL不写这个文件), 读端会一直阻塞在open上,
+    这里以非阻塞方式打开写端再关闭, 让读端读到EOF。
+    """
+    errors = []
+    for fifo, thread, thread_errors in pipes:
+        while thread.is_alive():
+            try:
+                fd = os.open(fifo, os.O_WRONLY | os.O_NONBLOCK)
+                os.close(fd)
+            except OSError:
+                # 读端还没有打开管道 (ENXIO), 稍后重试
+                pass
+            thread.join(0.05)
+        errors.extend(thread_errors)
+    return errors
+
+
+def _decode(output):
+    if output is None:
+        return ''
+    if isinstance(output, bytes):
+        return output.decode('utf-8', errors='replace')
+    return output
+
+
+def _collect_outputs(workdir, tcl_name, output_dir):
+    """把工作目录中除TCL外的文件移动到输出目录"""
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = []
+    for entry in sorted(os.listdir(workdir)):
+        if entry == tcl_name:
+            continue
+        src = os.path.join(workdir, entry)
+        # 跳过子目录和压缩用的命名管道
+        if not os.path.isfile(src):
+            continue
+        dst = os.path.join(output_dir, entry)
+        shutil.move(src, dst)
+        outputs.append(dst)
+    return outputs
+
+
+def run_jobs(jobs, max_workers=None, timeout=DEFAULT_TIMEOUT, work_root=None, verbose=True):
+    """
+    并行运行多个作业
+
+    参数:
+        jobs: SimJob列表
+        max_workers: 同时运行的ns进程数 (默认CPU核数)
+        timeout: 每个作业的超时时间 (秒)
+        work_root: 临时工作目录的父目录 (默认系统临时目录)
+        verbose: 是否打印进度和汇总
+
+    返回:
+        与jobs顺序一致的结果字典列表
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return []
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(jobs)))
+
+    if verbose:
+        print(f"运行 {len(jobs)} 个仿真作业, 并行度 {max_workers}...")
+
+    results = [None] * len(jobs)
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(run_job, job, timeout, work_root): idx
+                   for idx, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            idx = futures[future]
+            results[idx] = future.result()
+            if verbose:
+                res = results[idx]
+                mark = '✓' if res['ok'] else '✗'
+                note = ''
+                if res.get('stopped_early'):
+                    steady = res['steady']
+                    note = f", 稳定于 {steady['stable_at']:g} 秒, 预热期 {steady['warmup']:g} 秒"
+                print(f"  {mark} {res['name']} ({res['duration']:.1f}秒{note})")
+
+    if verbose:
+        print_summary(results, wall_time=time.time() - start)
+    return results
+
+
+def print_summary(results, wall_time=None):
+    """打印作业汇总表"""
+    print("-" * 60)
+    print(f"{'作业':<24} {'状态':<8} {'耗时 (秒)':<12} {'输出文件':<10}")
+    print("-" * 60)
+    for res in results:
+        status = '成功' if res['ok'] else '失败'
+        print(f"{res['name']:<24} {status:<8} {res['duration']:<12.1f} {len(res['outputs']):<10}")
+    print("-" * 60)
+
+    failed = [res for res in results if not res['ok']]
+    total = sum(res['duration'] for res in results)
+    print(f"成功: {len(results) - len(failed)}/{len(results)}, 累计仿真时间: {total:.1f}秒")
+    if wall_time is not None:
+        print(f"实际耗时: {wall_time:.1f}秒")
+    for res in failed:
+        reason = res['error'] or f"返回码 {res['returncode']}"
+        print(f"  ✗ {res['name']}: {reason}")
+        stderr = res['stderr'].strip()
+        if stderr:
+            print("    " + stderr.splitlines()[-1])
+
+
+def jobs_from_files(tcl_files, output_dir='.', compress=None, steady=None):
+    """为一组TCL文件创建作业, 作业名取文件名 (不含扩展名)"""
+    return [SimJob(os.path.splitext(os.path.basename(path))[0], tcl_file=path,
+                   output_dir=output_dir, compress=compress, steady=steady)
+            for path in tcl_files]
+
+
+def add_steady_arguments(parser):
+    """给命令行加上稳态检测的参数 (sim_runner.py 和 scenario.py 共用)"""
+    parser.add_argument('--steady', action='store_true',
+                        help='检测稳态, 公平性和CoV稳定后提前结束仿真')
+    parser.add_argument('--steady-tolerance', type=float, default=steady_state.DEFAULT_TOLERANCE,
+                        help='稳态: 公平性和CoV的变化范围相对于均值的上限')
+    parser.add_argument('--steady-window', type=float, default=steady_state.DEFAULT_WINDOW,
+                        help='稳态: 比较公平性和CoV的时间窗口 (秒, 仿真时间)')
+
+
+def steady_settings(args):
+    """由 add_steady_arguments 的参数得到 SimJob 的 steady 参数"""
+    if not args.steady:
+        return None
+    return {'tolerance': args.steady_tolerance, 'window': args.steady_window}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='并行运行NS2仿真')
+    parser.add_argument('tcl_files', nargs='+', help='要运行的TCL文件')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='同时运行的ns进程数 (默认CPU核数)')
+    parser.add_argument('-t', '--timeout', type=int, default=DEFAULT_TIMEOUT,
+                        help=f'每个作业的超时时间, 秒 (默认{DEFAULT_TIMEOUT})')
+    parser.add_argument('-o', '--output-dir', default='.',
+                        help='输出文件存放目录 (默认当前目录)')
+    parser.add_argument('-z', '--compress', choices=sorted(trace_io.FORMATS), default=None,
+                        help='把trace输出直接流式压缩 (默认不压缩)')
+    add_steady_arguments(parser)
+    args = parser.parse_args(argv)
+
+    results = run_jobs(jobs_from_files(args.tcl_files, args.output_dir, args.compress,
+                                       steady_settings(args)),
+                       max_workers=args.jobs, timeout=args.timeout)
+    return 0 if all(res['ok'] for res in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+steady_state.py - 稳态检测和提前结束仿真
+
+模板中的仿真都运行到100秒, 而公平性和CoV只使用最后1/3的数据。这里在ns运行时
+跟随它写的trace (analyser3.LiveTCPAnalyzer), 每过 check_every 秒仿真时间检查一次:
+
+- 预热期: 对每条流每个时间桶的吞吐量用 MSER-5 求截断点 (见 mser()),
+  取所有流中最晚的一个作为预热期的边界
+- 稳定: 用预热期之后的数据计算公平性和CoV, 最近 window 秒内的每个值的
+  变化范围都在均值的 tolerance 以内, 且预热期之后至少有 min_steady 秒的数据
+
+稳定后 sim_runner 结束ns进程, 把trace截断在检测到稳定的时刻, 并把预热期边界
+和结束时间写到trace旁边的 .steady 文件 (见 trace_layout.py)。TCPAnalyzer 用
+其中的预热期代替固定的 start_fraction=2/3, 用结束时间代替100秒的仿真时长。
+
+    python3 scenario.py --variant reno cubic --seed 1 2 3 --run --steady
+    python3 sim_runner.py --steady renoCode.tcl
+"""
+
+import os
+import subprocess
+import time
+
+import numpy as np
+
+import trace_layout
+
+# MSER-5: 每5个样本取平均后再求截断点
+MSER_BATCH = 5
+
+# 求截断点至少需要的批数
+MSER_MIN_BATCHES = 4
+
+# 检测参数的默认值
+DEFAULT_TOLERANCE = 0.02
+DEFAULT_WINDOW = 10.0
+DEFAULT_MIN_STEADY = 10.0
+DEFAULT_CHECK_EVERY = 1.0
+
+# 跟随trace的轮询间隔 (秒, 实际时间)
+POLL_INTERVAL = 0.5
+
+
+def mser(samples, batch=MSER_BATCH):
+    """
+    MSER-m 截断点
+
+    把序列每 batch 个取平均得到 Z_1..Z_k, 在前一半中选使
+        MSER(d) = sum_{i>d} (Z_i - mean(Z_{d+1..k}))^2 / (k - d)^2
+    最小的 d, 返回截断的样本数 d * batch; 批数不足 MSER_MIN_BATCHES 时返回None
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    k = len(samples) // batch
+    if k < MSER_MIN_BATCHES:
+        return None
+    z = samples[:k * batch].reshape(k, batch).mean(axis=1)
+    # 从第d批到最后的和、平方和与批数
+    s1 = np.cumsum(z[::-1])[::-1]
+    s2 = np.cumsum((z * z)[::-1])[::-1]
+    m = k - np.arange(k)
+    sse = np.maximum(s2 - s1 * s1 / m, 0.0)
+    stat = sse[:k // 2 + 1] / m[:k // 2 + 1] ** 2
+    return int(np.argmin(stat)) * batch
+
+
+def _fairness(tails):
+    """Jain公平性指数, 与 TCPAnalyzer.get_fairness_index 相同"""
+    if not tails or not all(len(samples) for samples in tails):
+        return 0.0
+    x = np.array([samples.mean() for samples in tails])
+    sum_x2 = float(np.sum(x * x))
+    return float(x.sum() ** 2 / (len(x) * sum_x2)) if sum_x2 > 0 else 0.0
+
+
+def _cov(tails):
+    """所有流合并后的变异系数, 与 TCPAnalyzer.get_stability_cov 相同"""
+    samples = np.concatenate(tails) if tails else np.empty(0)
+    if not len(samples) or samples.mean() <= 0:
+        return float('inf')
+    return float(samples.std() / samples.mean())
+
+
+def _within(values, tolerance):
+    """一组值的变化范围是否在均值的 tolerance 以内"""
+    values = np.asarray(values, dtype=np.float64)
+    if not np.all(np.isfinite(values)):
+        return False
+    return float(values.max() - values.min()) <= tolerance * abs(float(values.mean()))
+
+
+class SteadyStateDetector:
+    """由每条流的吞吐量时间序列检测预热期和公平性、CoV是否已经稳定"""
+
+    def __init__(self, tolerance=DEFAULT_TOLERANCE, window=DEFAULT_WINDOW,
+                 min_steady=DEFAULT_MIN_STEADY, check_every=DEFAULT_CHECK_EVERY, batch=MSER_BATCH):
+        """
+        参数:
+            tolerance: 公平性和CoV的变化范围相对于均值的上限
+            window: 在最近多少秒 (仿真时间) 内比较公平性和CoV
+            min_steady: 预热期之后至少需要的数据时长 (秒)
+            check_every: 检查的间隔 (秒, 仿真时间)
+            batch: MSER 的批大小
+        """
+        if tolerance <= 0 or window <= 0 or check_every <= 0:
+            raise ValueError("tolerance、window 和 check_every 必须为正数")
+        self.tolerance = tolerance
+        self.window = window
+        self.min_steady = min_steady
+        self.check_every = check_every
+        self.batch = batch
+        self.history = []   # (检查时刻, 预热期边界, 公平性, CoV)
+        self.warmup = None
+        self.stable_at = None
+        self._checked = 0.0
+
+    @property
+    def stable(self):
+        return self.stable_at is not None
+
+    def update(self, analyzer, now=None):
+        """
+        对 (上次检查, now] 内 check_every 的每个整数倍做一次检查
+
+        参数:
+            analyzer: 已经生成吞吐量时间序列的 TCPAnalyzer (LiveTCPAnalyzer 在 snapshot() 之后)
+            now: 已经完整读到的仿真时间 (默认 analyzer.last_time)
+        返回:
+            是否已经稳定
+        """
+        if now is None:
+            now = analyzer.last_time
+        while not self.stable and self._checked + self.check_every <= now + 1e-9:
+            self._checked = round(self._checked + self.check_every, 9)
+            self._check(analyzer, self._checked)
+        return self.stable
+
+    def _check(self, analyzer, t):
+        width = analyzer.bucket_width
+        n = int(round(t / width))
+        # 每条流前n个 (完整的) 时间桶, 末尾没有数据的桶吞吐量为0
+        series = []
+        for flow_data in analyzer.flows:
+            samples = np.zeros(n)
+            values = np.asarray(flow_data['throughput_samples'][:n], dtype=np.float64)
+            samples[:len(values)] = values
+            series.append(samples)
+        cuts = [mser(samples, self.batch) for samples in series]
+        if not series or any(cut is None for cut in cuts):
+            return
+        start = max(cuts)
+        tails = [samples[start:] for samples in series]
+        self.warmup = start * width
+        self.history.append((t, self.warmup, _fairness(tails), _cov(tails)))
+
+        if t - self.warmup < self.min_steady or t - self.history[0][0] < self.window:
+            return
+        recent = [entry for entry in self.history if entry[0] >= t - self.window - 1e-9]
+        if (_within([entry[2] for entry in recent], self.tolerance)
+                and _within([entry[3] for entry in recent], self.tolerance)):
+            self.stable_at = t
+
+    def result(self, end=None):
+        """
+        写入 .steady 文件的结果
+
+        参数:
+            end: trace的结束时间, 默认为检测到稳定的时刻 (没有稳定时为None)
+        """
+        last = self.history[-1] if self.history else (None, None, None, None)
+        return {
+            'warmup': self.warmup,
+            'end': self.stable_at if end is None else end,
+            'stable': self.stable,
+            'stable_at': self.stable_at,
+            'fairness': last[2],
+            'cov': last[3] if last[3] is None or np.isfinite(last[3]) else None,
+            'tolerance': self.tolerance,
+            'window': self.window,
+            'checks': len(self.history),
+        }
+
+
+def _line_time(line):
+    """trace行的时间: 包事件在第2列, tracevar行在第1列; 无法解析时返回None"""
+    parts = line.split()
+    if not parts:
+        return None
+    try:
+        return float(parts[1] if len(parts[0]) == 1 and not parts[0].isdigit() else parts[0])
+    except (ValueError, IndexError):
+        return None
+
+
+def _line_start(f, offset):
+    """offset 之后 (含) 第一个完整行的开头"""
+    if offset == 0:
+        return 0
+    f.seek(offset - 1)
+    f.readline()
+    return f.tell()
+
+
+def truncate_trace(path, end):
+    """
+    截断按时间排序的trace (或tracevar文件), 只保留时间小于 end 的完整行
+
+    ns被结束时最后一行可能只写了一半, 也一并删除。按字节偏移二分查找, 不读取整个文件。
+    """
+    with open(path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        lo, hi = 0, size
+        # 不变式: lo 处的行时间 < end (或 lo 为0), hi 处的行时间 >= end (或 hi 为文件末尾)
+        while True:
+            mid = _line_start(f, (lo + hi) // 2)
+            if mid >= hi:
+                break
+            f.seek(mid)
+            line = f.readline()
+            t = _line_time(line) if line.endswith(b'\n') else None
+            if t is not None and t < end:
+                lo = f.tell()
+            else:
+                hi = mid
+            if lo >= hi:
+                break
+        # 线性处理剩下的一小段
+        f.seek(_line_start(f, lo))
+        keep = f.tell()
+        for line in f:
+            t = _line_time(line)
+            if not line.endswith(b'\n') or t is None or t >= end:
+                break
+            keep += len(line)
+        f.truncate(keep)
+
+
+def watch(proc, trace_file, detector, poll_interval=POLL_INTERVAL, deadline=None, flows=None):
+    """
+    跟随ns进程正在写的trace, 稳定后结束进程
+
+    参数:
+        proc: ns 的 subprocess.Popen
+        trace_file: ns写入的trace文件
+        detector: SteadyStateDetector
+        deadline: time.time() 的截止时刻, 超过时结束进程并抛出 subprocess.TimeoutExpired
+        flows: 统计的流 (默认trace中出现的所有流)
+    返回:
+        是否因为稳定而提前结束了进程
+    """
+    # 在这里才导入: analyser3 在导入时设置matplotlib后端和全局的警告过滤,
+    # 不能影响导入 sim_runner 的 analyser.py 等脚本
+    import analyser3
+
+    # 等到ns开始写trace: 这时TCL中的设置 (包括精简模式的 .links 文件) 都已经完成
+    while proc.poll() is None and not (os.path.exists(trace_file) and os.path.getsize(trace_file)):
+        _check_deadline(proc, deadline)
+        time.sleep(poll_interval)
+
+    live = analyser3.LiveTCPAnalyzer(trace_file, 'steady', flows=flows)
+    for _ in live.follow(poll_interval, is_running=lambda: proc.poll() is None):
+        if detector.update(live) and proc.poll() is None:
+            proc.terminate()
+            proc.wait()
+            return True
+        _check_deadline(proc, deadline)
+    return False
+
+
+def _check_deadline(proc, deadline):
+    if deadline is not None and time.time() > deadline:
+        proc.kill()
+        proc.wait()
+        raise subprocess.TimeoutExpired(proc.args, 0)
@@ -4,13 +4,43 @@
 快速测试脚本 - 验证analyser3.py能否正确解析trace文件
 """
 
+import gzip
+import json
 import os
 import sys
+import tempfile
+import tracemalloc
 
 # 添加当前目录到路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from analyser3 import TCPAnalyzer
+import numpy as np
+
+import analyser
+import analyser3
+import benchmark
+import delay
+import flow_table
+import instrument
+import jitter
+import link_filter
+import pipeline
+import plotting
+import queue_state
+import replication
+import scenario
+import sim_runner
+import steady_state
+import trace_cache
+import trace_gen
+import trace_index
+import trace_io
+import trace_layout
+import trace_mmap
+import trace_reader
+import window_rate
+from analyser3 import LiveTCPAnalyzer, TCPAnalyzer
+from link_filter import DUMBBELL_FILTER
 
 def test_trace_parsing():
     """测试trace文件解析"""
@@ -37,7 +67,7 @@ def test_trace_parsing():
         
         # 解析
         analyzer = TCPAnalyzer(trace_file, variant)
-        analyzer.parse_trace()
+        analyzer.parse_trace(use_cache=True)
         
         # 显示结果
         print(f"  Flow 1 发送包: {analyzer.flow1_data['sent_packets']}")
@@ -64,6 +94,763 @@ def test_trace_parsing():
     print("测试完成")
     print("=" * 60)
 
+# 小型trace样例: 两条流, 含tracevar行、ACK、丢包和跨秒的接收事件
+SAMPLE_TRACE = """\
++ 0.100000 0 2 tcp 1040 ------- 1 0.0 4.0 0 0
+- 0.100000 0 2 tcp 1040 ------- 1 0.0 4.0 0 0
+0.10000 0 0 4 0 cwnd_ 1.000
++ 0.200000 1 2 tcp 1040 ------- 2 1.0 5.0 0 1
+r 0.600000 0 2 tcp 1040 ------- 1 0.0 4.0 0 0
++ 0.600000 2 3 tcp 1040 ------- 1 0.0 4.0 0 0
+d 0.600000 2 3 tcp 1040 ------- 2 1.0 5.0 0 1
+r 1.000000 1 2 tcp 1040 ------- 2 1.0 5.0 1 2
+r 1.150000 3 4 tcp 1040 ------- 1 0.0 4.0 0 0
++ 1.200000 4 3 ack 40 ------- 1 4.0 0.0 0 3
+r 2.500000 3 5 tcp 1040 ------- 2 1.0 5.0 1 2
+1.20000 1 0 5 0 rtt_ 0.250
+"""
+
+
+def _write_sample_trace(directory):
+    path = os.path.join(directory, 'sampleTrace.tr')
+    with open(path, 'w') as f:
+        f.write(SAMPLE_TRACE)
+    return path
+
+
+def _analyzer_state(analyzer):
+    return (analyzer.flow1_data, analyzer.flow2_data,
+            analyzer.get_total_goodput(), analyzer.get_plr(),
+            analyzer.get_fairness_index(), analyzer.get_stability_cov())
+
+
+def test_numpy_engine_matches_python():
+    """numpy解析引擎与逐行解析结果一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = _write_sample_trace(tmp)
+        
+        python_analyzer = TCPAnalyzer(trace_file, 'sample')
+        python_analyzer.parse_trace(engine='python')
+        numpy_analyzer = TCPAnalyzer(trace_file, 'sample')
+        numpy_analyzer.parse_trace(engine='numpy')
+        
+        assert python_analyzer.flow1_data['rcvd_packets'] == 2
+        assert python_analyzer.flow2_data['dropped_packets'] == 1
+        assert _analyzer_state(numpy_analyzer) == _analyzer_state(python_analyzer)
+
+
+def test_mmap_reader_matches_line_parsing():
+    """mmap读取器: 列与 trace_reader 一致 (含不规则的行), 统计结果与逐行解析一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = _write_sample_trace(tmp)
+        with open(trace_file, 'a') as f:
+            # 多余的空格和指数形式的时间走逐行转换; 最后一行没有换行符
+            f.write("r  3.0 2 3 tcp 1040 ------- 1 0.0 4.0 2 4\n")
+            f.write("2e0 0 0 4 0 cwnd_ 2.000\n")
+            f.write("d 4e0 2 3 tcp 1040 ------- 1 0.0 4.0 3 5")
+        with open(trace_file, 'rb') as f:
+            expected = trace_reader.parse_lines(f.readlines())
+        for block_size in (1, trace_mmap.DEFAULT_BLOCK_SIZE):
+            columns = trace_mmap.read_trace_columns(trace_file, block_size)
+            for name, values in expected.items():
+                assert columns[name].dtype == values.dtype
+                assert np.array_equal(columns[name], values), name
+
+        with trace_mmap.MappedTrace(trace_file) as trace:
+            records = list(trace.records())
+        assert len(records) == len(expected['time'])
+        assert records[-1].event == b'd' and records[-1].time == 4.0 and records[-1].src == 0
+
+        python_analyzer = TCPAnalyzer(trace_file, 'sample')
+        python_analyzer.parse_trace(engine='python')
+        mmap_analyzer = TCPAnalyzer(trace_file, 'sample')
+        mmap_analyzer.parse_trace(engine='mmap')
+        assert _analyzer_state(mmap_analyzer) == _analyzer_state(python_analyzer)
+
+        lines = analyser.splitFile(trace_file)
+        with analyser.mapFile(trace_file) as mapped:
+            for split in (analyser.splitCWND, analyser.splitAcks, analyser.splitRtt, analyser.splitloss):
+                assert split(mapped) == split(lines)
+        assert analyser.splitCWND(lines)[0][-1] == 2.0
+
+
+def test_parallel_chunks_match_serial_parse():
+    """单个trace按行切段并行解析, 合并结果 (含跨段的时间桶) 与顺序解析一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = _write_sample_trace(tmp)
+        serial = TCPAnalyzer(trace_file, 'sample', bucket_width=0.5, flows=None)
+        serial.parse_trace(engine='python')
+        expected = analyser.extractMetrics(trace_file)
+        for workers in (2, 5):
+            ranges = trace_mmap.split_ranges(trace_file, workers)
+            assert ranges[0][0] == 0 and ranges[-1][1] == len(SAMPLE_TRACE)
+            parallel = TCPAnalyzer(trace_file, 'sample', bucket_width=0.5, flows=None)
+            parallel.parse_trace(workers=workers)
+            assert parallel.flows == serial.flows
+            assert _analyzer_state(parallel) == _analyzer_state(serial)
+            metrics = analyser.extractMetrics(trace_file, workers=workers)
+            for name in ('cwnd', 'acks', 'rtt', 'loss'):
+                assert getattr(metrics, name)() == getattr(expected, name)()
+
+
+def test_sliding_window_throughput():
+    """滑动窗口吞吐量: 与逐窗口求和一致, 窗口等于桶宽时与时间桶一致"""
+    rng = np.random.default_rng(7)
+    times = np.sort(rng.uniform(0, 5, 2000))
+    sizes = rng.integers(40, 1500, len(times))
+    ends = window_rate.window_ends(0.1, 0.01, times[-1])
+    sums = window_rate.sliding_sum(times, sizes, ends, 0.1)
+    for i in range(0, len(ends), 37):
+        inside = (times >= ends[i] - 0.1) & (times < ends[i])
+        assert sums[i] == sizes[inside].sum()
+    assert ends[-1] > times[-1]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        analyzer = TCPAnalyzer(_write_sample_trace(tmp), 'sample')
+        analyzer.parse_trace()
+        _, rates = analyzer.sliding_throughput(window=1.0, step=1.0)
+        for flow_data, flow_rates in zip(analyzer.flows, rates):
+            samples = flow_data['throughput_samples']
+            assert flow_rates[:len(samples)].tolist() == samples
+        assert analyzer.get_stability_cov(window=0.1, step=0.01) > 0
+
+
+def test_end_to_end_delay_matches_first_enqueue_and_final_receive():
+    """时延: 每个uid最早的'+'与目的节点的'r'配对, 按流分开, 取样与逐包计算一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        table = delay.DelayTable.from_trace(_write_sample_trace(tmp))
+        # uid 0: 0.1 入队, 1.15 在目的节点4接收; uid 1 被丢弃; uid 2 没有入队事件
+        assert table.uids.tolist() == [0] and table.flow_ids == [0]
+        assert table.delays.tolist() == [1.15 - 0.1]
+
+        trace_file = os.path.join(tmp, 'synthTrace.tr')
+        stats = trace_gen.generate_trace(trace_file, '100KB', flows=3, drop_rate=0.05, seed=4)
+        table = delay.DelayTable.from_trace(trace_file)
+        assert [len(table.for_flow(f)) for f in table.flow_ids] == stats['delivered']
+        assert np.all(table.delays > 0) and np.all(np.diff(table.recv_times) >= 0)
+        p = table.percentiles((0, 50, 100))
+        assert p[0] == table.delays.min() and p[100] == table.delays.max()
+
+        times, samples = table.sample(5.0, flow_id=1)
+        delays = table.for_flow(1)
+        recv = table.recv_times[table.flows == 1]
+        assert times[0] == np.floor(recv[0] / 5.0) * 5.0
+        assert np.isclose(samples[0], delays[recv < times[0] + 5.0].mean())
+        assert table.time_sample == times
+
+        # 节点4是出口路由器: 送达的包都经过它, 时延比到目的节点短
+        by_name = delay.delays_of_traces({'a': trace_file, 'b': trace_file}, node=4, max_workers=1)
+        assert np.array_equal(by_name['a'].delays, by_name['b'].delays)
+        assert by_name['a'].uids.tolist() == table.uids.tolist()
+        assert np.all(by_name['a'].delays < table.delays)
+
+
+def test_streaming_jitter_matches_rfc3550():
+    """抖动: 分块流式计算与逐包的RFC 3550递推一致, 到达或丢弃的包不再占用内存"""
+    deltas = np.random.default_rng(0).normal(0, 1e-3, 2000)
+    expected, j = [], 0.0
+    for d in deltas:
+        j += (abs(d) - j) / 16
+        expected.append(j)
+    assert np.allclose(jitter.rfc3550(deltas), expected, rtol=1e-12, atol=0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = os.path.join(tmp, 'synthTrace.tr')
+        stats = trace_gen.generate_trace(trace_file, '200KB', flows=2, drop_rate=0.05, seed=5)
+        whole = jitter.JitterMeter().update_all(trace_mmap.read_trace_columns(trace_file))
+        meter = jitter.JitterMeter()
+        for cols in trace_mmap.iter_trace_blocks(trace_file, block_size=8192):
+            meter.update(cols)
+        assert meter.pending == 0
+        rows = meter.rows()
+        for row, expected_row in zip(rows, whole.rows()):
+            assert row.keys() == expected_row.keys()
+            assert all(np.isclose(row[k], expected_row[k]) if k.endswith('_ms') else row[k] == expected_row[k]
+                       for k in row)
+        # 列式缓存中的窄整数列给出相同的结果
+        cached = TCPAnalyzer(trace_file, 'synth').jitter(use_cache=True)
+        assert [row['packets'] for row in cached] == [row['packets'] for row in rows]
+        assert np.allclose([row['mean_delay_ms'] for row in cached], [row['mean_delay_ms'] for row in rows])
+        flows = [row for row in rows if row['scope'] == 'flow']
+        assert [row['packets'] for row in flows] == stats['delivered']
+        # 摘要只在请求时才计算抖动, trace不存在时为空
+        assert 'jitter' not in analyser3.summarize_trace(trace_file, 'synth')
+        assert len(analyser3.summarize_trace(trace_file, 'synth', extras=('jitter',))['jitter']) == len(rows)
+        assert TCPAnalyzer(os.path.join(tmp, 'missingTrace.tr'), 'synth').jitter() == []
+        # 链路 2-3 是瓶颈: 经过它的包是两条流送达的包之和
+        bottleneck = next(row for row in rows if row['id'] == '2-3')
+        assert bottleneck['packets'] == sum(stats['delivered'])
+
+        csv_path = os.path.join(tmp, 'jitter.csv')
+        jitter.write_csv(csv_path, {'synth': rows})
+        with open(csv_path) as f:
+            lines = f.read().splitlines()
+        assert lines[0].split(',') == ['Variant'] + list(jitter.FIELDS)
+        assert len(lines) == len(rows) + 1
+
+
+def _queue_trace(arrivals, service, limit):
+    """
+    链路 2->3 上的FIFO DropTail队列 (ns-2: 等待的包数 + 1 >= limit 时丢包):
+    返回trace文本和每个包的 (到达, 开始发送) 时间
+    """
+    events, accepted, free = [], [], 0.0
+    for uid, t in enumerate(arrivals):
+        waiting = sum(1 for _, start in accepted if start > t)
+        line = f"2 3 tcp 1040 ------- 1 0.0 4.0 {uid} {uid}\n"
+        events.append((t, 0, f"+ {t:.6f} {line}"))
+        if waiting + 1 >= limit:
+            events.append((t, 1, f"d {t:.6f} {line}"))
+            continue
+        start = max(t, free)
+        free = round(start + service, 6)
+        accepted.append((t, start))
+        events.append((start, 2, f"- {start:.6f} {line}"))
+    return ''.join(text for *_, text in sorted(events)), accepted
+
+
+def test_queue_state_reconstructs_droptail_queue():
+    """队列重建: 队列长度、排队时间和队列满时的丢包与FIFO DropTail队列的模拟一致"""
+    arrivals = [round(0.3 * i, 6) for i in range(30)]
+    text, accepted = _queue_trace(arrivals, service=0.97, limit=3)
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = os.path.join(tmp, 'queueTrace.tr')
+        with open(trace_file, 'w') as f:
+            f.write(text)
+        queue = queue_state.LinkQueue.from_trace(trace_file, (2, 3), limit=3)
+
+    waits = [start - t for t, start in accepted]
+    assert np.allclose(queue.sojourn, waits)
+    # queue-limit 3: 最多2个包在等待, 此时为满
+    assert queue.lengths.max() == 2 and queue.limit == 3 and queue.full_length == 2
+    summary = queue.summary()
+    assert summary['arrivals'] == 30 and summary['drops'] == 30 - len(accepted) > 0
+    assert summary['drops_at_full'] == summary['drops'] and summary['early_drops'] == 0
+    assert summary['full_fraction'] > 0
+    # 在第 k 个包到达之后的瞬时长度: 已接受、尚未开始发送的包数
+    for t in arrivals[1:]:
+        expected = sum(1 for a, start in accepted if a <= t < start)
+        assert queue.length_at(t) == expected
+    # 时间加权平均 = 排队时间之和 / 时长 (Little 定律)
+    end = queue.times[-1]
+    assert np.isclose(queue.mean_length(0.0, end), sum(waits) / end)
+    times, means = queue.sample(end / 4)
+    assert np.isclose(means.mean(), queue.mean_length(0.0, times[-1] + end / 4))
+
+
+def test_queue_state_handles_empty_link():
+    """没有事件的链路给出全为0的统计; 默认链路取trace中实际存在的瓶颈链路"""
+    empty = queue_state.queues_of_columns([], [(2, 3)], limit=10)[(2, 3)]
+    assert len(empty) == 0 and empty.length_at(1.0) == 0
+    summary = empty.summary()
+    assert summary['link'] == '2-3' and summary['max_length'] == 0 and summary['arrivals'] == 0
+    assert empty.mean_length(0.0, 10.0) == 0.0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = os.path.join(tmp, 'synthTrace.tr')
+        trace_gen.generate_trace(trace_file, '200KB', flows=4, drop_rate=0.05, seed=1)
+        # 4条流的哑铃拓扑: 瓶颈链路是 4->5, 而不是默认统计的两条流对应的 2->3
+        summary = analyser3.summarize_trace(trace_file, 'synth', extras=('queue',))
+        assert summary['queue']['link'] == '4-5' and summary['queue']['arrivals'] > 0
+        assert 'queue' not in analyser3.summarize_trace(trace_file, 'synth')
+        missing = analyser3.summarize_trace(os.path.join(tmp, 'missingTrace.tr'), 'synth', extras=('queue',))
+        assert missing['queue']['arrivals'] == 0
+
+
+def test_replication_stops_when_confidence_interval_converges():
+    """t 分布分位数与查表值一致; 置信区间收窄到目标时停止, 否则在运行次数上限停止"""
+    for df, expected in ((1, 12.7062), (4, 2.7764), (9, 2.2622), (30, 2.0423)):
+        assert abs(replication.t_quantile(0.975, df) - expected) < 1e-4
+    values = [10.0, 12.0, 11.0, 13.0, 9.0]
+    mean, half = replication.confidence_interval(values)
+    assert mean == 11.0 and np.isclose(half, 2.7764 * np.std(values, ddof=1) / np.sqrt(5), rtol=1e-4)
+    _, boot = replication.confidence_interval(values, method='bootstrap')
+    assert 0 < boot < half
+
+    rng = np.random.default_rng(1)
+    batches = []
+
+    def run_batch(numbers):
+        batches.append(numbers)
+        return [{'goodput': 10 + rng.normal(0, 1), 'plr': 0.0} for _ in numbers]
+
+    sampler = replication.SequentialSampler(['goodput', 'plr'], target=0.05, max_runs=40, batch_size=2)
+    intervals = sampler.run(run_batch, log=None)
+    assert sampler.converged() and sampler.runs < 40
+    assert batches[0] == [1, 2, 3] and batches[1] == [4, 5]
+    assert intervals['goodput'][2] < 0.05 and intervals['plr'][1] == 0
+    # 前一批还没有收敛
+    assert sampler.history[-2]['goodput'][2] >= 0.05
+
+    strict = replication.SequentialSampler(['goodput'], target=1e-6, max_runs=7, batch_size=3)
+    strict.run(run_batch, log=None)
+    assert not strict.converged() and strict.launched == 7 and batches[-1] == [7]
+
+
+# 代替ns: 按仿真时间每秒写出一段事先生成的trace
+_FAKE_NS = """
+import sys, time
+name = open(sys.argv[1]).read().split('[open ')[1].split()[0]
+with open(%r) as src, open(name, 'w') as dst:
+    second = 0
+    for line in src:
+        dst.write(line)
+        t = float(line.split()[1])
+        if t >= second + 1:
+            second = int(t)
+            dst.flush()
+            time.sleep(0.01)
+"""
+
+
+def test_steady_state_detection_stops_simulation():
+    """MSER-5 截掉上升的预热段; 稳定后结束ns, trace截断, 分析器使用记录的预热期"""
+    rng = np.random.default_rng(0)
+    ramp = np.concatenate([np.linspace(0, 10, 20), 10 + rng.normal(0, 0.5, 80)])
+    assert 15 <= steady_state.mser(ramp) <= 25
+    assert steady_state.mser(ramp[:10]) is None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'source.tr')
+        trace_gen.generate_trace(source, '2MB', flows=2, drop_rate=0.01, seed=3)
+        fake_ns = os.path.join(tmp, 'fake_ns.py')
+        with open(fake_ns, 'w') as f:
+            f.write(f'#!{sys.executable}\n' + _FAKE_NS % source)
+        os.chmod(fake_ns, 0o755)
+        job = sim_runner.SimJob('steadyCode', tcl_content='set tracefile1 [open steadyTrace.tr w]\n',
+                                output_dir=tmp, steady={'tolerance': 0.05})
+        saved = sim_runner.NS_BINARY
+        sim_runner.NS_BINARY = fake_ns
+        try:
+            result = sim_runner.run_job(job, timeout=60)
+        finally:
+            sim_runner.NS_BINARY = saved
+
+        assert result['ok'] and result['stopped_early']
+        steady = result['steady']
+        assert steady['stable'] and 0 <= steady['warmup'] < steady['end'] < 100
+        trace_file = os.path.join(tmp, 'steadyTrace.tr')
+        with open(trace_file, 'rb') as f:
+            data = f.read()
+        assert data.endswith(b'\n') and float(data.splitlines()[-1].split()[1]) < steady['end']
+
+        analyzer = TCPAnalyzer(trace_file, 'steady', flows=None)
+        analyzer.parse_trace()
+        assert analyzer.warmup == steady['warmup'] and analyzer.sim_time == steady['end']
+        assert np.isclose(analyzer.get_fairness_index(), steady['fairness'])
+        assert np.isclose(analyzer.get_stability_cov(), steady['cov'])
+
+        # 作业本身的错误 (TCL中没有trace输出) 只让这一个作业失败, 不抛出到线程池
+        bad = sim_runner.SimJob('badCode', tcl_content='set ns [new Simulator]\n', output_dir=tmp, steady={})
+        result = sim_runner.run_job(bad, timeout=60)
+        assert not result['ok'] and 'trace' in result['error']
+
+
+def test_link_filter_counts_end_to_end_events():
+    """链路过滤: 每个包只在源端链路计发送、在目的端链路计接收"""
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = _write_sample_trace(tmp)
+        
+        states = []
+        for engine in ('python', 'numpy'):
+            analyzer = TCPAnalyzer(trace_file, 'sample', link_filter=DUMBBELL_FILTER)
+            analyzer.parse_trace(engine=engine)
+            states.append(_analyzer_state(analyzer))
+            
+            assert analyzer.flow1_data['sent_packets'] == 1
+            assert analyzer.flow1_data['rcvd_packets'] == 1
+            assert analyzer.flow2_data['sent_packets'] == 1
+            assert analyzer.flow2_data['rcvd_packets'] == 1
+            assert analyzer.flow2_data['dropped_packets'] == 1
+        assert states[0] == states[1]
+
+
+def test_flow_table_discovers_all_flows():
+    """flows=None 时统计trace中出现的所有流, 两种解析引擎结果一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = _write_sample_trace(tmp)
+        with open(trace_file, 'a') as f:
+            f.write("+ 0.300000 6 2 tcp 1040 ------- 3 6.0 7.0 0 10\n")
+            f.write("r 0.900000 3 7 tcp 1040 ------- 3 6.0 7.0 0 10\n")
+
+        for flow_key, flow_ids in (('src', [0, 1, 6]), ('fid', [1, 2, 3])):
+            states = []
+            for engine in ('python', 'numpy'):
+                analyzer = TCPAnalyzer(trace_file, 'sample', flows=None, flow_key=flow_key)
+                analyzer.parse_trace(engine=engine)
+                assert [flow['flow_id'] for flow in analyzer.flows] == flow_ids
+                states.append((analyzer.flows, analyzer.get_fairness_index(),
+                               analyzer.get_stability_cov()))
+            assert states[0] == states[1]
+            assert analyzer.flows[2]['rcvd_packets'] == 1
+
+        # 默认只统计源节点0和1
+        analyzer = TCPAnalyzer(trace_file, 'sample')
+        analyzer.parse_trace()
+        assert [flow['flow_id'] for flow in analyzer.flows] == [0, 1]
+
+
+def test_lean_trace_layout_matches_filtered_full_trace():
+    """精简模式: 只含选定链路的trace + 单独的tracevar文件, 结果与完整trace加过滤器一致"""
+    lean_tcl = scenario.Scenario('cubic', lean=True).render()
+    assert 'namtrace-all' not in lean_tcl and 'trace-all' not in lean_tcl
+    assert lean_tcl.count('trace-queue') == len(DUMBBELL_FILTER.traced_links())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        full_trace = _write_sample_trace(tmp)
+        lean_trace = os.path.join(tmp, 'leanTrace.tr')
+        links = set(DUMBBELL_FILTER.traced_links())
+        with open(lean_trace, 'w') as packets, open(trace_layout.vars_file_for(lean_trace), 'w') as tracevars:
+            for line in SAMPLE_TRACE.splitlines(keepends=True):
+                parts = line.split()
+                if len(parts) < 12:
+                    tracevars.write(line)
+                elif (int(parts[2]), int(parts[3])) in links:
+                    packets.write(line)
+        with open(trace_layout.links_file_for(lean_trace), 'w') as f:
+            f.write(DUMBBELL_FILTER.spec() + '\n')
+
+        expected = TCPAnalyzer(full_trace, 'sample', link_filter=DUMBBELL_FILTER)
+        expected.parse_trace()
+        lean = TCPAnalyzer(lean_trace, 'sample')
+        lean.parse_trace()
+        assert _analyzer_state(lean) == _analyzer_state(expected)
+        assert trace_layout.metric_files_for(lean_trace)[1].endswith('leanTrace_vars.tr')
+
+
+def test_compressed_trace_is_read_transparently():
+    """gzip压缩的trace按魔数识别, 两种引擎的结果与未压缩时一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = _write_sample_trace(tmp)
+        expected = TCPAnalyzer(trace_file, 'sample')
+        expected.parse_trace()
+        
+        archived = os.path.join(tmp, 'archivedTrace.tr')
+        with gzip.open(archived + '.gz', 'wt') as f:
+            f.write(SAMPLE_TRACE)
+        for engine in ('python', 'numpy'):
+            # 只给出未压缩的文件名, 自动找到 .gz
+            analyzer = TCPAnalyzer(archived, 'sample')
+            analyzer.parse_trace(engine=engine)
+            assert analyzer.trace_file == archived + '.gz'
+            assert _analyzer_state(analyzer) == _analyzer_state(expected)
+        assert trace_io.count_lines(archived + '.gz') == SAMPLE_TRACE.count('\n')
+
+
+
+def test_compressed_rerun_replaces_plain_trace():
+    """先不压缩、再用 -z 运行同一个作业: 旧的未压缩trace被删除, 分析的是新的 .gz"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = _write_sample_trace(tmp)
+        fake_ns = os.path.join(tmp, 'fake_ns.py')
+        with open(fake_ns, 'w') as f:
+            f.write(f'#!{sys.executable}\n' + _FAKE_NS % source)
+        os.chmod(fake_ns, 0o755)
+        out_dir = os.path.join(tmp, 'out')
+        tcl = 'set tracefile1 [open rerunTrace.tr w]\n'
+        trace_file = os.path.join(out_dir, 'rerunTrace.tr')
+        saved = sim_runner.NS_BINARY
+        sim_runner.NS_BINARY = fake_ns
+        try:
+            assert sim_runner.run_job(sim_runner.SimJob('rerunCode', tcl_content=tcl, output_dir=out_dir))['ok']
+            assert trace_io.resolve_trace(trace_file) == trace_file
+            result = sim_runner.run_job(sim_runner.SimJob('rerunCode', tcl_content=tcl, output_dir=out_dir,
+                                                          compress='gzip'))
+        finally:
+            sim_runner.NS_BINARY = saved
+
+        assert result['ok'] and not os.path.exists(trace_file)
+        assert TCPAnalyzer(trace_file, 'rerun').trace_file == trace_file + '.gz'
+        assert trace_io.count_lines(trace_file + '.gz') == SAMPLE_TRACE.count('\n')
+
+
+def test_runner_reports_output_errors_per_job():
+    """输出目录无法写入时只有这个作业失败, 同一批的其他作业照常完成"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = _write_sample_trace(tmp)
+        fake_ns = os.path.join(tmp, 'fake_ns.py')
+        with open(fake_ns, 'w') as f:
+            f.write(f'#!{sys.executable}\n' + _FAKE_NS % source)
+        os.chmod(fake_ns, 0o755)
+        tcl = 'set tracefile1 [open jobTrace.tr w]\n'
+        # 输出目录的父路径是普通文件, os.makedirs 抛出 OSError
+        bad = sim_runner.SimJob('badCode', tcl_content=tcl, output_dir=os.path.join(source, 'out'))
+        good = sim_runner.SimJob('goodCode', tcl_content=tcl, output_dir=os.path.join(tmp, 'out'))
+        saved = sim_runner.NS_BINARY
+        sim_runner.NS_BINARY = fake_ns
+        try:
+            results = sim_runner.run_jobs([bad, good], max_workers=2, verbose=False)
+        finally:
+            sim_runner.NS_BINARY = saved
+
+        assert not results[0]['ok'] and '收集输出失败' in results[0]['error']
+        assert results[1]['ok'] and os.path.exists(os.path.join(tmp, 'out', 'jobTrace.tr'))
+
+
+def test_trace_cache_roundtrip_and_invalidation():
+    """缓存命中时结果不变, trace内容改变后缓存失效"""
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = _write_sample_trace(tmp)
+        
+        expected = TCPAnalyzer(trace_file, 'sample')
+        expected.parse_trace()
+        
+        first = TCPAnalyzer(trace_file, 'sample')
+        first.parse_trace(use_cache=True)
+        assert trace_cache.is_valid(trace_file)
+        cached = TCPAnalyzer(trace_file, 'sample')
+        cached.parse_trace(use_cache=True)
+        assert _analyzer_state(first) == _analyzer_state(expected)
+        assert _analyzer_state(cached) == _analyzer_state(expected)
+        
+        # 只修改时间戳: 内容哈希相同, 缓存仍然有效
+        st = os.stat(trace_file)
+        os.utime(trace_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        assert trace_cache.is_valid(trace_file)
+        
+        # 追加一个丢包事件: 缓存失效并重新解析
+        with open(trace_file, 'a') as f:
+            f.write("d 3.000000 2 3 tcp 1040 ------- 1 0.0 4.0 2 9\n")
+        assert not trace_cache.is_valid(trace_file)
+        updated = TCPAnalyzer(trace_file, 'sample')
+        updated.parse_trace(use_cache=True)
+        assert updated.flow1_data['dropped_packets'] == 1
+
+
+def test_trace_cache_is_written_block_by_block():
+    """缓存未命中时逐块解析并写入, 不在内存中拼接整个trace的列"""
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = os.path.join(tmp, 'synthTrace.tr')
+        trace_gen.generate_trace(trace_file, '4MB', flows=2, drop_rate=0.02, seed=7)
+        expected = trace_mmap.read_trace_columns(trace_file)
+        full_bytes = sum(column.nbytes for column in expected.values())
+
+        # 中途停止迭代: 不留下缓存
+        next(trace_cache.iter_columns_cached(trace_file, block_size=64 * 1024))
+        assert not trace_cache.is_valid(trace_file)
+
+        # 内容哈希每次读取的缓冲区与trace大小无关, 这里调小以免掩盖列的内存
+        saved = trace_cache.HASH_CHUNK_SIZE
+        trace_cache.HASH_CHUNK_SIZE = 64 * 1024
+        tracemalloc.start()
+        try:
+            blocks = 0
+            for _ in trace_cache.iter_columns_cached(trace_file, block_size=64 * 1024):
+                blocks += 1
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            trace_cache.HASH_CHUNK_SIZE = saved
+        assert blocks > 1 and trace_cache.is_valid(trace_file)
+        assert peak < full_bytes / 4
+
+        cached = trace_cache.read_columns_cached(trace_file)
+        for name, column in expected.items():
+            assert np.array_equal(cached[name], column)
+        assert cached['from_node'].dtype == np.int8 and cached['type'].dtype == np.dtype('S3')
+
+
+def test_summary_index_answers_window_queries():
+    """摘要索引: 整段的计数与完整解析一致, 任意窗口的查询不读原始trace, trace改变后重建"""
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = _write_sample_trace(tmp)
+        analyzer = TCPAnalyzer(trace_file, 'sample', flows=None)
+        analyzer.parse_trace()
+        index = analyzer.summary_index(resolution=0.05)
+        assert os.path.exists(trace_index.index_path_for(trace_file))
+        totals = index.totals(0, None)
+        for flow_data, row in zip(analyzer.flows, totals):
+            assert row.tolist() == [flow_data[name] for name in flow_table.COUNTERS]
+
+        # flow 0 在 [1, 2) 内只收到一个包, flow 1 在 [0.5, 1.05) 内丢包1个、收到1个
+        assert index.totals(1, 2)[:, flow_table.RCVD].tolist() == [1, 1]
+        assert index.goodput(1, 2).tolist() == [1040 * 8 / 1e6] * 2
+        assert index.totals(0.5, 1.05, [1]).tolist() == [[0, 1, 1, 1040]]
+        assert index.totals(0, 3, [9]).tolist() == [[0, 0, 0, 0]]
+        assert index.cwnd_at(0, 2.0) == 1.0
+        assert index.rtt_at(1, 1.25) == 0.25
+        assert np.isnan(index.rtt_at(1, 1.0))
+
+        summary = analyzer.window_summary(0, 3)
+        assert summary['flow_ids'] == [0, 1]
+        assert summary['plr'] == analyzer.get_plr()
+
+        # trace被改写后重建索引
+        with open(trace_file, 'a') as f:
+            f.write("d 2.600000 2 3 tcp 1040 ------- 1 0.0 4.0 2 9\n")
+        rebuilt = trace_index.load_or_build(trace_file, 0.05, 'src')
+        assert rebuilt.totals(0, None)[0, flow_table.DROPPED] == 1
+
+
+def test_pipeline_reruns_only_stale_steps():
+    """增量分析: 只重新解析变化的trace, 只重写依赖它的输出"""
+    with tempfile.TemporaryDirectory() as tmp:
+        first = _write_sample_trace(tmp)
+        second = os.path.join(tmp, 'otherTrace.tr')
+        with open(second, 'w') as f:
+            f.write(SAMPLE_TRACE)
+        state_file = os.path.join(tmp, pipeline.STATE_FILE)
+        analyzed = []
+
+        def analyze(tasks, extras=()):
+            analyzed.extend(trace_file for _, trace_file, _ in tasks)
+            summaries = {}
+            for key, trace_file, variant in tasks:
+                analyzer = TCPAnalyzer(trace_file, variant)
+                analyzer.parse_trace()
+                summaries[key] = {'plr': analyzer.get_plr(), **{extra: True for extra in extras}}
+            return summaries
+
+        def run():
+            pipe = pipeline.Pipeline(state_file)
+            summaries = pipe.summaries([('a', first, 'x'), ('b', second, 'x')], analyze)
+            for key, summary in summaries.items():
+                pipe.step(os.path.join(tmp, key + '.csv'), summary,
+                          lambda path: open(path, 'w').close())
+            return pipe
+
+        assert len(run().ran) == 4
+        assert run().ran == []
+        # 重新生成其中一个trace: 只重新解析它, 只重写依赖它的输出
+        with open(second, 'a') as f:
+            f.write("d 3.000000 2 3 tcp 1040 ------- 1 0.0 4.0 2 9\n")
+        analyzed.clear()
+        pipe = run()
+        assert analyzed == [second]
+        assert pipe.ran == [second, os.path.join(tmp, 'b.csv')]
+        # 输出被删除时重新生成
+        os.remove(os.path.join(tmp, 'a.csv'))
+        assert run().ran == [os.path.join(tmp, 'a.csv')]
+        # 缺少请求的额外项时重新分析一次, 之后不请求它时也不再重新分析
+        analyzed.clear()
+        extra = pipeline.Pipeline(state_file).summaries([('a', first, 'x')], analyze, extras=('jitter',))
+        assert analyzed == [first] and extra['a']['jitter']
+        run()
+        assert analyzed == [first]
+        # trace不存在: 交给analyze输出警告, 不中断, 也不记录状态
+        os.remove(second)
+        analyzed.clear()
+        pipe = run()
+        assert analyzed == [second]
+        assert os.path.abspath(second) not in pipe.state['traces']
+
+
+def test_lttb_downsampling_keeps_shape():
+    """LTTB: 点数为阈值, 保留首尾点和尖峰; 'none' 格式不生成图表"""
+    x = np.arange(100000) * 0.01
+    y = np.sin(x)
+    y[54321] = 10.0
+    dx, dy = plotting.downsample(x, y, max_points=500)
+    assert len(dx) == 500
+    assert (dx[0], dx[-1]) == (x[0], x[-1])
+    assert np.all(np.diff(dx) > 0)
+    assert dy.max() == 10.0
+    # 点数不超过阈值时原样返回
+    assert len(plotting.downsample(x[:100], y[:100], max_points=500)[0]) == 100
+    assert plotting.figure_path('out/partA.png', 'svg') == 'out/partA.svg'
+    assert plotting.figure_path('out/partA.png', 'none') is None
+
+
+def test_synthetic_trace_and_benchmark():
+    """合成trace: 端到端计数与生成器的统计一致, 时间单调; 基准测试可以在上面运行"""
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = os.path.join(tmp, 'synthTrace.tr')
+        stats = trace_gen.generate_trace(trace_file, '200KB', flows=3, drop_rate=0.05, seed=2)
+        assert abs(os.path.getsize(trace_file) - 200 * 1024) < 2048
+        assert stats['lines'] == trace_io.count_lines(trace_file)
+
+        analyzer = TCPAnalyzer(trace_file, 'synth', flows=None,
+                               link_filter=link_filter.dumbbell_filter(3))
+        analyzer.parse_trace(engine='mmap')
+        assert [f['sent_packets'] for f in analyzer.flows] == stats['sent']
+        assert [f['rcvd_packets'] for f in analyzer.flows] == stats['delivered']
+        assert [f['dropped_packets'] for f in analyzer.flows] == stats['dropped']
+        assert np.all(np.diff(trace_mmap.read_trace_columns(trace_file)['time']) >= 0)
+
+        results = benchmark.run_suite(trace_file, ['parse_trace[mmap]', 'get_plr'], repeat=1, log=None)
+        assert [row['case'] for row in results] == ['parse_trace[mmap]', 'get_plr']
+        assert results[0]['lines_per_sec'] > 0 and 'lines_per_sec' not in results[1]
+
+
+def test_instrumentation_counts_and_report():
+    """阶段计时和计数器: 各解析引擎的计数一致, 工作进程的结果合并到当前阶段下"""
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = _write_sample_trace(tmp)
+        counters = {}
+        for engine in ('python', 'numpy', 'mmap'):
+            analyzer = TCPAnalyzer(trace_file, 'sample', stats=instrument.Stats())
+            analyzer.parse_trace(engine=engine)
+            counters[engine] = analyzer.stats.counters
+            assert analyzer.stats.stages['parse_trace']['calls'] == 1
+        assert counters['python']['lines_read'] == 12
+        assert counters['python']['lines_skipped'] == 2
+        for engine in ('python', 'numpy', 'mmap'):
+            assert counters[engine]['packet_lines'] == 10
+            assert counters[engine]['bytes_read'] == len(SAMPLE_TRACE)
+            assert {k: v for k, v in counters[engine].items() if k.startswith('events.')} == \
+                {'events.+': 4, 'events.-': 1, 'events.r': 4, 'events.d': 1}
+
+        stats = instrument.Stats(profile='cprofile', profile_dir=os.path.join(tmp, 'profiles'))
+        with stats.stage('partA'):
+            with stats.stage('analyze'):
+                summaries = analyser3.analyze_traces([('a', trace_file, 'sample'), ('b', trace_file, 'sample')],
+                                                     max_workers=1, use_cache=False, stats=stats)
+        assert summaries['a']['plr'] == summaries['b']['plr']
+        assert stats.stages['partA/analyze/parse_trace']['calls'] == 2
+        assert stats.counters['traces'] == 2 and stats.counters['packet_lines'] == 20
+        assert os.listdir(os.path.join(tmp, 'profiles')) == ['partA.prof']
+
+        report = stats.write_report(os.path.join(tmp, 'report.json'), settings={'force': True})
+        with open(os.path.join(tmp, 'report.json')) as f:
+            assert json.load(f) == report
+        assert report['settings'] == {'force': True} and report['profile']['mode'] == 'cprofile'
+
+
+def test_live_analyzer_handles_partial_lines():
+    """跟随模式: 文件在行中间被截断写入时, 结果与完整解析一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = os.path.join(tmp, 'growingTrace.tr')
+        data = SAMPLE_TRACE.encode()
+        cut = data.index(b'tcp 1040', len(data) // 2)
+        
+        live = LiveTCPAnalyzer(trace_file, 'sample')
+        assert live.poll() == 0
+        with open(trace_file, 'wb') as f:
+            f.write(data[:cut])
+        live.poll()
+        assert live.lines_read == data[:cut].count(b'\n')
+        with open(trace_file, 'ab') as f:
+            f.write(data[cut:])
+        live.poll()
+        snapshot = live.snapshot()
+        
+        expected = TCPAnalyzer(_write_sample_trace(tmp), 'sample')
+        expected.parse_trace()
+        assert live.flow1_data == expected.flow1_data
+        assert live.flow2_data == expected.flow2_data
+        assert snapshot['time'] == 2.5
+        assert snapshot['plr'] == expected.get_plr()
+        assert snapshot['fairness'] == expected.get_fairness_index()
+
+
+def test_scenario_templates_match_generator():
+    """四个TCL模板就是生成器的默认输出; 参数扫描按组合生成不同的文件名"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    for variant in scenario.VARIANTS:
+        with open(os.path.join(here, f'{variant}Code.tcl')) as f:
+            assert f.read() == scenario.Scenario(variant).render()
+
+    red = scenario.Scenario('yeah', queue='RED')
+    assert red.trace_file == 'yeahTrace_red.tr'
+    assert 'DropTail' not in red.render()
+
+    scenarios = list(scenario.sweep(variant=['reno', 'cubic'], flows=[2, 8], seed=range(3)))
+    assert len({s.name for s in scenarios}) == 12
+    big = scenarios[-1].render()
+    # 8条流: 8个源节点 + 2个路由器 + 8个目的节点
+    assert big.count('[$ns node]') == 18
+    assert big.count('Application/FTP') == 8
+
+
 if __name__ == '__main__':
     test_trace_parsing()
-
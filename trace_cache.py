@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+trace_cache.py - trace文件的二进制列式缓存
+
+第一次解析trace时, 把 trace_mmap 解析得到的NumPy列保存到
+<trace所在目录>/.trace_cache/<trace文件名>.cols/ 下 (每列一个 .npy 文件),
+之后再分析同一个文件时直接以内存映射方式加载, 不再解析文本。
+整数列和字节串列在写入时收窄为能容纳全部取值的最小类型。
+
+缓存未命中时按块解析并逐块追加到缓存 (iter_columns_cached), 内存中只保留一块,
+不会因为先拼接整个trace的列而占用与trace文件相当的内存。命中时同样按行数分块产出
+内存映射的切片。
+
+缓存有效性由 路径、大小、修改时间 和 内容哈希 共同决定:
+- 大小和修改时间都没变: 直接命中
+- 大小没变但修改时间变了: 重新计算内容哈希, 哈希相同仍然命中
+- 其他情况: 缓存失效, 重新解析
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import trace_mmap
+import trace_reader
+
+CACHE_DIR_NAME = '.trace_cache'
+CACHE_VERSION = 1
+META_FILE = 'meta.json'
+
+# 计算内容哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+# 缓存命中时每块的行数, 以及写缓存时收窄类型每次复制的行数
+BLOCK_ROWS = 1 << 21
+
+
+def cache_path_for(trace_file):
+    """返回trace文件对应的缓存目录"""
+    trace_file = os.path.abspath(trace_file)
+    return os.path.join(os.path.dirname(trace_file), CACHE_DIR_NAME,
+                        os.path.basename(trace_file) + '.cols')
+
+
+def content_hash(trace_file):
+    """计算文件内容的 blake2b 哈希"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(trace_file, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(trace_file, with_hash=True):
+    """
+    返回trace文件的指纹
+
+    参数:
+        trace_file: trace文件路径
+        with_hash: 是否计算内容哈希
+    """
+    st = os.stat(trace_file)
+    info = {
+        'version': CACHE_VERSION,
+        'path': os.path.abspath(trace_file),
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+    }
+    if with_hash:
+        info['hash'] = content_hash(trace_file)
+    return info
+
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, META_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(cache_dir, meta):
+    tmp_path = os.path.join(cache_dir, META_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, os.path.join(cache_dir, META_FILE))
+
+
+def is_valid(trace_file):
+    """检查缓存是否仍然对应当前的trace文件内容"""
+    cache_dir = cache_path_for(trace_file)
+    meta = _read_meta(cache_dir)
+    if meta is None or meta.get('version') != CACHE_VERSION:
+        return False
+
+    current = fingerprint(trace_file, with_hash=False)
+    if meta['path'] != current['path'] or meta['size'] != current['size']:
+        return False
+    if meta['mtime_ns'] == current['mtime_ns']:
+        return True
+
+    # 文件被touch过或重新生成, 用内容哈希确认
+    if meta.get('hash') != content_hash(trace_file):
+        return False
+    meta['mtime_ns'] = current['mtime_ns']
+    try:
+        _write_meta(cache_dir, meta)
+    except OSError:
+        pass
+    return True
+
+
+def load_columns(trace_file, mmap=True):
+    """
+    从缓存加载列字典, 缓存不存在或已失效时返回None
+
+    参数:
+        trace_file: trace文件路径
+        mmap: 是否以内存映射方式加载 (不把整列读入内存)
+    """
+    if not is_valid(trace_file):
+        return None
+
+    cache_dir = cache_path_for(trace_file)
+    mmap_mode = 'r' if mmap else None
+    try:
+        return {name: np.load(os.path.join(cache_dir, name + '.npy'), mmap_mode=mmap_mode)
+                for name in trace_reader.TRACE_COLUMNS}
+    except (OSError, ValueError):
+        return None
+
+
+def _compact_dtype(dtype, low=None, high=None, width=0):
+    """能容纳全部取值的最小类型: 整数列按取值范围, 字节串列按最大长度"""
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'S':
+        return np.dtype(f'S{max(1, width)}')
+    if dtype.kind == 'i' and low is not None:
+        for narrow in (np.int8, np.int16, np.int32):
+            info = np.iinfo(narrow)
+            if info.min <= low and high <= info.max:
+                return np.dtype(narrow)
+    return dtype
+
+
+class _CacheWriter:
+    """
+    把按块产出的列逐块追加到临时目录中的原始二进制文件, 同时记录每列的取值范围;
+    commit() 时按块收窄类型写成 .npy 文件, 再整体替换缓存目录
+    """
+
+    def __init__(self, trace_file):
+        self.cache_dir = cache_path_for(trace_file)
+        parent = os.path.dirname(self.cache_dir)
+        os.makedirs(parent, exist_ok=True)
+        self.tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+        self.rows = 0
+        self.files = {}
+        self.ranges = {name: [None, None, 0] for name in trace_reader.TRACE_COLUMNS}
+        try:
+            for name in trace_reader.TRACE_COLUMNS:
+                self.files[name] = open(self._raw_path(name), 'wb')
+        except OSError:
+            self.abort()
+            raise
+
+    def _raw_path(self, name):
+        return os.path.join(self.tmp_dir, name + '.raw')
+
+    def append(self, columns):
+        """追加一块 trace_reader 格式的列字典"""
+        for name, dtype in trace_reader.TRACE_COLUMNS.items():
+            column = np.asarray(columns[name], dtype=dtype)
+            if len(column):
+                low, high, width = self.ranges[name]
+                if column.dtype.kind == 'S':
+                    width = max(width, int(np.char.str_len(column).max()))
+                elif column.dtype.kind == 'i':
+                    low = int(column.min()) if low is None else min(low, int(column.min()))
+                    high = int(column.max()) if high is None else max(high, int(column.max()))
+                self.ranges[name] = [low, high, width]
+            self.files[name].write(column.tobytes())
+        self.rows += len(columns['time'])
+
+    def commit(self, meta):
+        """写出收窄后的 .npy 文件和指纹, 替换缓存目录"""
+        for f in self.files.values():
+            f.close()
+        for name, dtype in trace_reader.TRACE_COLUMNS.items():
+            raw_path = self._raw_path(name)
+            target = _compact_dtype(dtype, *self.ranges[name])
+            out = np.lib.format.open_memmap(os.path.join(self.tmp_dir, name + '.npy'), mode='w+',
+                                            dtype=target, shape=(self.rows,))
+            if self.rows:
+                raw = np.memmap(raw_path, dtype=dtype, mode='r', shape=(self.rows,))
+                for start in range(0, self.rows, BLOCK_ROWS):
+                    out[start:start + BLOCK_ROWS] = raw[start:start + BLOCK_ROWS].astype(target)
+                del raw
+            out.flush()
+            del out
+            os.remove(raw_path)
+        _write_meta(self.tmp_dir, meta)
+        if os.path.exists(self.cache_dir):
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.replace(self.tmp_dir, self.cache_dir)
+
+    def abort(self):
+        for f in self.files.values():
+            f.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def store_columns(trace_file, columns, meta=None):
+    """
+    把列字典 (一个或多个块) 写入缓存
+
+    先写到临时目录再整体替换, 并行写同一个trace的缓存时不会留下半成品。
+    返回是否写入成功。
+
+    参数:
+        trace_file: trace文件路径
+        columns: trace_reader 格式的列字典, 或按块产出的列字典
+        meta: 解析前取得的文件指纹 (默认现在计算)
+    """
+    if meta is None:
+        meta = fingerprint(trace_file)
+    if isinstance(columns, dict):
+        columns = [columns]
+    try:
+        writer = _CacheWriter(trace_file)
+    except OSError:
+        return False
+    try:
+        for cols in columns:
+            writer.append(cols)
+        writer.commit(meta)
+    except OSError:
+        # 缓存只是加速手段, 写入失败 (只读目录、磁盘已满、并发写入等) 不影响分析
+        writer.abort()
+        return False
+    return True
+
+
+def iter_columns_cached(trace_file, block_size=trace_mmap.DEFAULT_BLOCK_SIZE):
+    """
+    按块产出trace的列字典, 优先使用缓存
+
+    命中时产出内存映射的列每 BLOCK_ROWS 行的切片; 未命中时边解析边产出每一块,
+    同时追加到缓存, 读完整个trace后缓存才生效 (中途停止迭代时不写入)。
+    两种情况下内存中都只有一块。
+    """
+    columns = load_columns(trace_file)
+    if columns is not None:
+        rows = len(columns['time'])
+        for start in range(0, rows, BLOCK_ROWS):
+            yield {name: column[start:start + BLOCK_ROWS] for name, column in columns.items()}
+        return
+
+    # 先取指纹再解析, 解析期间文件被改写时下次会重新校验
+    meta = fingerprint(trace_file)
+    try:
+        writer = _CacheWriter(trace_file)
+    except OSError:
+        writer = None
+    try:
+        for cols in trace_mmap.iter_trace_blocks(trace_file, block_size):
+            if writer is not None:
+                try:
+                    writer.append(cols)
+                except OSError:
+                    writer.abort()
+                    writer = None
+            yield cols
+        if writer is not None:
+            try:
+                writer.commit(meta)
+            except OSError:
+                writer.abort()
+            writer = None
+    finally:
+        if writer is not None:
+            writer.abort()
+
+
+def read_columns_cached(trace_file, mmap=True):
+    """
+    读取trace文件的列字典, 优先使用缓存
+
+    缓存未命中时逐块解析并写入缓存, 再从缓存加载; 缓存无法写入时
+    退回到在内存中拼接整个trace的列。
+    """
+    columns = load_columns(trace_file, mmap=mmap)
+    if columns is not None:
+        return columns
+    for _ in iter_columns_cached(trace_file):
+        pass
+    columns = load_columns(trace_file, mmap=mmap)
+    if columns is not None:
+        return columns
+    return trace_mmap.read_trace_columns(trace_file)
+
+
+def clear_cache(trace_file):
+    """删除trace文件对应的缓存"""
+    shutil.rmtree(cache_path_for(trace_file), ignore_errors=True)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+trace_gen.py - 合成NS2格式的trace文件
+
+生成与 scenario.py 哑铃拓扑相同的trace, 供基准测试 (benchmark.py) 使用,
+大小从几MB到几GB任意指定:
+
+    源节点 0..N-1 -> 路由器 N -> 路由器 N+1 -> 目的节点 N+2..2N+1
+
+每个数据包依次经过三段链路 ('+' '-' 'r'), 以 drop_rate 的概率在瓶颈链路
+上被丢弃 ('d'), 送达后目的节点回一个ACK。每 var_every 个包为当前流写一组
+tracevar行 (cwnd_ / rtt_ / ack_)。
+
+不同包在不同链路上的事件按流水线交错输出, 整个文件的时间单调不减,
+与ns的输出一样。相同的参数和种子生成完全相同的文件。
+
+用法:
+    python trace_gen.py bigTrace.tr --size 1GB --flows 4 --drop-rate 0.02
+    python trace_gen.py bigTrace.tr.gz --size 100MB      # 按扩展名压缩
+"""
+
+import argparse
+import re
+import sys
+from collections import deque
+
+import numpy as np
+
+import trace_io
+
+PACKET_SIZE = 1040
+ACK_SIZE = 40
+
+# 每批生成的包数 (随机数按批生成)
+_BATCH = 64 * 1024
+
+_UNITS = {'': 1, 'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+
+def parse_size(text):
+    """'10MB' / '2GB' / '4096' -> 字节数"""
+    match = re.fullmatch(r'\s*([\d.]+)\s*([KMG]?B?)\s*', str(text).upper())
+    if not match:
+        raise ValueError(f"无法识别的大小: {text}")
+    return int(float(match.group(1)) * _UNITS[match.group(2)])
+
+
+def _format_for(path):
+    """按扩展名决定输出的压缩格式"""
+    for name, (_, ext) in trace_io.FORMATS.items():
+        if path.endswith(ext):
+            return name
+    return None
+
+
+class _Writer:
+    """按流水线阶段输出每个包的事件行"""
+
+    def __init__(self, flows, var_every):
+        self.flows = flows
+        self.var_every = var_every
+        self.left, self.right = flows, flows + 1
+        self.seq = [0] * flows
+        self.uid = 0
+        self.ack_uid = 0
+        # 统计: 每条流在端到端路径上发送、送达、丢弃的包数
+        self.sent = [0] * flows
+        self.delivered = [0] * flows
+        self.dropped = [0] * flows
+
+    def new_packet(self, flow, drop):
+        packet = (flow, self.seq[flow], self.uid, drop)
+        self.seq[flow] += 1
+        self.uid += 1
+        self.sent[flow] += 1
+        if drop:
+            self.dropped[flow] += 1
+        else:
+            self.delivered[flow] += 1
+        return packet
+
+    def stage(self, k, packet, t):
+        """包在流水线第k段的事件行"""
+        flow, seq, uid, drop = packet
+        src, dst = flow, self.right + 1 + flow
+        left, right = self.left, self.right
+        tail = f"tcp {PACKET_SIZE} ------- {flow + 1} {src}.0 {dst}.0 {seq} {uid}\n"
+        if k == 0:
+            return f"+ {t:.6f} {src} {left} {tail}- {t:.6f} {src} {left} {tail}"
+        if k == 1:
+            head = f"r {t:.6f} {src} {left} {tail}"
+            if drop:
+                return head + f"d {t:.6f} {left} {right} {tail}"
+            return head + f"+ {t:.6f} {left} {right} {tail}- {t:.6f} {left} {right} {tail}"
+        if drop:
+            return ""
+        if k == 2:
+            return (f"r {t:.6f} {left} {right} {tail}"
+                    f"+ {t:.6f} {right} {dst} {tail}- {t:.6f} {right} {dst} {tail}")
+        ack = f"ack {ACK_SIZE} ------- {flow + 1} {dst}.0 {src}.0 {seq} {self.ack_uid}\n"
+        self.ack_uid += 1
+        return f"r {t:.6f} {right} {dst} {tail}+ {t:.6f} {dst} {right} {ack}- {t:.6f} {dst} {right} {ack}"
+
+    def tracevars(self, packet, t, cwnd, rtt):
+        flow, seq = packet[0], packet[1]
+        dst = self.right + 1 + flow
+        return (f"{t:.5f} {flow} 0 {dst} 0 cwnd_ {cwnd:.3f}\n"
+                f"{t:.5f} {flow} 0 {dst} 0 rtt_ {rtt:.3f}\n"
+                f"{t:.5f} {flow} 0 {dst} 0 ack_ {seq}\n")
+
+    def slot(self, t, dt, pipeline, packet, cwnd=None, rtt=None):
+        """一个时间槽: 新包进入第0段, 之前的包各前进一段"""
+        if packet is not None:
+            pipeline.appendleft(packet)
+        parts = [self.stage(k, p, t + k * dt / 4) for k, p in enumerate(pipeline)
+                 if p is not None]
+        if cwnd is not None and packet is not None:
+            parts.append(self.tracevars(packet, t + 0.8 * dt, cwnd, rtt))
+        return ''.join(parts)
+
+
+def generate_trace(path, size, flows=2, drop_rate=0.01, var_every=10, duration=100.0, seed=1):
+    """
+    生成大约size字节的trace文件
+
+    参数:
+        path: 输出路径, 以 .gz/.zst/.lz4 结尾时压缩 (size 为压缩前的大小)
+        size: 目标大小 (字节数, 或 '100MB' 形式的字符串)
+        flows: 流的数量
+        drop_rate: 每个包在瓶颈链路上被丢弃的概率
+        var_every: 每多少个包写一组tracevar行, 0 表示不写
+        duration: 仿真时长 (秒), 包在其中均匀分布
+        seed: 随机种子
+    返回:
+        统计字典: bytes, lines, packets, 以及每条流的 sent / delivered / dropped
+        (按哑铃拓扑端到端计数, 与 link_filter.dumbbell_filter(flows) 的统计一致)
+    """
+    size = parse_size(size)
+    if flows < 1:
+        raise ValueError(f"流的数量必须为正数: {flows}")
+    writer = _Writer(flows, var_every)
+    rng = np.random.default_rng(seed)
+
+    # 用一个典型的时间槽估计每个包的字节数, 决定时间步长
+    sample = _Writer(flows, var_every)
+    sample.uid = sample.ack_uid = max(1, size // 400)
+    probe = deque([sample.new_packet(0, False) for _ in range(4)], maxlen=4)
+    per_packet = len(sample.slot(duration / 2, 1e-3, probe, None, 10.0, 0.1))
+    if var_every:
+        per_packet += len(sample.tracevars(probe[0], duration / 2, 10.0, 0.1)) / var_every
+    dt = duration / max(1, size / per_packet)
+
+    fmt = _format_for(path)
+    out = trace_io.open_compressed_writer(path, fmt) if fmt else open(path, 'wb')
+    written = lines = 0
+    pipeline = deque(maxlen=4)
+    i = 0
+    with out:
+        while written < size:
+            flow_ids = rng.integers(flows, size=_BATCH).tolist()
+            drops = (rng.random(_BATCH) < drop_rate).tolist()
+            cwnds = rng.uniform(2, 64, _BATCH).tolist()
+            rtts = rng.uniform(0.05, 0.3, _BATCH).tolist()
+            chunk = []
+            for j in range(_BATCH):
+                packet = writer.new_packet(flow_ids[j], drops[j])
+                with_vars = var_every and i % var_every == 0
+                text = writer.slot(i * dt, dt, pipeline, packet,
+                                   cwnds[j] if with_vars else None, rtts[j])
+                chunk.append(text)
+                written += len(text)
+                i += 1
+                if written >= size:
+                    break
+            # 最后几个包走完剩下的链路
+            if written >= size:
+                for _ in range(3):
+                    pipeline.appendleft(None)
+                    text = writer.slot(i * dt, dt, pipeline, None)
+                    chunk.append(text)
+                    written += len(text)
+                    i += 1
+            data = ''.join(chunk).encode()
+            lines += data.count(b'\n')
+            out.write(data)
+
+    return {
+        'bytes': written,
+        'lines': lines,
+        'packets': writer.uid,
+        'flows': flows,
+        'drop_rate': drop_rate,
+        'var_every': var_every,
+        'seed': seed,
+        'sent': writer.sent,
+        'delivered': writer.delivered,
+        'dropped': writer.dropped,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='生成合成的NS2格式trace文件')
+    parser.add_argument('output', help='输出路径 (.gz/.zst/.lz4 结尾时压缩)')
+    parser.add_argument('--size', default='10MB', help='目标大小, 例如 10MB、2GB (默认10MB)')
+    parser.add_argument('--flows', type=int, default=2)
+    parser.add_argument('--drop-rate', type=float, default=0.01)
+    parser.add_argument('--var-every', type=int, default=10,
+                        help='每多少个包写一组tracevar行, 0 表示不写')
+    parser.add_argument('--duration', type=float, default=100.0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    stats = generate_trace(args.output, args.size, args.flows, args.drop_rate,
+                           args.var_every, args.duration, args.seed)
+    print(f"{args.output}: {stats['lines']} 行, {stats['bytes'] / 1024 ** 2:.1f} MB, "
+          f"{stats['packets']} 个包, 丢包 {sum(stats['dropped'])}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
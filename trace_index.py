@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+trace_index.py - 每个trace的摘要索引
+
+对trace解析一次, 按很细的时间粒度 (默认10 ms) 保存每条流的累计计数:
+
+    cum[流, 计数器, k]  第k个时间边界 (k * resolution) 之前的累计值
+                        计数器与 flow_table.COUNTERS 相同: 发送包数、接收包数、丢包数、接收字节数
+
+以及每个源节点的 cwnd / rtt 检查点 (每个时间桶结束时的最新值)。
+任意时间窗口 [start, end) 的统计量都是两个边界上累计值之差,
+吞吐量、PLR、公平性、CoV 的查询不再读取原始trace。
+窗口边界按 resolution 对齐。
+
+索引保存在 <trace所在目录>/.trace_cache/<trace文件名>.idx.npz,
+trace文件 (以及精简模式的tracevar文件) 的大小、修改时间或统计设置
+(粒度、流标识、链路过滤器) 改变后自动重建。
+
+用法:
+    index = trace_index.load_or_build('cubicTrace.tr')
+    index.goodput(40, 60)          # 每条流在 [40, 60) 秒的吞吐量 (Mbps)
+    index.plr(40, 60)
+    index.cwnd_at(0, 50.0)
+"""
+
+import json
+import os
+
+import numpy as np
+
+import flow_table
+import trace_layout
+import trace_mmap
+from bucket_series import BucketSeries, TimeBuckets
+from trace_cache import CACHE_DIR_NAME
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.idx.npz'
+
+# 默认时间粒度 (秒)
+DEFAULT_RESOLUTION = 0.01
+
+# 保存检查点的tracevar
+CHECKPOINT_VARS = ('cwnd_', 'rtt_')
+
+# 累计数组初始容量 (时间桶数)
+_INITIAL_CAPACITY = 1024
+
+
+def index_path_for(trace_file):
+    """返回trace文件对应的索引文件路径"""
+    trace_file = os.path.abspath(trace_file)
+    return os.path.join(os.path.dirname(trace_file), CACHE_DIR_NAME,
+                        os.path.basename(trace_file) + INDEX_SUFFIX)
+
+
+def _source_info(trace_file, resolution, flow_key, link_filter):
+    """决定索引是否有效的全部信息: 各个文件的大小和修改时间, 以及统计设置"""
+    files = []
+    for path in trace_layout.metric_files_for(trace_file):
+        st = os.stat(path)
+        files.append({'path': os.path.abspath(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns})
+    return {
+        'version': INDEX_VERSION,
+        'files': files,
+        'resolution': resolution,
+        'flow_key': flow_key,
+        'links': link_filter.spec() if link_filter is not None else None,
+    }
+
+
+class TraceIndex:
+    """前缀和形式的trace摘要, 所有时间窗口查询都只做两次边界查找"""
+
+    def __init__(self, resolution, flow_ids, cum, var_nodes, checkpoints, meta=None):
+        """
+        参数:
+            resolution: 时间粒度 (秒)
+            flow_ids: 每行对应的流标识 (升序)
+            cum: (流数, 计数器数, 桶数 + 1) 的累计计数
+            var_nodes: 检查点对应的源节点号 (升序)
+            checkpoints: tracevar名 -> (节点数, 桶数) 的检查点数组, 第一次采样之前为NaN
+            meta: 构建索引时的 _source_info
+        """
+        self.resolution = resolution
+        self.flow_ids = np.asarray(flow_ids, dtype=np.int64)
+        self.cum = cum
+        self.var_nodes = np.asarray(var_nodes, dtype=np.int64)
+        self.checkpoints = checkpoints
+        self.meta = meta
+
+    @property
+    def buckets(self):
+        """索引覆盖的时间桶数"""
+        return self.cum.shape[2] - 1
+
+    @property
+    def duration(self):
+        """索引覆盖的时长 (秒)"""
+        return self.buckets * self.resolution
+
+    # ---- 构建和保存 ----
+
+    @classmethod
+    def build(cls, trace_file, resolution=DEFAULT_RESOLUTION, flow_key='src', link_filter=None):
+        """
+        解析trace文件构建索引 (统计trace中出现的所有TCP流)
+
+        参数:
+            trace_file: trace文件路径, 可以是压缩的trace
+            resolution: 时间粒度 (秒)
+            flow_key: 'src' 按源节点号区分流, 'fid' 按流号区分
+            link_filter: LinkFilter, 只统计指定链路上的事件
+        """
+        if flow_key not in flow_table.FLOW_KEYS:
+            raise ValueError(f"未知的流标识: {flow_key}")
+        meta = _source_info(trace_file, resolution, flow_key, link_filter)
+        time_buckets = TimeBuckets(resolution)
+        ncounters = len(flow_table.COUNTERS)
+
+        rows = {}  # 流标识 -> 行号
+        counts = np.zeros((0, ncounters, _INITIAL_CAPACITY), dtype=np.int64)
+        length = 0
+        series = {var: {} for var in CHECKPOINT_VARS}  # tracevar名 -> 源节点 -> BucketSeries
+
+        for path in trace_layout.metric_files_for(trace_file):
+            for packets, tracevars in trace_mmap.iter_blocks(path):
+                keep = packets['type'] == b'tcp'
+                if link_filter is not None:
+                    keep &= link_filter.mask(packets)
+                codes = np.full(len(keep), -1, dtype=np.int64)
+                for event, code in flow_table.EVENT_CODES.items():
+                    codes[packets['event'] == event.encode()] = code
+                keep &= (codes >= 0) & (packets[flow_key] >= 0)
+                if keep.any():
+                    ids = packets[flow_key][keep].astype(np.int64)
+                    for flow_id in np.unique(ids).tolist():
+                        if flow_id not in rows:
+                            rows[flow_id] = len(rows)
+                            counts = np.concatenate(
+                                [counts, np.zeros((1,) + counts.shape[1:], dtype=np.int64)])
+                    known = np.array(sorted(rows), dtype=np.int64)
+                    known_rows = np.array([rows[flow_id] for flow_id in known.tolist()], dtype=np.int64)
+                    row = known_rows[np.searchsorted(known, ids)]
+                    code = codes[keep]
+                    bucket = time_buckets.index_of(packets['time'][keep])
+                    length = max(length, int(bucket.max()) + 1)
+                    capacity = counts.shape[2]
+                    if length > capacity:
+                        while capacity < length:
+                            capacity *= 2
+                        grown = np.zeros(counts.shape[:2] + (capacity,), dtype=np.int64)
+                        grown[:, :, :counts.shape[2]] = counts
+                        counts = grown
+                    # (行, 计数器, 桶) 展平后用bincount累加
+                    flat = (row * ncounters + code) * capacity + bucket
+                    rcvd = code == flow_table.RCVD
+                    flat_bytes = (row[rcvd] * ncounters + flow_table.TOTAL_BYTES) * capacity + bucket[rcvd]
+                    counts += np.bincount(flat, minlength=counts.size).reshape(counts.shape)
+                    counts += np.bincount(flat_bytes, weights=packets['size'][keep][rcvd],
+                                          minlength=counts.size).astype(np.int64).reshape(counts.shape)
+
+                for var, nodes in series.items():
+                    hit = tracevars['var'] == var.encode()
+                    for node in np.unique(tracevars['src'][hit]).tolist():
+                        sel = hit & (tracevars['src'] == node)
+                        if node not in nodes:
+                            nodes[node] = BucketSeries(resolution, dtype=float)
+                        nodes[node].assign(tracevars['time'][sel], tracevars['value'][sel])
+
+        # 流按标识排序, 与 FlowTable 自动发现流时的输出顺序一致
+        flow_ids = sorted(rows)
+        order = [rows[flow_id] for flow_id in flow_ids]
+        length = max([length] + [s.length for nodes in series.values() for s in nodes.values()])
+        cum = np.zeros((len(flow_ids), ncounters, length + 1), dtype=np.int64)
+        counted = min(length, counts.shape[2])
+        np.cumsum(counts[order, :, :counted], axis=2, out=cum[:, :, 1:counted + 1])
+        # tracevar比最后一个包事件更晚时, 之后的累计值不变
+        cum[:, :, counted + 1:] = cum[:, :, counted:counted + 1]
+
+        var_nodes = sorted({node for nodes in series.values() for node in nodes})
+        checkpoints = {}
+        for var, nodes in series.items():
+            values = np.full((len(var_nodes), length), np.nan)
+            for i, node in enumerate(var_nodes):
+                if node in nodes:
+                    values[i] = nodes[node].forward_filled(np.nan, length)
+            checkpoints[var] = values
+        return cls(resolution, flow_ids, cum, var_nodes, checkpoints, meta)
+
+    def save(self, path):
+        """写入 .npz 文件 (先写临时文件再替换)"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        arrays = {'var_' + var: values for var, values in self.checkpoints.items()}
+        np.savez(tmp_path, meta=np.array(json.dumps(self.meta)), flow_ids=self.flow_ids,
+                 cum=self.cum, var_nodes=self.var_nodes, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """读取 save() 写入的索引"""
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            checkpoints = {var: data['var_' + var] for var in CHECKPOINT_VARS}
+            return cls(meta['resolution'], data['flow_ids'], data['cum'], data['var_nodes'],
+                       checkpoints, meta)
+
+    # ---- 查询 ----
+
+    def edge(self, t):
+        """时间t对应的边界下标 (按粒度取最近的边界, 截断到索引范围内)"""
+        return min(max(int(round(t / self.resolution)), 0), self.buckets)
+
+    def _rows(self, flows):
+        """流标识列表 -> 行号数组, 索引中没有的流为-1"""
+        if flows is None:
+            return np.arange(len(self.flow_ids))
+        flows = np.asarray(list(flows), dtype=np.int64)
+        if len(self.flow_ids) == 0:
+            return np.full(len(flows), -1, dtype=np.int64)
+        pos = np.searchsorted(self.flow_ids, flows)
+        found = (pos < len(self.flow_ids)) & (self.flow_ids[np.minimum(pos, len(self.flow_ids) - 1)] == flows)
+        return np.where(found, pos, -1)
+
+    def totals(self, start, end, flows=None):
+        """
+        每条流在 [start, end) 内的计数器, 形状为 (流数, 计数器数)
+
+        参数:
+            flows: 流标识列表, 默认索引中的所有流; 没有出现过的流计数为0
+        """
+        lo, hi = self.edge(start), self.edge(end if end is not None else self.duration)
+        rows = self._rows(flows)
+        totals = np.zeros((len(rows), self.cum.shape[1]), dtype=np.int64)
+        found = rows >= 0
+        if hi > lo:
+            totals[found] = self.cum[rows[found], :, hi] - self.cum[rows[found], :, lo]
+        return totals
+
+    def goodput(self, start, end, flows=None):
+        """每条流在 [start, end) 内的平均吞吐量 (Mbps)"""
+        lo, hi = self.edge(start), self.edge(end)
+        total_bytes = self.totals(start, end, flows)[:, flow_table.TOTAL_BYTES]
+        if hi <= lo:
+            return np.zeros(len(total_bytes))
+        return total_bytes * 8 / ((hi - lo) * self.resolution * 1e6)
+
+    def plr(self, start, end, flows=None):
+        """[start, end) 内的包丢失率 (%)"""
+        totals = self.totals(start, end, flows).sum(axis=0)
+        sent = totals[flow_table.SENT]
+        return totals[flow_table.DROPPED] / sent * 100 if sent > 0 else 0
+
+    def throughput(self, start, end, width=1.0, flows=None):
+        """
+        [start, end) 内每 width 秒的吞吐量时间序列
+
+        返回:
+            (times, rates): 每个样本的开始时间, 每条流一行的吞吐量 (Mbps)
+        """
+        step = max(1, int(round(width / self.resolution)))
+        lo, hi = self.edge(start), self.edge(end)
+        edges = np.arange(lo, hi + 1, step)
+        rows = self._rows(flows)
+        rates = np.zeros((len(rows), max(len(edges) - 1, 0)))
+        found = rows >= 0
+        if len(edges) > 1:
+            cum_bytes = self.cum[rows[found]][:, flow_table.TOTAL_BYTES, edges]
+            rates[found] = np.diff(cum_bytes, axis=1) * 8 / (step * self.resolution * 1e6)
+        return edges[:-1] * self.resolution, rates
+
+    def fairness(self, start, end, flows=None):
+        """[start, end) 内各流平均吞吐量的Jain公平性指数"""
+        x = self.goodput(start, end, flows)
+        sum_x2 = float(np.sum(x ** 2))
+        if len(x) == 0 or sum_x2 <= 0:
+            return 0
+        return float(np.sum(x)) ** 2 / (len(x) * sum_x2)
+
+    def cov(self, start, end, width=1.0, flows=None):
+        """[start, end) 内所有流每 width 秒吞吐量样本的变异系数"""
+        _, rates = self.throughput(start, end, width, flows)
+        if rates.size == 0 or np.mean(rates) <= 0:
+            return float('inf')
+        return float(np.std(rates) / np.mean(rates))
+
+    def checkpoint(self, var, node, t):
+        """源节点node的tracevar (例如 'cwnd_') 在时间t所在桶结束时的值, 没有采样时为NaN"""
+        values = self.checkpoints[var]
+        pos = int(np.searchsorted(self.var_nodes, node))
+        if pos >= len(self.var_nodes) or self.var_nodes[pos] != node or values.shape[1] == 0:
+            return float('nan')
+        bucket = min(max(int(np.floor(t / self.resolution)), 0), values.shape[1] - 1)
+        return float(values[pos, bucket])
+
+    def cwnd_at(self, node, t):
+        return self.checkpoint('cwnd_', node, t)
+
+    def rtt_at(self, node, t):
+        return self.checkpoint('rtt_', node, t)
+
+
+def load_or_build(trace_file, resolution=DEFAULT_RESOLUTION, flow_key='src', link_filter=None,
+                  save=True):
+    """
+    读取trace文件的索引, 不存在或已失效时重新构建
+
+    参数:
+        save: 构建后是否写入索引文件 (写入失败时忽略)
+    """
+    path = index_path_for(trace_file)
+    info = _source_info(trace_file, resolution, flow_key, link_filter)
+    try:
+        index = TraceIndex.load(path)
+        if index.meta == info:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+
+    index = TraceIndex.build(trace_file, resolution, flow_key, link_filter)
+    if save:
+        try:
+            index.save(path)
+        except OSError:
+            # 索引只是加速手段, 写入失败 (只读目录等) 不影响查询
+            pass
+    return index
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+trace_io.py - 透明读取压缩的trace文件
+
+按文件开头的魔数识别压缩格式, 与扩展名无关:
+
+    gzip  1f 8b           (标准库)
+    zstd  28 b5 2f fd     (需要 zstandard 包)
+    lz4   04 22 4d 18     (需要 lz4 包)
+
+open_trace() 返回流式解压的文件对象, 解析器按块读取, 不会把整个文件
+解压到内存或磁盘。未压缩的文件按原样打开。
+
+也提供把数据流式压缩到文件的写入端, 供 sim_runner 把ns的trace输出
+直接送进压缩器。
+"""
+
+import gzip
+import io
+import os
+
+# 压缩格式 -> (魔数, 扩展名)
+FORMATS = {
+    'gzip': (b'\x1f\x8b', '.gz'),
+    'zstd': (b'\x28\xb5\x2f\xfd', '.zst'),
+    'lz4': (b'\x04\x22\x4d\x18', '.lz4'),
+}
+
+
+def detect_compression(path):
+    """返回文件的压缩格式名, 未压缩时返回None"""
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    for name, (magic, _) in FORMATS.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def _require(module, fmt):
+    try:
+        return __import__(module, fromlist=['_'])
+    except ImportError:
+        raise ImportError(f"读取/写入 {fmt} 压缩的trace需要安装 {module.split('.')[0]} 包") from None
+
+
+def _open_raw(path, fmt):
+    """返回解压后的二进制流"""
+    if fmt is None:
+        return open(path, 'rb')
+    if fmt == 'gzip':
+        return gzip.open(path, 'rb')
+    if fmt == 'zstd':
+        zstandard = _require('zstandard', fmt)
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+    if fmt == 'lz4':
+        return _require('lz4.frame', fmt).open(path, 'rb')
+    raise ValueError(f"未知的压缩格式: {fmt}")
+
+
+def open_trace(path, mode='rb', encoding=None):
+    """
+    打开 (可能被压缩的) trace文件
+
+    参数:
+        path: 文件路径
+        mode: 'rb' 二进制, 'r' 文本
+        encoding: 文本模式的编码
+    """
+    if mode not in ('r', 'rb'):
+        raise ValueError(f"只支持读取: {mode}")
+    raw = _open_raw(path, detect_compression(path))
+    if mode == 'rb':
+        return raw
+    return io.TextIOWrapper(raw, encoding=encoding)
+
+
+def is_compressed(path):
+    return detect_compression(path) is not None
+
+
+def strip_compression_suffix(path):
+    """renoTrace.tr.gz -> renoTrace.tr"""
+    for _, ext in FORMATS.values():
+        if path.endswith(ext):
+            return path[:-len(ext)]
+    return path
+
+
+def resolve_trace(path):
+    """
+    返回实际存在的trace文件路径
+
+    path 不存在时依次尝试 path.gz / path.zst / path.lz4 (压缩归档的trace),
+    都不存在时原样返回
+    """
+    if os.path.exists(path):
+        return path
+    for _, ext in FORMATS.values():
+        if os.path.exists(path + ext):
+            return path + ext
+    return path
+
+
+def check_available(fmt):
+    """检查压缩格式所需的包是否已安装, 未安装时抛出ImportError"""
+    if fmt == 'zstd':
+        _require('zstandard', fmt)
+    elif fmt == 'lz4':
+        _require('lz4.frame', fmt)
+    elif fmt not in FORMATS:
+        raise ValueError(f"未知的压缩格式: {fmt}")
+
+
+def open_compressed_writer(path, fmt):
+    """返回把写入的数据压缩后写到path的二进制文件对象"""
+    if fmt == 'gzip':
+        # 速度优先: trace压缩率本来就很高
+        return gzip.open(path, 'wb', compresslevel=1)
+    if fmt == 'zstd':
+        zstandard = _require('zstandard', fmt)
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'), closefd=True)
+    if fmt == 'lz4':
+        return _require('lz4.frame', fmt).open(path, 'wb')
+    raise ValueError(f"未知的压缩格式: {fmt}")
+
+
+def count_lines(path, block_size=8 * 1024 * 1024):
+    """按块统计 (可能被压缩的) 文件的行数"""
+    lines = 0
+    last = b'\n'
+    with open_trace(path) as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            lines += block.count(b'\n')
+            last = block[-1:]
+    # 最后一行没有换行符时也算一行, 与 sum(1 for _ in open(path)) 一致
+    return lines + (last != b'\n')
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+trace_layout.py - 精简trace模式的文件布局
+
+scenario.py 的精简模式 (lean=True) 不写NAM文件, 也不用 trace-all,
+而是只在端到端计数需要的链路上 trace-queue, 并把 tracevar 输出写到
+单独的小文件。一次仿真得到:
+
+    renoTrace.tr         选定链路上的包事件
+    renoTrace_vars.tr    cwnd_/ack_/rtt_ 等tracevar行
+    renoTrace.tr.links   记录了哪些链路, LinkFilter.parse 格式
+
+分析器读取trace时用这里的函数找到另外两个文件:
+- analyser3.TCPAnalyzer 没有指定链路过滤器时使用 .links 中的过滤器,
+  结果与在完整trace上使用同一个过滤器完全一致
+- analyser.extractMetrics 同时读取 _vars.tr 中的tracevar行
+完整trace (trace-all) 没有这两个文件, 行为不变。
+
+检测稳态并提前结束的仿真 (见 steady_state.py) 还有一个JSON文件:
+
+    renoTrace.tr.steady  预热期边界 (warmup)、trace的结束时间 (end)、是否稳定等
+
+TCPAnalyzer 用其中的 warmup 代替公平性和CoV的固定 start_fraction=2/3,
+用 end 代替吞吐量计算中100秒的仿真时长。
+"""
+
+import json
+import os
+
+import trace_io
+from link_filter import LinkFilter
+
+LINKS_SUFFIX = '.links'
+VARS_SUFFIX = '_vars'
+STEADY_SUFFIX = '.steady'
+
+
+def links_file_for(trace_file):
+    """返回记录链路过滤器的文件路径 (压缩的trace使用压缩前的文件名)"""
+    return trace_io.strip_compression_suffix(trace_file) + LINKS_SUFFIX
+
+
+def vars_file_for(trace_file):
+    """返回tracevar文件路径: xxxTrace.tr -> xxxTrace_vars.tr"""
+    base, ext = os.path.splitext(trace_io.strip_compression_suffix(trace_file))
+    return base + VARS_SUFFIX + ext
+
+
+def is_lean(trace_file):
+    """trace是否由精简模式生成"""
+    return os.path.exists(links_file_for(trace_file))
+
+
+def link_filter_for(trace_file):
+    """精简trace返回生成时使用的 LinkFilter, 完整trace返回None"""
+    try:
+        with open(links_file_for(trace_file), 'r') as f:
+            spec = f.read().strip()
+    except OSError:
+        return None
+    return LinkFilter.parse(spec) if spec else None
+
+
+def metric_files_for(trace_file):
+    """返回包含 cwnd/ack/rtt/丢包 指标的所有文件 (trace本身, 以及存在时的tracevar文件)"""
+    files = [trace_file]
+    vars_file = trace_io.resolve_trace(vars_file_for(trace_file))
+    if os.path.exists(vars_file):
+        files.append(vars_file)
+    return files
+
+
+def steady_file_for(trace_file):
+    """返回记录稳态检测结果的文件路径"""
+    return trace_io.strip_compression_suffix(trace_file) + STEADY_SUFFIX
+
+
+def read_steady(trace_file):
+    """返回稳态检测结果字典, 没有 (或无法读取) 时返回None"""
+    try:
+        with open(steady_file_for(trace_file), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_steady(trace_file, info):
+    """写入稳态检测结果 (JSON可序列化的字典)"""
+    with open(steady_file_for(trace_file), 'w') as f:
+        json.dump(info, f, indent=2, sort_keys=True)
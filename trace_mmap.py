@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+trace_mmap.py - 基于mmap的零拷贝trace读取器
+
+把trace文件映射到内存, 按换行对齐的大块处理。每块直接在映射的字节上
+用NumPy向量化地找出换行和空格的位置、切出字段并转换为数值,
+不为每一行创建 str / bytes / list 对象, 内存只与块大小成正比,
+几GB的trace也不会把内存撑爆。
+
+两类行分别得到两组列:
+- 包事件行 (12列): 与 trace_reader.TRACE_COLUMNS 相同的列字典
+- tracevar行 (7列, 以数字开头): TRACEVAR_COLUMNS
+      time srcnode srcport dstnode dstport var value
+      0.10000 0 0 4 0 cwnd_ 1.000
+
+格式不规则的行 (多余的空白、超长的字段、指数形式的数字等) 交给与
+trace_reader 相同的逐行转换, 结果与 trace_reader.parse_lines 完全一致。
+
+压缩的trace不能映射; iter_trace_blocks / read_trace_columns 对压缩的trace
+回退到 trace_reader 的流式解压。
+
+用法:
+    with MappedTrace('cubicTrace.tr') as trace:
+        for cols in trace.iter_packet_blocks():   # NumPy列, 每块一个字典
+            ...
+        for rec in trace.records():               # 逐条的类型化记录
+            if rec.event == b'd':
+                ...
+"""
+
+import mmap
+import os
+from collections import namedtuple
+
+import numpy as np
+
+import trace_io
+import trace_reader
+
+# 每块的字节数 (按完整行切分)
+DEFAULT_BLOCK_SIZE = 32 * 1024 * 1024
+
+# tracevar行的列
+TRACEVAR_COLUMNS = {
+    'time': np.float64,
+    'src': np.int32,
+    'src_port': np.int32,
+    'dst': np.int32,
+    'dst_port': np.int32,
+    'var': 'S12',
+    'value': np.float64,
+}
+
+# 包事件行的类型化记录
+TraceRecord = namedtuple('TraceRecord', list(trace_reader.TRACE_COLUMNS))
+
+_NL, _CR, _SPACE, _TAB, _DOT, _MINUS, _ZERO = 10, 13, 32, 9, 46, 45, 48
+
+# 整数/小数的最大位数: 保证拼成的整数小于 2**53, 除以10的幂只有一次舍入,
+# 与 float() 的结果完全一致
+_MAX_DIGITS = 15
+
+# 数值解析每片的行数
+_PARSE_SLICE = 16 * 1024
+
+
+def empty_tracevar_columns():
+    return {name: np.empty(0, dtype=dtype) for name, dtype in TRACEVAR_COLUMNS.items()}
+
+
+def _parse_numbers(buf, starts, ends, integer=False):
+    """
+    把字段 buf[starts:ends] 解析为数值
+
+    支持可选的负号和最多一个小数点 (integer=True 时不允许小数点)。
+    逐个字符位置做一维向量运算, 返回 (值, 是否成功解析);
+    不能解析的字段 (空字段、指数形式、位数过多等) 交给逐行转换。
+    """
+    values = np.empty(len(starts), dtype=np.int64 if integer else np.float64)
+    ok = np.empty(len(starts), dtype=bool)
+    # 分片处理, 让临时数组留在CPU缓存中
+    for lo in range(0, len(starts), _PARSE_SLICE):
+        hi = lo + _PARSE_SLICE
+        values[lo:hi], ok[lo:hi] = _parse_slice(buf, starts[lo:hi], ends[lo:hi], integer)
+    return values, ok
+
+
+def _parse_slice(buf, starts, ends, integer):
+    negative = np.take(buf, starts, mode='clip') == _MINUS
+    starts = starts + negative
+    lengths = ends - starts
+    ok = (lengths >= 1) & (lengths <= _MAX_DIGITS + 1)
+    width = min(int(lengths.max()), _MAX_DIGITS + 1) if len(lengths) else 0
+
+    mantissa = np.zeros(len(starts), dtype=np.int64)
+    ndigits = np.zeros(len(starts), dtype=np.int8)
+    decimals = np.zeros(len(starts), dtype=np.int8)
+    dots = np.zeros(len(starts), dtype=np.int8)
+    for j in range(width):
+        digits = np.take(buf, starts + j, mode='clip') - np.uint8(_ZERO)  # 非数字字符回绕为大数
+        inside = lengths > j
+        is_digit = (digits <= 9) & inside
+        np.multiply(mantissa, 10, out=mantissa, where=is_digit)
+        np.add(mantissa, digits, out=mantissa, where=is_digit)
+        ndigits += is_digit
+        if not integer:
+            decimals += is_digit & (dots > 0)
+        dots += (digits == np.uint8((_DOT - _ZERO) % 256)) & inside
+
+    ok &= (dots <= (0 if integer else 1)) & (ndigits + dots == lengths)
+    ok &= (ndigits >= 1) & (ndigits <= _MAX_DIGITS)
+    if integer:
+        return np.where(negative, -mantissa, mantissa), ok
+    values = mantissa / (10.0 ** decimals)
+    return np.where(negative, -values, values), ok
+
+
+def _parse_strings(buf, starts, ends, width):
+    """把字段转换为定长字节串, 返回 (值, 是否没有被截断)"""
+    lengths = ends - starts
+    chars = np.take(buf, starts[:, None] + np.arange(width), mode='clip')
+    chars[np.arange(width) >= lengths[:, None]] = 0
+    values = np.ascontiguousarray(chars).view(f'S{width}').ravel()
+    return values, (lengths >= 1) & (lengths <= width)
+
+
+def _line_bounds(buf):
+    """返回每行内容的 [start, end) (不含换行和行尾的\\r)"""
+    ends = np.flatnonzero(buf == _NL)
+    if len(buf) and buf[-1] != _NL:
+        ends = np.append(ends, len(buf))
+    starts = np.empty_like(ends)
+    if len(ends):
+        starts[0] = 0
+        starts[1:] = ends[:-1] + 1
+    has_cr = (ends > starts) & (buf[np.maximum(ends - 1, 0)] == _CR)
+    ends = ends - has_cr
+    return starts, ends
+
+
+def _select_lines(buf, starts, ends, digit_first):
+    """选出非空且 (不) 以数字开头的行"""
+    first = buf[np.minimum(starts, max(len(buf) - 1, 0))]
+    is_digit = (first >= _ZERO) & (first <= _ZERO + 9)
+    return np.flatnonzero((ends > starts) & (is_digit == digit_first))
+
+
+class _Fields:
+    """恰好以单个空格分隔为nfields个字段的行, 以及各字段的边界"""
+
+    def __init__(self, buf, starts, ends, nfields):
+        """
+        参数:
+            starts, ends: 候选行的边界 (升序)
+        """
+        spaces = np.flatnonzero(buf == _SPACE)
+        first = np.searchsorted(spaces, starts)
+        counts = np.searchsorted(spaces, ends) - first
+
+        # 含有其他空白字符 (制表符等) 的行按 split() 的规则逐行处理;
+        # 连续空格或行首/行尾空格会产生空字段, 在字段转换时被识别
+        irregular = np.zeros(len(starts), dtype=bool)
+        other = np.flatnonzero(((buf - np.uint8(_TAB)) <= _CR - _TAB) & (buf != _NL))
+        if len(other):
+            line = np.searchsorted(ends, other)
+            inside = line < len(starts)
+            inside[inside] &= starts[line[inside]] <= other[inside]
+            irregular[line[inside]] = True
+
+        #: 规则行在候选行中的下标
+        self.rows = np.flatnonzero((counts == nfields - 1) & ~irregular)
+        # 每个空格序号一行, 取出一个字段的边界是连续的内存
+        self._spaces = spaces[first[self.rows] + np.arange(nfields - 1)[:, None]]
+        self._starts = starts[self.rows]
+        self._ends = ends[self.rows]
+        self.nfields = nfields
+
+    def bounds(self, k):
+        """第k个字段的 (起点数组, 终点数组)"""
+        start = self._starts if k == 0 else self._spaces[k - 1] + 1
+        end = self._ends if k == self.nfields - 1 else self._spaces[k]
+        return start, end
+
+
+# 包事件行: 列名 -> 字段的解析方式 ('f' 小数, 'i' 整数, 'S<n>' 字节串, '-' 不转换)
+_PACKET_FIELDS = (
+    ('event', 'S1'), ('time', 'f'), ('from_node', 'i'), ('to_node', 'i'),
+    ('type', 'S8'), ('size', 'i'), ('flags', '-'), ('fid', 'i'),
+    ('src', 'f'), ('dst', 'f'), ('seq', 'i'), ('uid', 'i'),
+)
+
+# tracevar行
+_TRACEVAR_FIELDS = (
+    ('time', 'f'), ('src', 'i'), ('src_port', 'i'), ('dst', 'i'),
+    ('dst_port', 'i'), ('var', 'S12'), ('value', 'f'),
+)
+_TRACEVAR_DTYPE = np.dtype(list(TRACEVAR_COLUMNS.items()))
+
+
+def _tracevar_row(parts):
+    if len(parts) != 7:
+        return None
+    try:
+        return (float(parts[0]), int(parts[1]), int(parts[2]), int(parts[3]),
+                int(parts[4]), parts[5], float(parts[6]))
+    except ValueError:
+        return None
+
+
+def _packet_row(parts):
+    return trace_reader._row_from_parts(parts) if len(parts) >= 12 else None
+
+
+def _parse_records(buf, starts, ends, fields, dtype, slow_row):
+    """
+    把一批行解析为 列名 -> 数组 的字典
+
+    规则的行 (字段数正确、每个字段都能直接转换) 在映射的字节上向量化转换;
+    其余的行切成bytes后由 slow_row(parts) 逐行转换为 dtype 记录,
+    返回None的行被丢弃。结果保持行在文件中的顺序。
+    """
+    layout = _Fields(buf, starts, ends, len(fields))
+    fast = {}
+    ok = np.ones(len(layout.rows), dtype=bool)
+    for k, (name, kind) in enumerate(fields):
+        field_starts, field_ends = layout.bounds(k)
+        if kind == '-':
+            ok &= field_ends > field_starts
+            continue
+        if kind.startswith('S'):
+            values, good = _parse_strings(buf, field_starts, field_ends, int(kind[1:]))
+        else:
+            values, good = _parse_numbers(buf, field_starts, field_ends, integer=kind == 'i')
+        fast[name] = values.astype(dtype[name], copy=False)
+        ok &= good
+    if not ok.all():
+        fast = {name: values[ok] for name, values in fast.items()}
+
+    # 快速路径无法处理的行逐行转换 (只有这些行会生成bytes对象)
+    regular = np.zeros(len(starts), dtype=bool)
+    regular[layout.rows[ok]] = True
+    slow_lines = []
+    slow_rows = []
+    for i in np.flatnonzero(~regular):
+        row = slow_row(bytes(buf[starts[i]:ends[i]]).split())
+        if row is not None:
+            slow_lines.append(i)
+            slow_rows.append(row)
+    if not slow_rows:
+        return fast
+
+    slow = np.array(slow_rows, dtype=dtype)
+    order = np.argsort(np.concatenate([layout.rows[ok], np.array(slow_lines, dtype=np.int64)]),
+                       kind='stable')
+    return {name: np.concatenate([values, slow[name]])[order] for name, values in fast.items()}
+
+
+def parse_packet_lines(buf, starts=None, ends=None):
+    """
+    把一块字节 (完整的行) 中的包事件行解析为 trace_reader 格式的列字典
+
+    参数:
+        buf: uint8 数组 (通常是mmap的视图)
+        starts, ends: 行边界 (默认由 _line_bounds 计算)
+    """
+    if starts is None:
+        starts, ends = _line_bounds(buf)
+    # tracevar行以数字开头 (与 trace_reader 的粗筛一致)
+    lines = _select_lines(buf, starts, ends, digit_first=False)
+    rows = _parse_records(buf, starts[lines], ends[lines], _PACKET_FIELDS,
+                          trace_reader._ROW_DTYPE, _packet_row)
+    return trace_reader.columns_from_rows(rows)
+
+
+def parse_tracevar_lines(buf, starts=None, ends=None):
+    """把一块字节中的tracevar行 (以数字开头的7列行) 解析为 TRACEVAR_COLUMNS 列字典"""
+    if starts is None:
+        starts, ends = _line_bounds(buf)
+    lines = _select_lines(buf, starts, ends, digit_first=True)
+    rows = _parse_records(buf, starts[lines], ends[lines], _TRACEVAR_FIELDS,
+                          _TRACEVAR_DTYPE, _tracevar_row)
+    return rows
+
+
+class MappedTrace:
+    """以内存映射方式打开的trace文件"""
+
+    def __init__(self, trace_file, block_size=DEFAULT_BLOCK_SIZE):
+        """
+        参数:
+            trace_file: trace文件路径 (不能是压缩的)
+            block_size: 每块大约处理的字节数
+        """
+        if trace_io.is_compressed(trace_file):
+            raise ValueError(f"压缩的trace不能映射, 请使用 trace_reader: {trace_file}")
+        self.trace_file = trace_file
+        self.block_size = block_size
+        self._file = open(trace_file, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        # 空文件不能映射
+        self._mmap = (mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                      if self.size else None)
+
+    def close(self):
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # 仍有视图引用映射 (例如异常的traceback), 交给垃圾回收关闭
+                pass
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def block_ranges(self, start=0, end=None, block_size=None):
+        """
+        把 [start, end) 切成以换行结尾的块, 产出 (块起点, 块终点)
+
+        start 和 end 应当是行首 (0、文件末尾或某个换行之后的位置)
+        block_size 默认为 self.block_size
+        """
+        end = self.size if end is None else end
+        block_size = block_size or self.block_size
+        while start < end:
+            stop = min(start + block_size, end)
+            if stop < end:
+                newline = self._mmap.find(b'\n', stop - 1, end)
+                stop = end if newline < 0 else newline + 1
+            yield start, stop
+            start = stop
+
+    def split(self, parts):
+        """把文件切成大约parts段以换行结尾的 (起点, 终点), 供并行解析使用"""
+        return list(self.block_ranges(block_size=max(1, -(-self.size // max(1, parts)))))
+
+    def buffer(self, start=0, end=None):
+        """返回 [start, end) 的零拷贝 uint8 视图"""
+        end = self.size if end is None else end
+        if self._mmap is None or end <= start:
+            return np.empty(0, dtype=np.uint8)
+        return np.frombuffer(self._mmap, dtype=np.uint8, count=end - start, offset=start)
+
+    def iter_blocks(self, start=0, end=None):
+        """每块产出 (包事件列字典, tracevar列字典)"""
+        for block_start, block_end in self.block_ranges(start, end):
+            buf = self.buffer(block_start, block_end)
+            starts, ends = _line_bounds(buf)
+            yield parse_packet_lines(buf, starts, ends), parse_tracevar_lines(buf, starts, ends)
+
+    def iter_packet_blocks(self, start=0, end=None):
+        """每块产出一个包事件列字典 (与 trace_reader.iter_trace_blocks 相同的格式)"""
+        for block_start, block_end in self.block_ranges(start, end):
+            yield parse_packet_lines(self.buffer(block_start, block_end))
+
+    def packet_columns(self):
+        """整个文件的包事件列字典"""
+        return trace_reader.concat_columns(self.iter_packet_blocks())
+
+    def records(self):
+        """逐条产出包事件的 TraceRecord (字段已转换为Python数值, 事件和类型为bytes)"""
+        for cols in self.iter_packet_blocks():
+            yield from map(TraceRecord._make, zip(*(cols[name].tolist()
+                                                    for name in trace_reader.TRACE_COLUMNS)))
+
+
+def iter_trace_blocks(trace_file, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    与 trace_reader.iter_trace_blocks 相同的接口, 使用mmap读取
+
+    压缩的trace不能映射, 回退到 trace_reader 的流式解压
+    """
+    if trace_io.is_compressed(trace_file):
+        yield from trace_reader.iter_trace_blocks(trace_file, block_size)
+        return
+    with MappedTrace(trace_file, block_size) as trace:
+        yield from trace.iter_packet_blocks()
+
+
+def iter_blocks(trace_file, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    每块产出 (包事件列字典, tracevar列字典)
+
+    压缩的trace流式解压, 按完整行切块后同样在字节上解析
+    """
+    if not trace_io.is_compressed(trace_file):
+        with MappedTrace(trace_file, block_size) as trace:
+            yield from trace.iter_blocks()
+        return
+    with trace_io.open_trace(trace_file, 'rb') as f:
+        tail = b''
+        while True:
+            chunk = f.read(block_size)
+            data = tail + chunk
+            cut = data.rfind(b'\n') + 1 if chunk else len(data)
+            tail = data[cut:]
+            if cut:
+                buf = np.frombuffer(data, dtype=np.uint8, count=cut)
+                starts, ends = _line_bounds(buf)
+                yield parse_packet_lines(buf, starts, ends), parse_tracevar_lines(buf, starts, ends)
+            if not chunk:
+                return
+
+
+def split_ranges(trace_file, parts):
+    """把未压缩的trace文件切成大约parts段以换行结尾的字节范围"""
+    with MappedTrace(trace_file) as trace:
+        return trace.split(parts)
+
+
+def read_trace_columns(trace_file, block_size=DEFAULT_BLOCK_SIZE):
+    """读取整个trace文件为列字典"""
+    return trace_reader.concat_columns(iter_trace_blocks(trace_file, block_size))
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+trace_reader.py - NS2 trace文件列式读取器
+
+按大块读取trace文件, 把包事件行转换为NumPy类型列,
+供 analyser3.TCPAnalyzer 的 numpy 解析引擎使用。
+
+包事件行格式 (trace-all, 12列):
+    event time from to type size flags fid src dst seq uid
+例如:
+    r 1.234567 2 3 tcp 1040 ------- 1 0.0 4.0 12 345
+tracevar行 (cwnd_/ack_/rtt_ 等) 少于12列, 读取时会被跳过。
+"""
+
+import numpy as np
+
+import trace_io
+
+# 每次读取的字节数 (按完整行切分)
+DEFAULT_BLOCK_SIZE = 32 * 1024 * 1024
+
+# 列名 -> dtype
+TRACE_COLUMNS = {
+    'event': 'S1',
+    'time': np.float64,
+    'from_node': np.int32,
+    'to_node': np.int32,
+    'type': 'S8',
+    'size': np.int64,
+    'fid': np.int32,
+    'src': np.int32,
+    'dst': np.int32,
+    'seq': np.int64,
+    'uid': np.int64,
+}
+
+
+def empty_columns():
+    """返回没有任何行的列字典"""
+    return {name: np.empty(0, dtype=dtype) for name, dtype in TRACE_COLUMNS.items()}
+
+
+# np.loadtxt 使用的行记录类型 (flags列读入后丢弃, 地址列先按浮点读入)
+_ROW_DTYPE = np.dtype([
+    ('event', 'S1'), ('time', np.float64), ('from_node', np.int32),
+    ('to_node', np.int32), ('type', 'S8'), ('size', np.int64),
+    ('flags', 'S8'), ('fid', np.int32), ('src', np.float64),
+    ('dst', np.float64), ('seq', np.int64), ('uid', np.int64),
+])
+
+
+def _load_rows(lines):
+    """
+    把一批行解析为 _ROW_DTYPE 记录数组
+
+    与 parts = line.split(); len(parts) < 12 的逐行逻辑一致:
+    少于12列的行被丢弃, 多于12列的行取前6列和后6列。
+    """
+    # tracevar行以数字开头, 先粗筛掉
+    candidates = [line for line in lines if not line[:1].isdigit()]
+    if not candidates:
+        return np.empty(0, dtype=_ROW_DTYPE)
+
+    try:
+        # 快速路径: 每行正好12列, 由numpy的C解析器完成
+        return np.loadtxt(candidates, dtype=_ROW_DTYPE, comments=None,
+                          encoding='latin-1', ndmin=1)
+    except ValueError:
+        pass
+
+    # 慢速路径: 存在列数不规则的行, 逐行转换
+    rows = [_row_from_parts(parts) for parts in (line.split() for line in candidates)
+            if len(parts) >= 12]
+    return np.array(rows, dtype=_ROW_DTYPE)
+
+
+def _to_number(token, kind):
+    """转换非关键列, 无法解析时记为-1"""
+    try:
+        return kind(token)
+    except ValueError:
+        return -1
+
+
+def _row_from_parts(parts):
+    """按逐行解析的取列方式 (前6列, 倒数第4列为源地址) 构造一条记录"""
+    return (parts[0], float(parts[1]), _to_number(parts[2], int),
+            _to_number(parts[3], int), parts[4], int(parts[5]), parts[-6],
+            _to_number(parts[-5], int), _to_number(parts[-4], float),
+            _to_number(parts[-3], float), _to_number(parts[-2], int),
+            _to_number(parts[-1], int))
+
+
+def parse_lines(lines):
+    """
+    把一批bytes行解析为列字典
+
+    参数:
+        lines: bytes行列表 (可带换行符)
+    """
+    return columns_from_rows(_load_rows(lines))
+
+
+def columns_from_rows(rows):
+    """把 _ROW_DTYPE 记录数组 (或同样列名的数组字典) 转换为列字典"""
+    cols = {name: np.ascontiguousarray(rows[name], dtype=dtype)
+            for name, dtype in TRACE_COLUMNS.items() if name not in ('src', 'dst')}
+    # 'node.port' 地址只保留节点号
+    cols['src'] = rows['src'].astype(np.int32)
+    cols['dst'] = rows['dst'].astype(np.int32)
+    return cols
+
+
+def iter_trace_blocks(trace_file, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    按块迭代trace文件, 每块产出一个列字典
+
+    参数:
+        trace_file: trace文件路径 (可以是gzip/zstd/lz4压缩的, 流式解压)
+        block_size: 每块大约读取的字节数 (解压后)
+    """
+    with trace_io.open_trace(trace_file) as f:
+        while True:
+            lines = f.readlines(block_size)
+            if not lines:
+                break
+            yield parse_lines(lines)
+
+
+def concat_columns(blocks):
+    """把多个列字典首尾拼接成一个"""
+    blocks = list(blocks)
+    if not blocks:
+        return empty_columns()
+    return {name: np.concatenate([b[name] for b in blocks]) for name in TRACE_COLUMNS}
+
+
+def read_trace_columns(trace_file, block_size=DEFAULT_BLOCK_SIZE):
+    """读取整个trace文件为列字典"""
+    return concat_columns(iter_trace_blocks(trace_file, block_size))
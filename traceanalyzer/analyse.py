@@ -1,12 +1,18 @@
-import  traceanalyzer as tr
+import os
+import sys
+
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import delay
+
 #end-to-end delay
-eedelay1=tr.Eedelay('out1.tr','33')
-eedelay2=tr.Eedelay('out2.tr','33')
-eedelay2.sample()#eedelay2.sample(1.5) for sampling with step=1.5
-eedelay1.plot()
-eedelay2.plot()
+delays = delay.delays_of_traces({'out1': 'out1.tr', 'out2': 'out2.tr'}, node=33)
+eedelay2 = delays['out2']
+for name, eedelay in delays.items():
+    eedelay.sample()#eedelay.sample(1.5) for sampling with step=1.5
+    plt.plot(eedelay.time_sample, eedelay.eedelay_sample, label=name)
+plt.legend()
 plt.show()
 #getting data
 time=eedelay2.time_sample